@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Benchmarks of pyIOSXR against the fake XML agent in test/fake_agent.py.
+
+Usage: python benchmarks/bench.py [--latency SEC] [--size BYTES] [--iterations N] [--transport NAME] [--json]
+                                  [BENCHMARK ...]
+
+No device is needed: an ssh stand-in starting the fake agent is put in front of the PATH, so the benchmarks
+run through the same pexpect code as a real session. With --transport tcp the fake agent listens on a local
+port instead and the sessions connect to it directly. Each benchmark reports operations per second, latency
+percentiles and the peak memory (maximum resident set size). Every benchmark runs in a process of its own, so
+the peak memory is that of the benchmark alone rather than of the heaviest one run before it.
+"""
+
+# Copyright 2015 Netflix. All rights reserved.
+# Copyright 2016 BigWaveIT. All rights reserved.
+#
+# The contents of this file are licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the
+# License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import os
+import sys
+import json
+import stat
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+import collections
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pyIOSXR import IOSXR  # noqa
+
+FAKE_AGENT = os.path.join(ROOT, 'test', 'fake_agent.py')
+
+SSH = '''#!/bin/sh
+exec "%s" "%s" "$FAKE_AGENT_LATENCY" "$FAKE_AGENT_SIZE"
+'''
+
+BENCHMARKS = collections.OrderedDict()
+
+
+def benchmark(name):
+    """Register a benchmark, a function taking the options and returning the operation to time."""
+    def decorator(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return decorator
+
+
+def new_device(options, lock=True):
+    if options.transport == 'tcp':
+        return IOSXR(hostname='127.0.0.1', username='bench', password='bench', port=options.port, timeout=120,
+                     lock=lock, transport='tcp')
+    return IOSXR(hostname='bench', username='bench', password='bench', timeout=120, lock=lock)
+
+
+def connect(options):
+    session = new_device(options, lock=False)
+    session.open()
+    return session
+
+
+@benchmark('open')
+def bench_open(options):
+    def operation():
+        session = new_device(options)
+        session.open()
+        session.close()
+    return operation, None
+
+
+@benchmark('rpc')
+def bench_rpc(options):
+    device = connect(options)
+    return lambda: device.make_rpc_call('<Get><Operational><SystemTime/></Operational></Get>'), device.close
+
+
+@benchmark('get')
+def bench_get(options):
+    device = connect(options)
+    return lambda: device.make_rpc_call('<Get><Operational><Interfaces/></Operational></Get>'), device.close
+
+
+@benchmark('get_raw')
+def bench_get_raw(options):
+    device = connect(options)
+    return lambda: device.make_rpc_call('<Get><Operational><Interfaces/></Operational></Get>', raw=True), device.close
+
+
+@benchmark('show')
+def bench_show(options):
+    device = connect(options)
+    return device.show_interfaces, device.close
+
+
+def bench_config(options):
+    lines = []
+    length = 0
+    index = 0
+    while length < options.config_size:
+        stanza = ['interface GigabitEthernet0/0/0/%d' % index, ' description bench %d' % index, '!']
+        lines += stanza
+        length += sum(len(line) + 1 for line in stanza)
+        index += 1
+    return '\n'.join(lines)
+
+
+@benchmark('load')
+def bench_load(options):
+    device = connect(options)
+    config = bench_config(options)
+    return lambda: device.load_candidate_config(config=config), device.close
+
+
+@benchmark('load_chunked')
+def bench_load_chunked(options):
+    device = connect(options)
+    config = bench_config(options)
+    return lambda: device.load_candidate_config(config=config, chunk_size=options.chunk_size), device.close
+
+
+@benchmark('compare')
+def bench_compare(options):
+    device = connect(options)
+    return device.compare_config, device.close
+
+
+@benchmark('commit')
+def bench_commit(options):
+    device = connect(options)
+    return device.commit_config, device.close
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+def run(name, options):
+    operation, teardown = BENCHMARKS[name](options)
+    operation()  # warm up, e.g. the fake agent caches its outputs
+    latencies = []
+    started = time.time()
+    for _ in range(options.iterations):
+        start = time.time()
+        operation()
+        latencies.append(time.time() - start)
+    elapsed = time.time() - started
+    if teardown is not None:
+        teardown()
+    # ru_maxrss is in kilobytes on Linux and in bytes on OS X
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak /= 1024
+    return collections.OrderedDict([
+        ('benchmark', name),
+        ('iterations', options.iterations),
+        ('ops_per_sec', options.iterations / elapsed),
+        ('p50_ms', percentile(latencies, 50) * 1000),
+        ('p90_ms', percentile(latencies, 90) * 1000),
+        ('p99_ms', percentile(latencies, 99) * 1000),
+        ('max_ms', max(latencies) * 1000),
+        ('peak_rss_kb', peak)
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark pyIOSXR against a fake XML agent.')
+    parser.add_argument('benchmarks', nargs='*', metavar='BENCHMARK',
+                        help='benchmarks to run: %s (default: all)' % ', '.join(BENCHMARKS))
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds the agent waits before responding')
+    parser.add_argument('--size', type=int, default=100000, help='bytes of output of show commands and Get requests')
+    parser.add_argument('--config-size', type=int, default=1000000, help='bytes of config loaded by load')
+    parser.add_argument('--chunk-size', type=int, default=65536, help='bytes per request of load_chunked')
+    parser.add_argument('--iterations', type=int, default=20, help='operations per benchmark')
+    parser.add_argument('--transport', choices=['ssh', 'tcp'], default='ssh', help='transport of the sessions')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.child:
+        print(json.dumps(run(options.child, options)))
+        return
+    for name in options.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark %s' % name)
+
+    directory = tempfile.mkdtemp()
+    agent = None
+    try:
+        ssh = os.path.join(directory, 'ssh')
+        with open(ssh, 'w') as f:
+            f.write(SSH % (sys.executable, FAKE_AGENT))
+        os.chmod(ssh, os.stat(ssh).st_mode | stat.S_IEXEC)
+        os.environ['PATH'] = directory + os.pathsep + os.environ.get('PATH', '')
+        os.environ['FAKE_AGENT_LATENCY'] = str(options.latency)
+        os.environ['FAKE_AGENT_SIZE'] = str(options.size)
+        if options.transport == 'tcp':
+            agent = subprocess.Popen([sys.executable, FAKE_AGENT, str(options.latency), str(options.size), '0'],
+                                     stdout=subprocess.PIPE)
+            options.port = int(agent.stdout.readline())
+
+        results = []
+        for name in options.benchmarks or BENCHMARKS:
+            # the environment set up above is inherited by the process of the benchmark
+            command = [sys.executable, os.path.abspath(__file__), '--child', name, '--latency', str(options.latency),
+                       '--size', str(options.size), '--config-size', str(options.config_size),
+                       '--chunk-size', str(options.chunk_size), '--iterations', str(options.iterations),
+                       '--transport', options.transport]
+            if options.transport == 'tcp':
+                command += ['--port', str(options.port)]
+            results.append(json.loads(subprocess.check_output(command), object_pairs_hook=collections.OrderedDict))
+    finally:
+        if agent is not None:
+            agent.kill()
+            agent.wait()
+        shutil.rmtree(directory)
+
+    if options.json:
+        print(json.dumps(results, indent=2))
+        return
+    print('%-12s %10s %10s %10s %10s %10s %12s' % ('benchmark', 'ops/sec', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms',
+                                                   'peak RSS kB'))
+    for result in results:
+        print('%-12s %10.1f %10.2f %10.2f %10.2f %10.2f %12d' % tuple(result.values()[:1] + result.values()[2:]))
+
+
+if __name__ == '__main__':
+    main()
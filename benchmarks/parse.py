@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Benchmarks of the XML backends parsing responses of realistic size.
+
+Usage: python benchmarks/parse.py [--size BYTES] [--iterations N] [--json] [BACKEND ...]
+
+The responses are the fixtures in test/*.xml, scaled up by repeating their entries: 'get' is an operational
+Get response with many table entries, 'show' the response of a show command with a long output. Every backend
+parses every response in a process of its own, so the peak memory (maximum resident set size) reported is the
+growth caused by parsing and serializing that response alone.
+"""
+
+# Copyright 2015 Netflix. All rights reserved.
+# Copyright 2016 BigWaveIT. All rights reserved.
+#
+# The contents of this file are licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the
+# License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import subprocess
+import collections
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pyIOSXR import backend  # noqa
+from pyIOSXR.iosxr import __parse_response__  # noqa
+
+# Fixture and the tags enclosing the part repeated to scale it up.
+FIXTURES = collections.OrderedDict([
+    ('get', ('device_make_rpc_call.xml', '<InstanceTable>', '</InstanceTable>')),
+    ('show', ('device_show_interfaces.xml', '<Exec>', '</Exec>')),
+])
+
+
+def scale(name, size):
+    """The response of a fixture, with the part between its tags repeated up to about size bytes."""
+    filename, after, before = FIXTURES[name]
+    with open(os.path.join(ROOT, 'test', filename)) as f:
+        response = f.read().replace('\\r\\n', '\r\n')
+    start = response.index(after) + len(after)
+    end = response.index(before)
+    part = response[start:end]
+    return response[:start] + part * max(1, (size - len(response)) / len(part) + 1) + response[end:]
+
+
+def peak_rss():
+    # ru_maxrss is in kilobytes on Linux and in bytes on OS X
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak /= 1024
+    return peak
+
+
+def measure(name, fixture, options):
+    xml_backend = backend.get_backend(name)
+    response = scale(fixture, options.size)
+    baseline = peak_rss()
+    parse = []
+    serialize = []
+    for _ in range(options.iterations):
+        start = time.time()
+        root = __parse_response__(response, '<Get/>', backend=xml_backend)
+        parse.append(time.time() - start)
+        start = time.time()
+        xml_backend.tostring(root)
+        serialize.append(time.time() - start)
+        del root
+    return collections.OrderedDict([
+        ('backend', name),
+        ('response', fixture),
+        ('bytes', len(response)),
+        ('parse_mb_per_sec', len(response) / min(parse) / 1e6),
+        ('serialize_mb_per_sec', len(response) / min(serialize) / 1e6),
+        ('peak_rss_kb', peak_rss() - baseline)
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the XML backends of pyIOSXR.')
+    parser.add_argument('backends', nargs='*', metavar='BACKEND',
+                        help='backends to run: %s (default: all installed)' % ', '.join(backend.available()))
+    parser.add_argument('--size', type=int, default=10000000, help='bytes per response')
+    parser.add_argument('--iterations', type=int, default=5, help='parses per response, the fastest counts')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.child:
+        print(json.dumps(measure(*options.child.split(':') + [options])))
+        return
+    for name in options.backends:
+        if name not in backend.available():
+            parser.error('backend %s is not installed' % name)
+
+    results = []
+    for name in options.backends or backend.available():
+        for fixture in FIXTURES:
+            command = [sys.executable, os.path.abspath(__file__), '--child', name + ':' + fixture,
+                       '--size', str(options.size), '--iterations', str(options.iterations)]
+            results.append(json.loads(subprocess.check_output(command), object_pairs_hook=collections.OrderedDict))
+
+    if options.json:
+        print(json.dumps(results, indent=2))
+        return
+    print('%-12s %-8s %10s %10s %12s %12s' % ('backend', 'response', 'MB', 'parse MB/s', 'tostring MB/s',
+                                              'peak RSS kB'))
+    for result in results:
+        print('%-12s %-8s %10.1f %10.1f %12.1f %12d' % (result['backend'], result['response'], result['bytes'] / 1e6,
+                                                        result['parse_mb_per_sec'], result['serialize_mb_per_sec'],
+                                                        result['peak_rss_kb']))
+
+
+if __name__ == '__main__':
+    main()
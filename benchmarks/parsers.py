@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Benchmarks of the parsers of show command outputs in pyIOSXR.parsers.
+
+Usage: python benchmarks/parsers.py [--lines N] [--iterations N] [--json] [PARSER ...]
+
+The outputs are scaled up from the samples the tests use, by repeating their entries up to about the given
+number of lines: 'interfaces' is the output of show interfaces in test/device_show_interfaces.xml, 'bgp' and
+'route' those of show bgp summary and show route summary in test/test.py. Every parser is timed on the whole
+output as a string, the fastest of the iterations counts.
+"""
+
+# Copyright 2015 Netflix. All rights reserved.
+# Copyright 2016 BigWaveIT. All rights reserved.
+#
+# The contents of this file are licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the
+# License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import os
+import sys
+import json
+import time
+import argparse
+import collections
+from xml.etree import ElementTree
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pyIOSXR import parsers  # noqa
+
+BGP_HEADER = '''BGP router identifier 192.0.2.1, local AS number 65000
+BGP main routing table version 12
+
+Neighbor        Spk    AS MsgRcvd MsgSent   TblVer  InQ OutQ  Up/Down  St/PfxRcd
+'''
+BGP_NEIGHBORS = '''192.0.2.2         0 65001    1523    1519       12    0    0 1d01h              5
+2001:db8:ffff:ffff::2
+                  0 65002       0       0        0    0    0 00:00:00 Idle
+192.0.2.3         0 65003       0       0        0    0    0 00:00:00 Idle (Admin)
+'''
+
+ROUTE_HEADER = '''Route Source                     Routes     Backup     Deleted     Memory(bytes)
+'''
+ROUTE_SOURCES = '''connected                        2          0          0           480
+local                            2          0          0           480
+bgp 65000                        5          0          0           1200
+'''
+
+
+def interfaces():
+    with open(os.path.join(ROOT, 'test', 'device_show_interfaces.xml')) as f:
+        root = ElementTree.fromstring(f.read().replace('\\r\\n', '\r\n')[7:])
+    return '', root.find('CLI/Exec').text
+
+
+# Commands and the header and repeated part of their outputs.
+OUTPUTS = collections.OrderedDict([
+    ('interfaces', ('show interfaces', interfaces)),
+    ('bgp', ('show bgp summary', lambda: (BGP_HEADER, BGP_NEIGHBORS))),
+    ('route', ('show route summary', lambda: (ROUTE_HEADER, ROUTE_SOURCES))),
+])
+
+
+def scale(name, lines):
+    """The command and the output of a parser, with its entries repeated up to about lines lines."""
+    command, sample = OUTPUTS[name]
+    header, part = sample()
+    return command, header + part * max(1, lines / len(part.splitlines()))
+
+
+def measure(name, options):
+    command, output = scale(name, options.lines)
+    times = []
+    for _ in range(options.iterations):
+        start = time.time()
+        records = parsers.parse(command, output)
+        times.append(time.time() - start)
+    lines = len(output.splitlines())
+    return collections.OrderedDict([
+        ('parser', name),
+        ('lines', lines),
+        ('records', len(records)),
+        ('lines_per_sec', lines / min(times)),
+        ('ms', min(times) * 1000)
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the show command parsers of pyIOSXR.')
+    parser.add_argument('parsers', nargs='*', metavar='PARSER',
+                        help='parsers to run: %s (default: all)' % ', '.join(OUTPUTS))
+    parser.add_argument('--lines', type=int, default=1000000, help='lines per output')
+    parser.add_argument('--iterations', type=int, default=5, help='parses per output, the fastest counts')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    options = parser.parse_args()
+    for name in options.parsers:
+        if name not in OUTPUTS:
+            parser.error('unknown parser %s' % name)
+
+    results = [measure(name, options) for name in options.parsers or OUTPUTS]
+
+    if options.json:
+        print(json.dumps(results, indent=2))
+        return
+    print('%-12s %10s %10s %14s %10s' % ('parser', 'lines', 'records', 'lines/sec', 'ms'))
+    for result in results:
+        print('%-12s %10d %10d %14.0f %10.1f' % tuple(result.values()))
+
+
+if __name__ == '__main__':
+    main()
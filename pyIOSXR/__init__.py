@@ -18,3 +18,16 @@
 # the License.
 
 from iosxr import IOSXR
+from fleet import Fleet
+from aio import AsyncIOSXR
+from pool import SessionPool
+from cache import ConfigCache
+from stats import RPCStats
+from rollout import Rollout
+from scheduler import Scheduler
+from delta import ChangeDetector
+from store import ResultStore
+from timeouts import Timeouts
+from query import Query
+from render import Renderer
+from recording import Recording, Replay
@@ -0,0 +1,560 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Drive many Cisco devices running IOS-XR concurrently from a single thread."""
+
+# Copyright 2015 Netflix. All rights reserved.
+# Copyright 2016 BigWaveIT. All rights reserved.
+#
+# The contents of this file are licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the
+# License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import os
+import re
+import time
+import select
+import collections
+import pexpect
+import cache
+from iosxr import IOSXR
+from iosxr import __build_request__, __parse_response__, __build_commit__, __diff_config__, __strip_show_output__
+from iosxr import __config_chunks__, __config_changes__
+from backend import get_backend
+from exceptions import XMLCLIError, InvalidInputError, TimeoutError, EOFError, DeviceDownError
+
+
+class Return(Exception):
+    """Raised by an operation to hand its result to the caller."""
+
+    def __init__(self, value=None):
+        """
+        Result of an operation.
+
+        :param value: Value returned by Operation.result()
+        """
+        Exception.__init__(self)
+        self.value = value
+
+
+# Send a line (or nothing) and wait for one of the regular expressions (or pexpect.EOF) to match.
+class _Expect(object):
+    __slots__ = ('send', 'patterns')
+
+    def __init__(self, send, patterns):
+        self.send = send
+        self.patterns = patterns
+
+
+# Send a xml request and wait for its response, the parsed element or with raw set the string received.
+class _RPC(object):
+    __slots__ = ('command', 'rpc_command', 'raw')
+
+    def __init__(self, rpc_command, raw=False):
+        self.command = rpc_command
+        self.rpc_command = __build_request__(rpc_command)
+        self.raw = raw
+
+
+class Operation(object):
+    """A call pending on an AsyncIOSXR device."""
+
+    def __init__(self, device, steps):
+        """
+        A pending call.
+
+        :param device: AsyncIOSXR instance the call is run on
+        :param steps:  Generator yielding the _Expect/_RPC steps of the call
+        """
+        self.device = device
+        self.steps = steps
+        self.value = None
+        self.exception = None
+        self.finished = False
+
+    def done(self):
+        """True once the call has completed or failed."""
+        return self.finished
+
+    def result(self, timeout=None):
+        """
+        Wait for the call to complete.
+
+        :param timeout: (int) Seconds to wait, None to wait as long as the device timeouts allow
+        :return:        The value of the call, re-raises the exception if the call failed
+        """
+        if not self.finished:
+            wait([self], timeout=timeout)
+        if self.exception is not None:
+            raise self.exception
+        return self.value
+
+
+class AsyncIOSXR(IOSXR):
+    """
+    A non-blocking variant of IOSXR.
+
+    Every method returns an Operation immediately. Operations on one device run in the order they were
+    issued, operations on different devices run concurrently once wait() or as_completed() is called.
+    """
+
+    # the longest pattern waited for is shorter than this, matches are searched in new data plus this much
+    # of the data already seen.
+    __OVERLAP = 256
+
+    def __init__(self, *args, **kwargs):
+        """Same arguments as IOSXR."""
+        IOSXR.__init__(self, *args, **kwargs)
+        if self.record is not None or self.replay is not None:
+            raise ValueError('Recording and replaying sessions needs IOSXR, AsyncIOSXR does not support it')
+        self.device = None
+        self.__queue = collections.deque()
+        self.__step = None
+        self.__deadline = None
+        self.__chunks = []
+        self.__tail = ''
+        self.__stamps = None
+        # responses still to come of rpc steps which timed out, they are dropped when they arrive
+        self.__stale = 0
+
+    def __getattr__(self, item):
+        """Dynamic getter to translate generic show commands, see IOSXR.__getattr__."""
+        def wrapper(*args, **kwargs):
+            cmd = item.replace('_', ' ')
+            for arg in args:
+                cmd += " %s" % arg
+            return self.__submit__(self.__show__(cmd, kwargs.get("config")))
+
+        if item.startswith('show'):
+            return wrapper
+        else:
+            raise AttributeError("type object '%s' has no attribute '%s'" % (self.__class__.__name__, item))
+
+    # Queue an operation and start it if the device is idle.
+    def __submit__(self, steps):
+        operation = Operation(self, steps)
+        self.__queue.append(operation)
+        if len(self.__queue) == 1:
+            self.__advance__()
+        return operation
+
+    def fileno(self):
+        """File descriptor to wait for or None if the device does not wait for data."""
+        if self.__step is None or self.device is None:
+            return None
+        return self.device.fileno()
+
+    def deadline(self):
+        """Time the current step times out at or None if the device is idle."""
+        return self.__deadline if self.__step is not None else None
+
+    # Resume the current operation with the outcome of its last step and run it up to its next step.
+    def __advance__(self, value=None, exception=None):
+        while self.__queue:
+            operation = self.__queue[0]
+            try:
+                if exception is not None:
+                    step = operation.steps.throw(exception)
+                else:
+                    step = operation.steps.send(value)
+            except Return as r:
+                operation.value = r.value
+            except StopIteration:
+                pass
+            except Exception as e:
+                operation.exception = e
+            else:
+                value, exception = self.__start__(step)
+                if value is None and exception is None:
+                    return
+                continue
+            operation.finished = True
+            self.__queue.popleft()
+            value, exception = None, None
+        self.__step = None
+
+    # Send the request of a step, returns (None, None) while waiting for the response.
+    def __start__(self, step):
+        self.__step = step
+        timeout = self.timeout
+        if self.recorder is not None and isinstance(step, _RPC):
+            try:
+                timeout = self.recorder.timeout(step.command, timeout)
+            except DeviceDownError as e:
+                return None, e
+        self.__deadline = time.time() + timeout
+        if self.device is None:
+            return None, EOFError("pexpect EOF error")
+        send = step.rpc_command if isinstance(step, _RPC) else step.send
+        self.__stamps = [time.time()] if self.recorder is not None and isinstance(step, _RPC) else None
+        try:
+            if send is not None:
+                self.device.sendline(send)
+        except (OSError, IOError):
+            return self.__record__(None, EOFError("pexpect EOF error"))
+        if self.__stamps is not None:
+            self.__stamps.append(time.time())
+        leftover = ''.join(self.__chunks)
+        self.__chunks = []
+        self.__tail = ''
+        return self.__match__(leftover)
+
+    # Look for the patterns of the current step in the data received so far.
+    def __match__(self, data):
+        step = self.__step
+        if isinstance(step, _RPC):
+            patterns = [re.compile(re.escape("</Response>")), re.compile(re.escape("ERROR: 0xa240fe00"))]
+        else:
+            patterns = [re.compile(pattern) if pattern is not pexpect.EOF else None for pattern in step.patterns]
+
+        self.__chunks.append(data)
+        window = self.__tail + data
+        found = None
+        for index, pattern in enumerate(patterns):
+            if pattern is None:
+                continue
+            match = pattern.search(window)
+            if match is not None and (found is None or match.start() < found[1].start()):
+                found = (index, match)
+        if found is None:
+            self.__tail = window[-self.__OVERLAP:]
+            return None, None
+
+        index, match = found
+        text = ''.join(self.__chunks)
+        end = len(text) - len(window) + match.end()
+        self.__chunks = [text[end:]]
+        self.__tail = ''
+        text = text[:end]
+
+        if not isinstance(step, _RPC):
+            return (index, text), None
+        if self.__stale:
+            # the late response of a step which timed out, the response of this step follows it
+            self.__stale -= 1
+            rest = self.__chunks.pop()
+            return self.__match__(rest)
+        if self.__stamps is not None:
+            self.__stamps.append(time.time())
+        if index == 1:
+            return self.__record__(None, XMLCLIError('The XML document is not well-formed'), len(text))
+        try:
+            root = __parse_response__(text, step.rpc_command, stamps=self.__stamps, backend=self.backend)
+        except Exception as e:
+            return self.__record__(None, e, len(text))
+        return self.__record__(text[text.find('<'):] if step.raw else root, None, len(text))
+
+    # Record the outcome of the current rpc step if the device has stats, returns (value, exception).
+    def __record__(self, value, exception, received=0):
+        if self.__stamps is not None:
+            step = self.__step
+            self.recorder.record(step.command, self.__stamps, len(step.rpc_command) + 1, received, exception)
+            self.__stamps = None
+        return value, exception
+
+    def __on_readable__(self):
+        try:
+            data = self.device.read_nonblocking(65536, timeout=0)
+        except pexpect.TIMEOUT:
+            return
+        except pexpect.EOF:
+            patterns = getattr(self.__step, 'patterns', [])
+            if pexpect.EOF in patterns:
+                self.__advance__(value=(patterns.index(pexpect.EOF), ''.join(self.__chunks)))
+            else:
+                self.__advance__(*self.__record__(None, EOFError("pexpect EOF error")))
+            return
+        value, exception = self.__match__(data)
+        if value is not None or exception is not None:
+            self.__advance__(value, exception)
+
+    def __on_timeout__(self, now):
+        if self.__step is not None and now >= self.__deadline:
+            if isinstance(self.__step, _RPC):
+                self.__stale += 1
+            self.__advance__(*self.__record__(None, TimeoutError("pexpect timeout error")))
+
+    def __open__(self):
+        if self.timeouts is not None:
+            self.timeouts.check(self.hostname)
+        # connecting blocks, logging in does not: the ssh binary connects in its own process, the tcp, ssl and
+        # paramiko transports hold the reactor for up to the timeout while connecting
+        self.device = self.__spawn__()
+        self.__stale = 0
+        # pexpect sleeps before every send by default, which would stall all devices of the reactor
+        self.device.delaybeforesend = None
+        # pexpect reads with select() by default, which fails on file descriptors from 1024 up
+        self.device.use_poll = True
+        if self.transport in ('tcp', 'ssl'):
+            index, _ = yield _Expect(None, ['Username:', 'XML>'])
+            if index == 0:
+                yield _Expect(self.username, ['Password:'])
+                index, _ = yield _Expect(self.password, ['XML>', 'Username:'])
+                if index == 1:
+                    raise XMLCLIError('Login to the XML agent failed, check username and password.')
+        else:
+            prompts = ['\(yes\/no\)\?', 'password:', '#', pexpect.EOF]
+            index, _ = yield _Expect(None, prompts)
+            if index == 0:
+                index, _ = yield _Expect('yes', prompts)
+            send = None
+            if index == 1:
+                send = self.password
+            if index != 2:
+                yield _Expect(send, ['#'])
+            index, _ = yield _Expect('xml', ['XML>', 'ERROR: 0x24319600'])
+            if index == 1:
+                raise XMLCLIError('XML TTY agent has not been started. Please configure \'xml agent tty\'.')
+        if self.lock_on_connect:
+            for step in self.__lock__():
+                yield step
+
+    def open(self):
+        """Open a connection to the device, see IOSXR.open."""
+        return self.__submit__(self.__open__())
+
+    def __close__(self):
+        if self.lock_on_connect or self.locked:
+            for step in self.__unlock__():
+                yield step
+        self.device.close()
+        self.device = None
+
+    def close(self):
+        """Close the connection to the device, see IOSXR.close."""
+        return self.__submit__(self.__close__())
+
+    def __lock__(self):
+        if not self.locked:
+            yield _RPC('<Lock/>')
+            self.locked = True
+
+    def lock(self):
+        """Lock the device config, see IOSXR.lock."""
+        return self.__submit__(self.__lock__())
+
+    def __unlock__(self):
+        if self.locked:
+            yield _RPC('<Unlock/>')
+            self.locked = False
+
+    def unlock(self):
+        """Unlock the device config, see IOSXR.unlock."""
+        return self.__submit__(self.__unlock__())
+
+    def __show__(self, show_command, config=False):
+        if config:
+            response = yield _RPC('<CLI><Configuration>'+show_command+'</Configuration></CLI>')
+            output = response.find('CLI').find('Configuration').text.lstrip()
+        else:
+            response = yield _RPC('<CLI><Exec>'+show_command+'</Exec></CLI>')
+            output = response.find('CLI').find('Exec').text.lstrip()
+        raise Return(__strip_show_output__(output))
+
+    def __make_rpc_call__(self, rpc_command, element, raw):
+        result = yield _RPC(rpc_command, raw)
+        raise Return(result if raw or element else (self.backend or get_backend()).tostring(result))
+
+    def make_rpc_call(self, rpc_command, element=False, raw=False):
+        """Query the device directly using a XML-request, see IOSXR.make_rpc_call."""
+        return self.__submit__(self.__make_rpc_call__(rpc_command, element, raw))
+
+    def __query__(self, query, factory):
+        result = yield _RPC(query.rpc_command)
+        raise Return(query.decode(result, factory))
+
+    def query(self, query, factory=None):
+        """Run a Get query and decode the response, see IOSXR.query."""
+        return self.__submit__(self.__query__(query, factory))
+
+    def __load_candidate_config__(self, filename, config, chunk_size, progress):
+        if filename is None:
+            f = None
+            total = len(config)
+            chunks = [config] if chunk_size is None else __config_chunks__(config.splitlines(True), chunk_size)
+        else:
+            f = open(filename)
+            total = os.fstat(f.fileno()).st_size
+            chunks = [f.read()] if chunk_size is None else __config_chunks__(f, chunk_size)
+        loaded = 0
+        try:
+            for chunk in chunks:
+                try:
+                    yield _RPC('<CLI><Configuration>'+chunk+'</Configuration></CLI>')
+                except InvalidInputError as e:
+                    yield _RPC('<Clear/>')
+                    raise InvalidInputError(e.message)
+                loaded += len(chunk)
+                if progress is not None:
+                    progress(loaded, total)
+        finally:
+            if f is not None:
+                f.close()
+
+    def load_candidate_config(self, filename=None, config=None, chunk_size=None, progress=None):
+        """Load candidate confguration, see IOSXR.load_candidate_config."""
+        return self.__submit__(self.__load_candidate_config__(filename, config, chunk_size, progress))
+
+    def __get_candidate_config__(self, merge, formal):
+        command = "show configuration"
+        if merge:
+            command += " merge"
+        if formal:
+            command += " formal"
+        response = yield _RPC('<CLI><Configuration>'+command+'</Configuration></CLI>')
+        response = response.find('CLI').find('Configuration').text.lstrip()
+        start = response.rfind('!! IOS XR Configuration')
+        if start != -1:
+            response = response[start:]
+        raise Return(response)
+
+    def get_candidate_config(self, merge=False, formal=False):
+        """Retrieve the candidate config, see IOSXR.get_candidate_config."""
+        return self.__submit__(self.__get_candidate_config__(merge, formal))
+
+    def __compare_config__(self, structured):
+        show_merge = yield _RPC('<CLI><Configuration>show configuration merge</Configuration></CLI>')
+        commit_id = show_run = None
+        if self.config_cache is not None:
+            response = yield _RPC('<CLI><Exec>'+cache.COMMIT_LIST_COMMAND+'</Exec></CLI>')
+            commit_id = cache.parse_commit_id(response.find('CLI').find('Exec').text.lstrip())
+            show_run = self.config_cache.get(self.hostname, commit_id)
+        if show_run is None:
+            response = yield _RPC('<CLI><Configuration>show running-config</Configuration></CLI>')
+            show_run = response.find('CLI').find('Configuration').text.lstrip()
+            if self.config_cache is not None:
+                self.config_cache.put(self.hostname, commit_id, show_run)
+        raise Return(__diff_config__(show_run, show_merge.find('CLI').find('Configuration').text.lstrip(),
+                                     structured))
+
+    def compare_config(self, structured=False):
+        """Compare the config to be merged with the running config, see IOSXR.compare_config."""
+        return self.__submit__(self.__compare_config__(structured))
+
+    def __compare_replace_config__(self):
+        diff = yield _RPC('<CLI><Configuration>show configuration changes diff</Configuration></CLI>')
+        diff = diff.find('CLI').find('Configuration').text.lstrip()
+        raise Return(''.join(diff.splitlines(1)[2:-2]))
+
+    def compare_replace_config(self):
+        """Compare the config to be replaced with the running config, see IOSXR.compare_replace_config."""
+        return self.__submit__(self.__compare_replace_config__())
+
+    def __rpc__(self, rpc_command):
+        yield _RPC(rpc_command)
+
+    def __get_config_changes__(self):
+        response = yield _RPC('<CLI><Configuration>show configuration changes</Configuration></CLI>')
+        raise Return(__config_changes__(response.find('CLI').find('Configuration').text.lstrip()))
+
+    def get_config_changes(self):
+        """Retrieve the changes the candidate config makes, see IOSXR.get_config_changes."""
+        return self.__submit__(self.__get_config_changes__())
+
+    def __commit__(self, rpc_command, skip_if_empty=False, confirmed=None):
+        # a confirmed commit is confirmed by committing an empty candidate, which is never skipped
+        if skip_if_empty and not self.pending_confirm:
+            response = yield _RPC('<CLI><Configuration>show configuration changes</Configuration></CLI>')
+            if not __config_changes__(response.find('CLI').find('Configuration').text.lstrip()):
+                raise Return(False)
+        self.__invalidate_config_cache__()
+        yield _RPC(rpc_command)
+        self.pending_confirm = bool(confirmed)
+        raise Return(True)
+
+    def commit_config(self, label=None, comment=None, confirmed=None, skip_if_empty=False):
+        """Commit the candidate config by merging it, see IOSXR.commit_config."""
+        rpc_command = __build_commit__(label=label, comment=comment, confirmed=confirmed)
+        return self.__submit__(self.__commit__(rpc_command, skip_if_empty, confirmed))
+
+    def commit_replace_config(self, label=None, comment=None, confirmed=None, skip_if_empty=False):
+        """Commit the candidate config by replacing the running config, see IOSXR.commit_replace_config."""
+        rpc_command = __build_commit__(replace=True, label=label, comment=comment, confirmed=confirmed)
+        return self.__submit__(self.__commit__(rpc_command, skip_if_empty, confirmed))
+
+    def discard_config(self):
+        """Clear uncommited changes in the current session, see IOSXR.discard_config."""
+        return self.__submit__(self.__rpc__('<Clear/>'))
+
+    def rollback(self):
+        """Rollback the last committed configuration, see IOSXR.rollback."""
+        return self.__submit__(self.__commit__('<Unlock/><Rollback><Previous>1</Previous></Rollback><Lock/>'))
+
+
+# Wait for some of the file descriptors to be readable, returns those. select() fails on descriptors from
+# FD_SETSIZE (1024) up, which a process with many devices open reaches, poll() has no such limit.
+def __readable__(fds, timeout):
+    if not hasattr(select, 'poll'):
+        return select.select(fds, [], [], timeout)[0]
+    poller = select.poll()
+    for fd in fds:
+        poller.register(fd, select.POLLIN | select.POLLPRI)
+    # hang-ups and errors are reported too, reading then raises EOF
+    return [fd for fd, _ in poller.poll(None if timeout is None else timeout * 1000)]
+
+
+def as_completed(operations, timeout=None):
+    """
+    Run operations of AsyncIOSXR devices concurrently.
+
+    Yields the operations in the order they complete.
+
+    :param operations: List of Operation objects
+    :param timeout:    (int) Seconds to wait for all operations, TimeoutError is raised if some are still pending
+                       by then. None to wait as long as the device timeouts allow.
+    """
+    pending = list(operations)
+    devices = []
+    for operation in pending:
+        if operation.device not in devices:
+            devices.append(operation.device)
+    deadline = time.time() + timeout if timeout is not None else None
+
+    while pending:
+        for operation in [operation for operation in pending if operation.done()]:
+            pending.remove(operation)
+            yield operation
+        if not pending:
+            return
+
+        now = time.time()
+        if deadline is not None and now >= deadline:
+            raise TimeoutError('%d operations still pending after %s sec' % (len(pending), timeout))
+
+        waiting = dict((device.fileno(), device) for device in devices if device.fileno() is not None)
+        wakeups = [device.deadline() for device in devices if device.deadline() is not None]
+        if deadline is not None:
+            wakeups.append(deadline)
+        wait_for = max(min(wakeups) - now, 0) if wakeups else None
+        if waiting:
+            readable = __readable__(list(waiting), wait_for)
+        else:
+            readable = []
+            if wait_for:
+                time.sleep(wait_for)
+        for fd in readable:
+            waiting[fd].__on_readable__()
+
+        now = time.time()
+        for device in devices:
+            device.__on_timeout__(now)
+
+
+def wait(operations, timeout=None):
+    """
+    Run operations of AsyncIOSXR devices concurrently until all of them are done.
+
+    :param operations: List of Operation objects
+    :param timeout:    (int) Seconds to wait, see as_completed()
+    :return:           The list of operations
+    """
+    for _ in as_completed(operations, timeout=timeout):
+        pass
+    return list(operations)
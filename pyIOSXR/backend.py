@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""XML parser backends used to handle the responses of devices running IOS-XR."""
+
+# Copyright 2015 Netflix. All rights reserved.
+# Copyright 2016 BigWaveIT. All rights reserved.
+#
+# The contents of this file are licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the
+# License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import importlib
+
+# Backends by name, fastest first, in the order detect() prefers them.
+MODULES = [
+    ('lxml', 'lxml.etree'),
+    ('cElementTree', 'xml.etree.cElementTree'),
+    ('ElementTree', 'xml.etree.ElementTree'),
+]
+
+# The backend used unless another one is set, its elements are those of the standard library.
+DEFAULT = 'ElementTree'
+
+# lxml only parses strings, the response is fed to it in slices of this size so it is never copied at once.
+__LXML_SLICE__ = 1 << 20
+
+
+class Backend(object):
+    """An ElementTree compatible XML library."""
+
+    def __init__(self, name):
+        """
+        Load a backend.
+
+        :param name: (str) 'lxml', 'cElementTree' or 'ElementTree', ImportError is raised if it is not installed
+        """
+        modules = dict(MODULES)
+        if name not in modules:
+            raise ValueError('Unknown XML backend %s, use one of %s' % (name, ', '.join(modules)))
+        self.name = name
+        self.etree = importlib.import_module(modules[name])
+        self.ParseError = self.etree.XMLSyntaxError if name == 'lxml' else self.etree.ParseError
+
+    def __repr__(self):
+        return 'Backend(%r)' % self.name
+
+    def XMLParser(self, target=None):
+        """Parser with the feed interface, building a tree or calling the methods of target."""
+        if self.name == 'lxml':
+            # responses can be huge, and entities are never resolved
+            return self.etree.XMLParser(target=target, huge_tree=True, resolve_entities=False)
+        if target is None:
+            return self.etree.XMLParser()
+        return self.etree.XMLParser(target=target)
+
+    def TreeBuilder(self):
+        """Tree builder creating the elements of this backend."""
+        return self.etree.TreeBuilder()
+
+    def feed(self, parser, data, start=0):
+        """Feed data[start:] to a parser, without copying it where the backend allows."""
+        if self.name != 'lxml':
+            parser.feed(buffer(data, start) if start else data)
+            return
+        for offset in range(start, len(data), __LXML_SLICE__):
+            parser.feed(data[offset:offset + __LXML_SLICE__])
+
+    def fromstring(self, text):
+        """Parse a string, returns the root element."""
+        parser = self.XMLParser()
+        self.feed(parser, text)
+        return parser.close()
+
+    def tostring(self, element):
+        """Serialize an element."""
+        return self.etree.tostring(element)
+
+
+__BACKENDS__ = {}
+__DEFAULT__ = None
+
+
+def get_backend(name=None):
+    """
+    Get a backend.
+
+    :param name: (str) 'lxml', 'cElementTree' or 'ElementTree'. None for the default set with set_backend(),
+                 which is ElementTree unless set.
+    :return:     Backend instance
+    """
+    global __DEFAULT__
+    if name is None:
+        if __DEFAULT__ is None:
+            __DEFAULT__ = get_backend(DEFAULT)
+        return __DEFAULT__
+    if name not in __BACKENDS__:
+        __BACKENDS__[name] = Backend(name)
+    return __BACKENDS__[name]
+
+
+def set_backend(name=None):
+    """
+    Set the default backend of all IOSXR instances not given a backend of their own.
+
+    The elements returned by make_rpc_call(element=True), iter_rpc() and stream_rpc_call() are the ones of the
+    backend, so the default is ElementTree. Faster backends are opt-in, e.g. set_backend(detect().name).
+
+    :param name: (str) 'lxml', 'cElementTree' or 'ElementTree', None to go back to ElementTree
+    """
+    global __DEFAULT__
+    __DEFAULT__ = get_backend(name) if name is not None else None
+
+
+def detect():
+    """The fastest backend installed, the first one in the order of MODULES."""
+    for name, _ in MODULES:
+        try:
+            return get_backend(name)
+        except ImportError:
+            continue
+    raise ImportError('No XML backend available')
+
+
+def available():
+    """Names of the backends installed."""
+    names = []
+    for name, _ in MODULES:
+        try:
+            get_backend(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
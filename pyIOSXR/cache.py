@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Cache the running configuration of devices running IOS-XR."""
+
+# Copyright 2015 Netflix. All rights reserved.
+# Copyright 2016 BigWaveIT. All rights reserved.
+#
+# The contents of this file are licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the
+# License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import os
+import re
+import errno
+import hashlib
+import tempfile
+import threading
+
+# The command used to find out whether the running config changed, it prints the last commit only.
+COMMIT_LIST_COMMAND = 'show configuration commit list 1'
+
+
+def parse_commit_id(output):
+    """
+    Get the last commit from the output of 'show configuration commit list 1'.
+
+    The whole entry is returned rather than the Label/ID column alone, as the column shows the label of
+    labeled commits, which does not need to be unique.
+
+    :param output: (str) Output of the command
+    :return:       (str) The commit entry, None if the device has no commits
+    """
+    lines = output.splitlines()
+    for index, line in enumerate(lines):
+        if line.strip().startswith('~~~~'):
+            for entry in lines[index + 1:]:
+                columns = entry.split()
+                if columns and columns[0] == '1':
+                    return ' '.join(columns[1:])
+            return None
+    return None
+
+
+class ConfigCache:
+    """Running configurations keyed by hostname and the last commit on the device."""
+
+    def __init__(self, directory=None):
+        """
+        A running config cache.
+
+        :param directory: (str) Directory to keep the configurations in as well, so they survive the process
+                          and are shared by processes using the same directory. None to cache in memory only.
+        """
+        self.directory = directory
+        self.__configs = {}
+        self.__lock = threading.Lock()
+        if directory is not None and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def __path__(self, hostname):
+        name = re.sub(r'[^\w.-]', '_', hostname) + '-' + hashlib.sha1(hostname).hexdigest()[:8]
+        return os.path.join(self.directory, name + '.cfg')
+
+    def get(self, hostname, commit_id):
+        """
+        Look up the running config of a device.
+
+        :param hostname:  (str) Hostname of the device
+        :param commit_id: (str) Last commit on the device, see parse_commit_id()
+        :return:          (str) The running config, None if it is not cached for this commit
+        """
+        if commit_id is None:
+            return None
+        with self.__lock:
+            cached = self.__configs.get(hostname)
+        if cached is not None and cached[0] == commit_id:
+            return cached[1]
+        if self.directory is None:
+            return None
+
+        try:
+            with open(self.__path__(hostname), 'rb') as cache_file:
+                cached_id = cache_file.readline().rstrip('\n')
+                if cached_id != commit_id:
+                    return None
+                config = cache_file.read()
+        except IOError:
+            return None
+        with self.__lock:
+            self.__configs[hostname] = (commit_id, config)
+        return config
+
+    def put(self, hostname, commit_id, config):
+        """
+        Cache the running config of a device.
+
+        :param hostname:  (str) Hostname of the device
+        :param commit_id: (str) Last commit on the device when the config was retrieved
+        :param config:    (str) The running config
+        """
+        if commit_id is None:
+            return
+        with self.__lock:
+            self.__configs[hostname] = (commit_id, config)
+        if self.directory is None:
+            return
+
+        # write to a temporary file first, so readers never see a partial config
+        fd, path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as cache_file:
+                cache_file.write(commit_id + '\n')
+                cache_file.write(config)
+            os.rename(path, self.__path__(hostname))
+        except Exception:
+            os.remove(path)
+            raise
+
+    def invalidate(self, hostname):
+        """
+        Drop the cached running config of a device.
+
+        :param hostname: (str) Hostname of the device
+        """
+        with self.__lock:
+            self.__configs.pop(hostname, None)
+        if self.directory is None:
+            return
+        try:
+            os.remove(self.__path__(hostname))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
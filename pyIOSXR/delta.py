@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Detect what changed in the operational data of devices running IOS-XR since the last poll."""
+
+# Copyright 2015 Netflix. All rights reserved.
+# Copyright 2016 BigWaveIT. All rights reserved.
+#
+# The contents of this file are licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the
+# License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import hashlib
+import threading
+import collections
+
+from backend import get_backend
+
+# What changed in the response to a command since the previous poll of the device. unchanged is True if
+# nothing did. changed is an OrderedDict of record key to the record new or changed: the element for XML
+# responses, the whole output for show commands. removed lists the keys of the records gone since.
+Delta = collections.namedtuple('Delta', ['hostname', 'command', 'unchanged', 'changed', 'removed'])
+
+
+# Key of a table entry, from the leaves of its Naming element, e.g. [InstanceName=default].
+def __naming__(naming):
+    return '[%s]' % ','.join('%s=%s' % (leaf.tag, (leaf.text or '').strip()) for leaf in naming.iter()
+                             if len(leaf) == 0)
+
+
+# Collect the records below element as (key, element) into records. Table entries, the elements with a Naming
+# child, are records. Elements with no entries below are records as a whole. Returns False if element has no
+# entries below, so the caller takes it as a whole.
+def __records__(element, path, records):
+    naming = element.find('Naming')
+    if naming is not None:
+        records.append((path + __naming__(naming), element))
+        return True
+    children = [(child, path + '/' + child.tag) for child in element if isinstance(child.tag, basestring)]
+    found = [__records__(child, child_path, records) for child, child_path in children]
+    if not any(found):
+        return False
+    records.extend((child_path, child) for (child, child_path), entries in zip(children, found) if not entries)
+    return True
+
+
+# Rpc jobs with several operations return them concatenated, e.g. <Get>...</Get><Get>...</Get>, which is no
+# XML document. Such results are put below a Response element, like in the response they came in.
+def __document__(response):
+    start = response.lstrip()
+    if start.startswith('<?xml') or start.startswith('<Response'):
+        return response
+    return '<Response>' + response + '</Response>'
+
+
+def records(root):
+    """
+    Split a response into records.
+
+    :param root: Response element, or the element of a single operation such as Get
+    :return:     List of (key, element), keys are the path of the element within the operation, with the
+                 naming of table entries, e.g. Get/Operational/BGP/InstanceTable/Instance[InstanceName=default]
+    """
+    operations = [child for child in root if child.tag != 'ResultSummary'] if root.tag == 'Response' else [root]
+    found = []
+    for operation in operations:
+        if not __records__(operation, operation.tag, found):
+            found.append((operation.tag, operation))
+    # keys of records which are siblings with the same tag and without naming are made unique
+    seen = collections.Counter()
+    result = []
+    for key, element in found:
+        seen[key] += 1
+        result.append((key if seen[key] == 1 else '%s#%d' % (key, seen[key]), element))
+    return result
+
+
+class ChangeDetector:
+    """Digests of the last response of every device and command, to emit only what changed."""
+
+    def __init__(self, backend=None):
+        """
+        A change detector.
+
+        Only a digest of every record is kept, never the responses themselves.
+
+        :param backend: Backend to parse and serialize responses with, None for the default one
+        """
+        self.backend = backend
+        self.__digests = {}
+        self.__lock = threading.Lock()
+
+    def update(self, hostname, command, response, xml=True):
+        """
+        Compare a response to the previous one for the same device and command, and remember it.
+
+        :param hostname: (str) Hostname of the device
+        :param command:  (str) rpc or show command the response belongs to
+        :param response: XML response as element or string, a string may hold several operations one after
+                         the other, or the output of a show command
+        :param xml:      (bool) The response is XML, compared record by record. Otherwise it is compared as a
+                         whole (default: True)
+        :return:         Delta
+        """
+        backend = self.backend or get_backend()
+        if not xml:
+            found = [(command, response)]
+            text = response.encode('utf-8') if isinstance(response, unicode) else response
+            digests = {command: hashlib.sha1(text).digest()}
+        else:
+            if isinstance(response, basestring):
+                response = backend.fromstring(__document__(response))
+            found = records(response)
+            digests = dict((key, hashlib.sha1(backend.tostring(element)).digest()) for key, element in found)
+
+        with self.__lock:
+            previous = self.__digests.get((hostname, command), {})
+            self.__digests[(hostname, command)] = digests
+        changed = collections.OrderedDict((key, element) for key, element in found
+                                          if previous.get(key) != digests[key])
+        removed = [key for key in previous if key not in digests]
+        return Delta(hostname, command, not changed and not removed, changed, sorted(removed))
+
+    def make_rpc_call(self, device, rpc_command):
+        """
+        Run an rpc command, see IOSXR.make_rpc_call.
+
+        :param device:      Opened IOSXR instance
+        :param rpc_command: (str) rpc command
+        :return:            Delta, changed holds elements
+        """
+        return self.update(device.hostname, rpc_command, device.make_rpc_call(rpc_command, element=True))
+
+    def watch(self, device):
+        """
+        Wrap a device, so make_rpc_call() and the show methods return a Delta rather than the whole response.
+
+        The show methods compare the whole output, parse=True and stream=True raise ValueError.
+
+        :param device: Opened IOSXR instance, e.g. watch(device).show_bgp_summary()
+        :return:       The wrapped device, all other methods are passed through
+        """
+        return _Watched(self, device)
+
+    def changes(self, samples):
+        """
+        Compare the samples of a Scheduler to the previous ones of their device and job.
+
+        :param samples: Iterable of Sample, e.g. Scheduler.run()
+        :return:        Generator of (sample, Delta). The delta is None for failed samples and for samples of
+                        jobs not returning a string. Results which can not be compared, e.g. XML which does
+                        not parse, are yielded as failed samples with the error as exception.
+        """
+        for sample in samples:
+            result = sample.result
+            if sample.exception is not None or not isinstance(result, basestring):
+                yield sample, None
+                continue
+            # rpc jobs return XML, show jobs their output
+            try:
+                delta = self.update(sample.hostname, sample.job, result, xml=result.startswith('<'))
+            except Exception as e:
+                yield sample._replace(exception=e), None
+                continue
+            yield sample, delta
+
+    def forget(self, hostname=None):
+        """
+        Drop the digests of a device, its next responses are reported as changed entirely.
+
+        :param hostname: (str) Hostname of the device, None for all devices
+        """
+        with self.__lock:
+            for key in list(self.__digests):
+                if hostname is None or key[0] == hostname:
+                    del self.__digests[key]
+
+
+class _Watched(object):
+
+    def __init__(self, detector, device):
+        self.detector = detector
+        self.device = device
+
+    def make_rpc_call(self, rpc_command):
+        return self.detector.make_rpc_call(self.device, rpc_command)
+
+    def __getattr__(self, item):
+        method = getattr(self.device, item)
+        if not item.startswith('show'):
+            return method
+
+        def wrapper(*args, **kwargs):
+            # the output is compared as a whole, records and generators have no digest
+            if kwargs.get('parse') or kwargs.get('stream'):
+                raise ValueError('Watched show methods compare the whole output, parse=True and stream=True are '
+                                 'not supported, parse the output in delta.changed instead')
+            command = ' '.join([item.replace('_', ' ')] + ['%s' % arg for arg in args])
+            return self.detector.update(self.device.hostname, command, method(*args, **kwargs), xml=False)
+        return wrapper
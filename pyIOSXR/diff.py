@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Section aware diff of IOS-XR configurations."""
+
+# Copyright 2015 Netflix. All rights reserved.
+# Copyright 2016 BigWaveIT. All rights reserved.
+#
+# The contents of this file are licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the
+# License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import difflib
+import collections
+
+# A changed line: action is '+' or '-', path the headers of the stanzas the line is nested in, e.g.
+# ('router bgp 65000', 'neighbor 192.0.2.2') for ' remote-as 65001'.
+Change = collections.namedtuple('Change', ['action', 'path', 'line'])
+
+
+def split_blocks(lines, start=0, end=None, indent=0):
+    """
+    Split configuration lines into stanzas.
+
+    A stanza starts at a line indented by exactly indent spaces which is not a comment ('!') and runs up to
+    the next one, so the closing '!' belongs to the stanza it closes. Lines in front of the first stanza form
+    a block of their own.
+
+    :param lines:  List of configuration lines
+    :param start:  Index of the first line to split
+    :param end:    Index of the last line to split + 1, None for all lines
+    :param indent: (int) Indentation of the stanza headers, 0 for top-level stanzas
+    :return:       List of (first line index, last line index + 1) tuples
+    """
+    end = len(lines) if end is None else end
+    blocks = []
+    block_start = start
+    for index in range(start + 1, end):
+        line = lines[index]
+        if line[indent:indent + 1] not in ('', ' ', '!', '\r', '\n') and (not indent or line[:indent].isspace()):
+            blocks.append((block_start, index))
+            block_start = index
+    if block_start < end:
+        blocks.append((block_start, end))
+    return blocks
+
+
+# Stanzas smaller than this are diffed line by line rather than split further.
+__MIN_SPLIT__ = 32
+
+
+# Yield the opcodes of a plain line by line diff of a[a_start:a_end] and b[b_start:b_end].
+def __diff_lines__(a, b, a_start, a_end, b_start, b_end, path):
+    matcher = difflib.SequenceMatcher(None, a[a_start:a_end], b[b_start:b_end])
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != 'equal':
+            yield tag, a_start + i1, a_start + i2, b_start + j1, b_start + j2, path, a_start, b_start
+
+
+# Yield the opcodes of the line level diff of a[a_start:a_end] and b[b_start:b_end]. Both are split into
+# stanzas which are compared as a whole first; SequenceMatcher hashes them, so equal stanzas are skipped
+# cheaply. Changed stanzas are paired up by their header and diffed the same way one indentation level
+# deeper, e.g. router bgp, then neighbor, so only the lines of the innermost changed stanzas are diffed line
+# by line. Besides the opcode, the headers of the stanzas descended into and the start of the lines diffed
+# are yielded.
+def __opcodes__(a, b, a_start, a_end, b_start, b_end, indent=0, path=()):
+    if a_end - a_start < __MIN_SPLIT__ or b_end - b_start < __MIN_SPLIT__ or indent > 8:
+        for opcode in __diff_lines__(a, b, a_start, a_end, b_start, b_end, path):
+            yield opcode
+        return
+
+    a_blocks = split_blocks(a, a_start, a_end, indent)
+    b_blocks = split_blocks(b, b_start, b_end, indent)
+    if len(a_blocks) == 1 and len(b_blocks) == 1:
+        if a[a_start] == b[b_start]:
+            # a single stanza with the same header on both sides, look inside
+            for opcode in __opcodes__(a, b, a_start + 1, a_end, b_start + 1, b_end, indent + 1,
+                                      path + (a[a_start].strip(),)):
+                yield opcode
+        else:
+            for opcode in __diff_lines__(a, b, a_start, a_end, b_start, b_end, path):
+                yield opcode
+        return
+
+    a_texts = [''.join(a[start:end]) for start, end in a_blocks]
+    b_texts = [''.join(b[start:end]) for start, end in b_blocks]
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a_texts, b_texts, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            continue
+        # stanzas are contiguous, so a run of them is delimited by the starts of its stanzas plus one end
+        a_bounds = [start for start, end in a_blocks[i1:i2]] + [a_blocks[i2][0] if i2 < len(a_blocks) else a_end]
+        b_bounds = [start for start, end in b_blocks[j1:j2]] + [b_blocks[j2][0] if j2 < len(b_blocks) else b_end]
+        # pair up the changed stanzas by header, stanzas without counterpart are added or removed as a whole
+        matcher = difflib.SequenceMatcher(None, [a[start] for start in a_bounds[:-1]],
+                                          [b[start] for start in b_bounds[:-1]], autojunk=False)
+        for header_tag, k1, k2, l1, l2 in matcher.get_opcodes():
+            if header_tag == 'equal':
+                for k, l in zip(range(k1, k2), range(l1, l2)):
+                    for opcode in __opcodes__(a, b, a_bounds[k], a_bounds[k + 1], b_bounds[l], b_bounds[l + 1],
+                                              indent, path):
+                        yield opcode
+            else:
+                for opcode in __diff_lines__(a, b, a_bounds[k1], a_bounds[k2], b_bounds[l1], b_bounds[l2], path):
+                    yield opcode
+
+
+# Format a range the way difflib.unified_diff does.
+def __format_range__(start, stop):
+    length = stop - start
+    if length == 1:
+        return '%d' % (start + 1)
+    if not length:
+        return '%d,0' % start
+    return '%d,%d' % (start + 1, length)
+
+
+def unified_diff(a, b):
+    """
+    Diff two configurations.
+
+    Drop-in replacement for difflib.unified_diff(a, b, n=0) on configurations: the output has the same
+    format, but only the lines of stanzas that changed are compared with each other.
+
+    :param a: List of lines of the old configuration, including line endings
+    :param b: List of lines of the new configuration, including line endings
+    :return:  Generator of diff lines
+    """
+    started = False
+    for tag, i1, i2, j1, j2, _, _, _ in __opcodes__(a, b, 0, len(a), 0, len(b)):
+        if not started:
+            yield '--- \n'
+            yield '+++ \n'
+            started = True
+        yield '@@ -%s +%s @@\n' % (__format_range__(i1, i2), __format_range__(j1, j2))
+        for line in a[i1:i2]:
+            yield '-' + line
+        for line in b[j1:j2]:
+            yield '+' + line
+
+
+# Paths of the lines start to end, from the indentation of the lines from the start of the stanza they are in.
+def __paths__(lines, stanza_start, start, end, path):
+    paths = []
+    stack = []
+    for index in range(stanza_start, end):
+        line = lines[index].rstrip()
+        stripped = line.lstrip()
+        indent = len(line) - len(stripped)
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        if index >= start:
+            paths.append(path + tuple(header for _, header in stack))
+        if stripped and stripped != '!':
+            stack.append((indent, stripped))
+    return paths
+
+
+def changes(a, b):
+    """
+    List the changes between two configurations.
+
+    :param a: List of lines of the old configuration
+    :param b: List of lines of the new configuration
+    :return:  List of Change records
+    """
+    result = []
+    for tag, i1, i2, j1, j2, path, a_from, b_from in __opcodes__(a, b, 0, len(a), 0, len(b)):
+        for action, lines, start, end, stanza_start in (('-', a, i1, i2, a_from), ('+', b, j1, j2, b_from)):
+            for index, line_path in zip(range(start, end), __paths__(lines, stanza_start, start, end, path)):
+                line = lines[index].strip()
+                if line and line != '!':
+                    result.append(Change(action, line_path, line))
+    return result
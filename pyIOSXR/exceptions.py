@@ -52,3 +52,33 @@ class IteratorIDError(Exception):
     """IteratorIDError Exception."""
 
     pass
+
+
+class CancelledError(Exception):
+    """CancelledError Exception."""
+
+    pass
+
+
+class NoParserError(Exception):
+    """NoParserError Exception."""
+
+    pass
+
+
+class VerificationError(Exception):
+    """VerificationError Exception."""
+
+    pass
+
+
+class DeviceDownError(Exception):
+    """DeviceDownError Exception."""
+
+    pass
+
+
+class ReplayError(Exception):
+    """ReplayError Exception."""
+
+    pass
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Run jobs against many Cisco devices running IOS-XR in parallel."""
+
+# Copyright 2015 Netflix. All rights reserved.
+# Copyright 2016 BigWaveIT. All rights reserved.
+#
+# The contents of this file are licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the
+# License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import time
+import Queue
+import threading
+
+from iosxr import IOSXR
+from exceptions import TimeoutError, CancelledError
+
+
+class DeviceResult(object):
+    """The outcome of a job run against a single device."""
+
+    def __init__(self, hostname, result=None, exception=None, elapsed=0.0):
+        """
+        Result of a job for one device of the fleet.
+
+        :param hostname:  (str) Device the job was run against
+        :param result:    Return value of the job, None if it failed
+        :param exception: Exception raised by the job, None if it succeeded
+        :param elapsed:   (float) Wall time spent on the device in seconds
+        """
+        self.hostname = hostname
+        self.result = result
+        self.exception = exception
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        """True if the job completed without raising."""
+        return self.exception is None
+
+    def __repr__(self):
+        """Return a short summary of the result."""
+        state = 'ok' if self.ok else repr(self.exception)
+        return '<DeviceResult %s %s>' % (self.hostname, state)
+
+
+class Fleet:
+    """A set of IOS-XR devices jobs are run against in parallel."""
+
+    def __init__(self, inventory, username=None, password=None, workers=20, device_timeout=None, **kwargs):
+        """
+        A fleet of devices running IOS-XR.
+
+        :param inventory:      List of hostnames or dicts of IOSXR keyword arguments (at least 'hostname'),
+                               entries override the fleet wide defaults. Results are reported by hostname, so
+                               hostnames have to be unique, ValueError is raised otherwise.
+        :param username:       (str) Default username
+        :param password:       (str) Default password
+        :param workers:        (int) Maximum number of devices worked on concurrently (default: 20)
+        :param device_timeout: (int) Wall time allowed per device for open, job and close, or None for no limit.
+                               A device exceeding it is reported as TimeoutError and its session is torn down.
+        :param kwargs:         Default keyword arguments passed to IOSXR, e.g. port, timeout or lock
+        """
+        self.inventory = []
+        for entry in inventory:
+            params = dict(kwargs, username=username, password=password)
+            if isinstance(entry, dict):
+                params.update(entry)
+            else:
+                params['hostname'] = entry
+            self.inventory.append(params)
+        hostnames = set()
+        for params in self.inventory:
+            if params['hostname'] in hostnames:
+                raise ValueError('Duplicate hostname %s in the inventory' % params['hostname'])
+            hostnames.add(params['hostname'])
+        self.workers = int(workers)
+        self.device_timeout = device_timeout
+
+    def __worker__(self, pending, results, inflight, job, stop):
+        while not stop.is_set():
+            try:
+                params = pending.get_nowait()
+            except Queue.Empty:
+                return
+            hostname = params['hostname']
+            start = time.time()
+            try:
+                # invalid arguments in the inventory fail the device, not the worker
+                device = IOSXR(**params)
+            except Exception as e:
+                results.put(DeviceResult(hostname, exception=e, elapsed=time.time() - start))
+                continue
+            inflight[hostname] = (device, start)
+            # wake up run() so the device timeout is armed
+            results.put(None)
+            try:
+                device.open()
+                try:
+                    result = job(device)
+                finally:
+                    device.close()
+            except Exception as e:
+                results.put(DeviceResult(hostname, exception=e, elapsed=time.time() - start))
+            else:
+                results.put(DeviceResult(hostname, result=result, elapsed=time.time() - start))
+
+    @staticmethod
+    def __abort__(device):
+        # Closing the spawn from here makes the worker's blocking expect() fail with EOF.
+        spawn = getattr(device, 'device', None)
+        if spawn is not None:
+            try:
+                spawn.close(force=True)
+            except Exception:
+                pass
+
+    @staticmethod
+    def __job__(job):
+        # A list of rpc commands is turned into a job sending them.
+        if callable(job):
+            return job
+        rpc_commands = list(job)
+
+        def rpc_job(device):
+            return [device.make_rpc_call(rpc_command) for rpc_command in rpc_commands]
+        return rpc_job
+
+    def __start__(self, job):
+        # Queue every device and start the workers, returns the queues shared with them.
+        pending = Queue.Queue()
+        for params in self.inventory:
+            pending.put(params)
+        results = Queue.Queue()
+        inflight = {}
+        stop = threading.Event()
+        for _ in range(min(self.workers, len(self.inventory))):
+            worker = threading.Thread(target=self.__worker__, args=(pending, results, inflight, job, stop))
+            worker.daemon = True
+            worker.start()
+        return pending, results, inflight, stop
+
+    def __receive__(self, results, start, deadline, inflight, reported):
+        # Wait for the next result of a worker, up to the next deadline or device timeout. None if there is none.
+        wakeups = []
+        if deadline is not None:
+            wakeups.append(start + deadline)
+        if self.device_timeout is not None:
+            wakeups.extend(started + self.device_timeout for hostname, (device, started) in inflight.items()
+                           if hostname not in reported)
+        try:
+            return results.get(timeout=max(min(wakeups) - time.time(), 0) if wakeups else None)
+        except Queue.Empty:
+            return None
+
+    @staticmethod
+    def __drain__(pending):
+        # Take the devices not started yet off the queue, so no worker starts them, returns them.
+        drained = []
+        while True:
+            try:
+                drained.append(pending.get_nowait())
+            except Queue.Empty:
+                return drained
+
+    def __unfinished__(self, pending, inflight, reported, stopped, now):
+        # Devices to report as failed now, as (hostname, exception): all unfinished ones once the run stopped,
+        # otherwise those over the device timeout.
+        if stopped:
+            cancelled = [(params['hostname'], CancelledError(str(stopped))) for params in self.__drain__(pending)]
+            return cancelled + [(hostname, stopped) for hostname in list(inflight) if hostname not in reported]
+        if self.device_timeout is None:
+            return []
+        return [(hostname, TimeoutError('Device timeout of %s sec exceeded' % self.device_timeout))
+                for hostname, (device, started) in list(inflight.items())
+                if hostname not in reported and now >= started + self.device_timeout]
+
+    def __finish__(self, inflight, reported, hostname, exception, start):
+        # Report an unfinished device as failed, tearing down its session if it has one.
+        device, started = inflight.get(hostname, (None, start))
+        self.__abort__(device)
+        reported.add(hostname)
+        return DeviceResult(hostname, exception=exception, elapsed=time.time() - started)
+
+    def run(self, job, deadline=None, fail_fast=False):
+        """
+        Run a job against every device of the fleet.
+
+        Yields exactly one DeviceResult per device in the order the devices complete. Closing the generator
+        early, e.g. breaking out of the loop over it, starts no further devices, the devices already started
+        finish their job.
+
+        :param job:       Callable taking an opened IOSXR instance, or a list of rpc commands sent with make_rpc_call
+        :param deadline:  (int) Wall time in seconds for the whole run. Devices not done by then are reported as
+                          TimeoutError (running) or CancelledError (not started).
+        :param fail_fast: (bool) Stop on the first failed device and report all other unfinished devices as
+                          CancelledError if True, run every device regardless of failures if False (default: False)
+        """
+        pending, results, inflight, stop = self.__start__(self.__job__(job))
+        start = time.time()
+        reported = set()
+        stopped = False
+        try:
+            while len(reported) < len(self.inventory):
+                result = self.__receive__(results, start, deadline, inflight, reported)
+                if result is not None and result.hostname not in reported:
+                    reported.add(result.hostname)
+                    yield result
+                    if fail_fast and not result.ok:
+                        stopped = CancelledError('Cancelled after %s failed' % result.hostname)
+
+                now = time.time()
+                if deadline is not None and now >= start + deadline and not stopped:
+                    stopped = TimeoutError('Fleet deadline of %s sec exceeded' % deadline)
+                for hostname, exception in self.__unfinished__(pending, inflight, reported, stopped, now):
+                    yield self.__finish__(inflight, reported, hostname, exception, start)
+        finally:
+            # also reached when the caller closes the generator early
+            stop.set()
+            self.__drain__(pending)
+
+    def run_all(self, job, deadline=None, fail_fast=False):
+        """
+        Run a job against every device of the fleet and wait for all of them.
+
+        Same arguments as run().
+
+        :return: dict of hostname to DeviceResult
+        """
+        return dict((result.hostname, result) for result in self.run(job, deadline=deadline, fail_fast=fail_fast))
@@ -17,40 +17,130 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
-import re
-import difflib
+import os
+import math
+import time
+import socket
+import weakref
 import pexpect
+import diff
+import cache
+import parsers
+from backend import get_backend
+from transport import PORTS, connect_socket, connect_ssh
+from timeouts import OPEN
+from recording import RecordingWriter, RecordingTransport
 from exceptions import XMLCLIError, InvalidInputError, TimeoutError, EOFError, IteratorIDError
 
-import xml.etree.ElementTree as ET
 
+# Wrap an rpc command into a xml request.
+def __build_request__(rpc_command):
+    return '<?xml version="1.0" encoding="UTF-8"?><Request MajorVersion="1" MinorVersion="0">' \
+           + rpc_command + '</Request>'
+
+
+# Number of responses still to come on a connection, of calls which timed out before their response arrived.
+__STALE__ = weakref.WeakKeyDictionary()
 
-# Build and execute xml requests.
-def __execute_rpc__(device, rpc_command, timeout):
-    rpc_command = '<?xml version="1.0" encoding="UTF-8"?><Request MajorVersion="1" MinorVersion="0">' \
-                  + rpc_command + '</Request>'
-    try:
-        device.sendline(rpc_command)
-        index = device.expect_exact(["</Response>", "ERROR: 0xa240fe00"], timeout=timeout)
-        if index == 1:
-            raise XMLCLIError('The XML document is not well-formed')
-    except pexpect.TIMEOUT:
-        raise TimeoutError("pexpect timeout error")
-    except pexpect.EOF:
-        raise EOFError("pexpect EOF error")
 
-    # remove leading XML-agent prompt
-    response_assembled = device.before+device.match
-    response = re.sub('^[^<]*', '', response_assembled)
+# Note that the response of a call which timed out may still arrive on a connection.
+def __timed_out__(device):
+    __STALE__[device] = __STALE__.get(device, 0) + 1
 
-    root = ET.fromstring(response)
-    if 'IteratorID' in root.attrib:
+
+# Read and drop the late responses of calls which timed out, so the next response read is the one of the next call.
+def __drain__(device, timeout):
+    while __STALE__.get(device):
+        try:
+            device.expect_exact(["</Response>", "ERROR: 0xa240fe00"], timeout=timeout)
+        except pexpect.TIMEOUT:
+            raise TimeoutError("pexpect timeout error, the response of an earlier call is still outstanding")
+        except pexpect.EOF:
+            raise EOFError("pexpect EOF error")
+        __STALE__[device] -= 1
+
+
+# Build and execute xml requests. If a recorder is given, it sets the timeout of the call, and the duration of
+# each phase of the call, the size of request and response and the error raised, if any, are recorded. If raw
+# is set, the response is returned as the string received instead of the parsed element. The response is
+# parsed with the given XML backend, the default backend if None.
+def __execute_rpc__(device, rpc_command, timeout, check=True, iterator=False, recorder=None, raw=False,
+                    backend=None):
+    request = __build_request__(rpc_command)
+    if recorder is not None:
+        timeout = recorder.timeout(rpc_command, timeout)
+    stamps = [time.time()] if recorder is not None else None
+    received = 0
+    error = None
+    try:
+        __drain__(device, timeout)
+        try:
+            device.sendline(request)
+            __stamp__(stamps)
+            index = device.expect_exact(["</Response>", "ERROR: 0xa240fe00"], timeout=timeout)
+            __stamp__(stamps)
+            if index == 1:
+                raise XMLCLIError('The XML document is not well-formed')
+        except pexpect.TIMEOUT:
+            __timed_out__(device)
+            raise TimeoutError("pexpect timeout error")
+        except pexpect.EOF:
+            raise EOFError("pexpect EOF error")
+
+        # before and match are parsed one after the other rather than concatenated, which would copy the response
+        received = len(device.before) + len(device.match)
+        root = __parse_response__(device.before, request, check, iterator, stamps, device.match, backend)
+        if raw:
+            return device.before[device.before.find('<'):] + device.match
+        return root
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        if recorder is not None:
+            recorder.record(rpc_command, stamps, len(request) + 1, received, error)
+
+
+# Note the end of a phase of a recorded rpc call.
+def __stamp__(stamps):
+    if stamps is not None:
+        stamps.append(time.time())
+
+
+# Parse a xml response and raise on errors reported by the device if check is set. Responses with an
+# IteratorID are only accepted if iterator is set. The response may be passed in two parts, the second one
+# is appended to the first.
+def __parse_response__(response_assembled, rpc_command, check=True, iterator=False, stamps=None, tail='',
+                       backend=None):
+    # skip leading XML-agent prompt, the rest is parsed in place without copying it
+    start = response_assembled.find('<')
+    if start == -1:
+        start = len(response_assembled)
+    __stamp__(stamps)
+
+    backend = backend or get_backend()
+    parser = backend.XMLParser()
+    backend.feed(parser, response_assembled, start)
+    if tail:
+        parser.feed(tail)
+    root = parser.close()
+    __stamp__(stamps)
+    if 'IteratorID' in root.attrib and not iterator:
         raise IteratorIDError("Non supported IteratorID in Response object. \
-Turn iteration off on your XML agent by configuring 'xml agent [tty | ssl] iteration off'. \
+Use iter_rpc() to fetch the response in chunks, or \
+turn iteration off on your XML agent by configuring 'xml agent [tty | ssl] iteration off'. \
 For more information refer to \
 http://www.cisco.com/c/en/us/td/docs/ios_xr_sw/iosxr_r4-1/xml/programming/guide/xl41apidoc.pdf, \
 7-99.Turn iteration off on your XML agent.")
 
+    if check:
+        __check_response__(root, rpc_command)
+    __stamp__(stamps)
+    return root
+
+
+# Raise on errors reported in a xml response.
+def __check_response__(root, rpc_command):
     childs = [x.tag for x in list(root)]
 
     result_summary = root.find('ResultSummary')
@@ -76,47 +166,384 @@ http://www.cisco.com/c/en/us/td/docs/ios_xr_sw/iosxr_r4-1/xml/programming/guide/
             elif 'Invalid input detected' in output:
                 raise InvalidInputError('Invalid input entered:\n%s' % output)
 
-    return root
+
+# Raise on errors reported for a single operation of a batched xml response.
+def __check_operation__(operation, rpc_command):
+    for element in operation.iter():
+        if 'ErrorCode' in element.attrib:
+            error_msg = element.get('ErrorMsg') or ''
+            error_msg += '\nOriginal call was: %s' % rpc_command
+            raise XMLCLIError(error_msg)
+
+    if operation.tag == 'CLI' and operation.find('Configuration') is not None:
+        output = operation.find('Configuration').text or ''
+        if 'Invalid input detected' in output:
+            raise InvalidInputError('Invalid input entered:\n%s' % output)
+
+
+# Execute several rpc commands in as few requests as possible.
+def __execute_rpcs__(device, rpc_commands, timeout, batch_size=None, recorder=None, backend=None):
+    backend = backend or get_backend()
+    rpc_commands = list(rpc_commands)
+    batch_size = batch_size or len(rpc_commands) or 1
+    results = []
+    for start in range(0, len(rpc_commands), batch_size):
+        batch = rpc_commands[start:start+batch_size]
+        # an rpc command may consist of several operations, e.g. <Unlock/><Rollback>...</Rollback><Lock/>
+        counts = [len(backend.fromstring('<Batch>' + rpc_command + '</Batch>')) for rpc_command in batch]
+        root = __execute_rpc__(device, ''.join(batch), timeout, check=False, recorder=recorder, backend=backend)
+        operations = [child for child in root if child.tag != 'ResultSummary']
+        if len(operations) != sum(counts):
+            __check_response__(root, __build_request__(''.join(batch)))
+            raise XMLCLIError('Expected %d operations in response, got %d' % (sum(counts), len(operations)))
+        offset = 0
+        for rpc_command, count in zip(batch, counts):
+            items = operations[offset:offset+count]
+            offset += count
+            try:
+                for item in items:
+                    __check_operation__(item, rpc_command)
+            except (XMLCLIError, InvalidInputError) as e:
+                results.append(e)
+            else:
+                results.append(''.join(backend.tostring(item) for item in items))
+    return results
+
+
+# Parser target building the response tree, detaching elements with a given tag and text of a given
+# element as soon as they are complete. The elements are built by the given XML backend, the default if None.
+class __StreamTarget__(object):
+
+    def __init__(self, tag=None, text_of=None, backend=None):
+        self.backend = backend or get_backend()
+        self.builder = self.backend.TreeBuilder()
+        self.tag = tag
+        self.text_of = text_of
+        self.root = None
+        self.stack = []
+        self.ready = []
+        self.text = None
+
+    def start(self, tag, attrib):
+        element = self.builder.start(tag, attrib)
+        if self.root is None:
+            self.root = element
+        self.stack.append(element)
+        if tag == self.text_of:
+            self.text = ''
+        return element
+
+    def end(self, tag):
+        element = self.builder.end(tag)
+        self.stack.pop()
+        if tag == self.tag:
+            self.ready.append(element)
+            if self.stack:
+                self.stack[-1].remove(element)
+        elif tag == self.text_of:
+            self.ready.append(self.text)
+            self.text = None
+        return element
+
+    def data(self, data):
+        if self.text is None:
+            self.builder.data(data)
+            return
+        lines = (self.text + data).split('\n')
+        self.text = lines.pop()
+        self.ready.extend(lines)
+
+    def close(self):
+        return self.builder.close()
+
+    def pop(self):
+        ready, self.ready = self.ready, []
+        return ready
+
+
+# Read the next chunk of a response.
+def __read_chunk__(device, timeout):
+    try:
+        return device.read_nonblocking(65536, timeout)
+    except pexpect.TIMEOUT:
+        raise TimeoutError("pexpect timeout error")
+    except pexpect.EOF:
+        raise EOFError("pexpect EOF error")
+
+
+# Build and execute a xml request, feeding the response to the parser target as it arrives and yielding
+# whatever the target has ready. Memory use is bounded by the chunk size and the part of the tree kept.
+def __stream_rpc__(device, rpc_command, timeout, target, recorder=None):
+    if recorder is not None:
+        timeout = recorder.timeout(rpc_command, timeout)
+    stamps = [time.time()] if recorder is not None else None
+    received = 0
+    error = None
+    request = __build_request__(rpc_command)
+    parser = target.backend.XMLParser(target=target)
+    started = False
+    finished = False
+    tail = ''
+    __drain__(device, timeout)
+    try:
+        device.sendline(request)
+    except pexpect.TIMEOUT:
+        __timed_out__(device)
+        raise TimeoutError("pexpect timeout error")
+    except (OSError, IOError):
+        raise EOFError("pexpect EOF error")
+    __stamp__(stamps)
+    try:
+        while not finished:
+            try:
+                chunk = __read_chunk__(device, timeout)
+            except TimeoutError:
+                finished = True
+                __timed_out__(device)
+                raise
+            except EOFError:
+                finished = True
+                raise
+            received += len(chunk)
+            window = tail + chunk
+            if "ERROR: 0xa240fe00" in window:
+                finished = True
+                raise XMLCLIError('The XML document is not well-formed')
+            end = window.find("</Response>")
+            if end != -1:
+                chunk = chunk[:end + len("</Response>") - len(tail)]
+                finished = True
+            tail = window[-len("ERROR: 0xa240fe00"):]
+            if not started:
+                # skip the XML-agent prompt
+                start = chunk.find('<')
+                if start == -1:
+                    continue
+                chunk = chunk[start:]
+                started = True
+            parser.feed(chunk)
+            if target.root is not None and 'IteratorID' in target.root.attrib:
+                raise IteratorIDError("Non supported IteratorID in Response object. \
+Turn iteration off on your XML agent by configuring 'xml agent [tty | ssl] iteration off'.")
+            for item in target.pop():
+                yield item
+        parser.close()
+        __check_response__(target.root, request)
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        # drain the rest of the response if the consumer stopped early, so the session stays usable
+        while not finished:
+            try:
+                chunk = __read_chunk__(device, timeout)
+            except TimeoutError:
+                __timed_out__(device)
+                raise
+            received += len(chunk)
+            finished = "</Response>" in tail + chunk
+            tail = (tail + chunk)[-len("</Response>"):]
+        if recorder is not None:
+            __stamp__(stamps)
+            recorder.record(rpc_command, stamps, len(request) + 1, received, error)
+
+    for item in target.pop():
+        yield item
 
 
 # Ecexute show commands not in config context.
-def __execute_show__(device, show_command, timeout):
+def __execute_show__(device, show_command, timeout, recorder=None, backend=None):
     rpc_command = '<CLI><Exec>'+show_command+'</Exec></CLI>'
-    response = __execute_rpc__(device, rpc_command, timeout)
+    response = __execute_rpc__(device, rpc_command, timeout, recorder=recorder, backend=backend)
     return response.find('CLI').find('Exec').text.lstrip()
 
 
 # Ecexute show commands not in config context.
-def __execute_config_show__(device, show_command, timeout):
+def __execute_config_show__(device, show_command, timeout, recorder=None, backend=None):
     rpc_command = '<CLI><Configuration>'+show_command+'</Configuration></CLI>'
-    response = __execute_rpc__(device, rpc_command, timeout)
+    response = __execute_rpc__(device, rpc_command, timeout, recorder=recorder, backend=backend)
     return response.find('CLI').find('Configuration').text.lstrip()
 
 
+# Retrieve the running config, from the config cache if nothing was committed since it was cached.
+def __running_config__(device, hostname, timeout, config_cache=None, recorder=None, backend=None):
+    if config_cache is None:
+        return __execute_config_show__(device, 'show running-config', timeout, recorder, backend)
+    output = __execute_show__(device, cache.COMMIT_LIST_COMMAND, timeout, recorder, backend)
+    commit_id = cache.parse_commit_id(output)
+    show_run = config_cache.get(hostname, commit_id)
+    if show_run is None:
+        show_run = __execute_config_show__(device, 'show running-config', timeout, recorder, backend)
+        config_cache.put(hostname, commit_id, show_run)
+    return show_run
+
+
+# Top-level stanzas closed by an end-* line rather than by the next top-level line: route policies (end-policy),
+# prefix, as-path, community and other sets (end-set), policy-global (end-global) and config groups (end-group).
+__BLOCK_OPENERS__ = ('route-policy', 'policy-global', 'group')
+
+
+# Delimiter of a banner opened by line, e.g. banner motd ^ for a text ending with the next ^, None if the whole
+# banner is on that line. The text of a banner may start lines at column 0, it only ends with its delimiter.
+def __banner_delimiter__(line):
+    words = line.split(None, 2)
+    if len(words) < 3:
+        return None
+    text = words[2].rstrip('\r\n')
+    # the delimiter ^C is shown as these two characters
+    delimiter = '^C' if text.startswith('^C') else text[0]
+    if delimiter in text[len(delimiter):]:
+        return None
+    return delimiter
+
+
+# Group configuration lines into chunks of about chunk_size bytes, split at top-level stanzas only. A stanza
+# larger than chunk_size makes up a chunk of its own, as its lines depend on its header. Blocks closed by an
+# end-* line are never split, even where their lines are at the top level, and the end-* line belongs to them.
+def __config_chunks__(lines, chunk_size):
+    chunk = []
+    size = 0
+    stanza = []
+    stanza_size = 0
+    block = False
+    banner = None
+    for line in lines:
+        top = line[:1] not in ('', ' ', '!', '\r', '\n', '\t')
+        if banner is not None:
+            top = False
+            if banner in line:
+                banner = None
+        elif top and line.startswith('end-'):
+            top = block = False
+        elif block:
+            top = False
+        if top and stanza:
+            if chunk and size + stanza_size > chunk_size:
+                yield ''.join(chunk)
+                chunk, size = [], 0
+            chunk.extend(stanza)
+            size += stanza_size
+            stanza, stanza_size = [], 0
+        if top:
+            keyword = line.split(None, 1)[0]
+            block = keyword in __BLOCK_OPENERS__ or keyword.endswith('-set')
+            banner = __banner_delimiter__(line) if keyword == 'banner' else None
+        stanza.append(line)
+        stanza_size += len(line)
+    if chunk and size + stanza_size > chunk_size:
+        yield ''.join(chunk)
+        chunk = []
+    chunk.extend(stanza)
+    if chunk:
+        yield ''.join(chunk)
+
+
+# Build commit requests.
+def __build_commit__(replace=False, label=None, comment=None, confirmed=None):
+    rpc_command = '<Commit'
+    if replace:
+        rpc_command += ' Replace="true"'
+    if label:
+        rpc_command += ' Label="%s"' % label
+    if comment:
+        rpc_command += ' Comment="%s"' % comment
+    if confirmed:
+        if 30 <= int(confirmed) <= 300:
+            rpc_command += ' Confirmed="%d"' % int(confirmed)
+        else:
+            raise InvalidInputError('confirmed needs to be between 30 and 300')
+    rpc_command += '/>'
+    return rpc_command
+
+
+# Diff the running config against the merged candidate config.
+def __diff_config__(show_run, show_merge, structured=False):
+    show_run = show_run.splitlines(1)[2:-2]
+    show_merge = show_merge.splitlines(1)[2:-2]
+    if structured:
+        return diff.changes(show_run, show_merge)
+    return ''.join([x.replace('\r', '') for x in diff.unified_diff(show_run, show_merge)])
+
+
+# Strip everything in front of the configuration from show command output.
+def __strip_show_output__(response):
+    # same as re.search(".*(!! IOS XR Configuration.*)</Exec>", response, re.DOTALL), which takes quadratic
+    # time on output without a match
+    end = response.rfind('</Exec>')
+    start = response.rfind('!! IOS XR Configuration', 0, end)
+    if end != -1 and start != -1:
+        response = response[start:end]
+    return response
+
+
+# Strip the header and the final end from the output of show configuration changes, leaving the changed lines.
+def __config_changes__(response):
+    return ''.join(line for line in response.splitlines(True)
+                   if line.strip() and line.rstrip() != 'end' and not line.startswith(('Building configuration',
+                                                                                       '!! ')))
+
+
 class IOSXR:
     """A class to interact with Cisco devices running IOS-XR."""
 
-    def __init__(self, hostname, username, password, port=22, timeout=60, logfile=None, lock=True):
+    def __init__(self, hostname, username, password, port=None, timeout=60, logfile=None, lock=True,
+                 config_cache=None, stats=None, xml_backend=None, transport='ssh', ca_certs=None, timeouts=None,
+                 record=None, replay=None):
         """
         A device running IOS-XR.
 
         :param hostname:  (str) IP or FQDN of the device you want to connect to
         :param username:  (str) Username
         :param password:  (str) Password
-        :param port:      (int) SSH Port (default: 22)
+        :param port:      (int) Port, None for the default of the transport: 22 for ssh and paramiko, 38751
+                          for tcp and 38752 for ssl (default: None)
         :param timeout:   (int) Timeout (default: 60 sec)
         :param logfile:   File-like object to save device communication to or None to disable logging
         :param lock:      (bool) Auto-lock config upon open() if set to True, connect without locking if False
                           (default: True)
+        :param config_cache: ConfigCache to keep the running config in, so compare_config() only
+                             transfers it again after a commit. None to retrieve it every time (default: None)
+        :param stats:     RPCStats to record the duration and size of every rpc call in, may be shared by
+                          several devices. None to disable (default: None)
+        :param xml_backend: (str) XML library to parse the responses with, 'lxml', 'cElementTree' or
+                            'ElementTree'. None for the default of pyIOSXR.backend.set_backend(), which is
+                            ElementTree unless set (default: None)
+        :param transport: (str) How to reach the XML agent: 'ssh' runs the ssh binary with pexpect, 'paramiko'
+                          opens an ssh channel in process, 'tcp' and 'ssl' connect to the dedicated XML agent
+                          ('xml agent' and 'xml agent ssl' on the device) directly (default: 'ssh')
+        :param ca_certs:  (str) File with the certificates to verify the device with when using the ssl
+                          transport. None to accept any certificate (default: None)
+        :param timeouts:  Timeouts setting the timeout per rpc kind, learning it from the latency of the device
+                          and failing calls right away while the device is taken as down, may be shared by
+                          several devices. None to use timeout for every call (default: None)
+        :param record:    (str) File to record the requests and responses of the session in, overwritten by every
+                          open(), see pyIOSXR.recording.Recording. None to disable (default: None)
+        :param replay:    Replay serving a recorded session instead of connecting to the device, the transport is
+                          not used then. None to connect to the device (default: None)
         """
+        if transport not in PORTS:
+            raise ValueError('Unknown transport %s, use one of %s' % (transport, ', '.join(sorted(PORTS))))
         self.hostname = str(hostname)
         self.username = str(username)
         self.password = str(password)
-        self.port = int(port)
+        self.port = int(port) if port is not None else PORTS[transport]
         self.timeout = int(timeout)
         self.logfile = logfile
         self.lock_on_connect = lock
         self.locked = False
+        self.config_cache = config_cache
+        self.stats = stats
+        self.timeouts = timeouts
+        self.recorder = stats.recorder(self.hostname) if stats is not None else None
+        if timeouts is not None:
+            self.recorder = timeouts.recorder(self.hostname, self.recorder)
+        self.backend = get_backend(xml_backend) if xml_backend is not None else None
+        self.transport = transport
+        self.ca_certs = ca_certs
+        self.record = record
+        self.replay = replay
+        # set by a commit with confirmed until the commit confirming it, or a rollback
+        self.pending_confirm = False
 
     def __getattr__(self, item):
         """
@@ -134,6 +561,10 @@ class IOSXR:
         keyword params for show command:
           config=True/False :   set True to run show command in config mode
           eg: .show_configuration_merge(config=True)
+          stream=True/False :   set True to get a generator yielding the output line by line as it arrives
+          eg: .show_running_config(stream=True)
+          parse=True/False :    set True to get records from the parser registered in pyIOSXR.parsers
+          eg: .show_interfaces(parse=True)
 
         """
         def wrapper(*args, **kwargs):
@@ -141,62 +572,218 @@ class IOSXR:
             for arg in args:
                 cmd += " %s" % arg
 
+            if kwargs.get("parse"):
+                kwargs = dict(kwargs, parse=False, stream=True)
+                return parsers.parse(cmd, wrapper(*args, **kwargs))
+            if kwargs.get("stream"):
+                return self.stream_show(cmd, config=kwargs.get("config"))
             if kwargs.get("config"):
-                response = __execute_config_show__(self.device, cmd, self.timeout)
+                response = __execute_config_show__(self.device, cmd, self.timeout, self.recorder, self.backend)
             else:
-                response = __execute_show__(self.device, cmd, self.timeout)
-
-            match = re.search(".*(!! IOS XR Configuration.*)</Exec>", response, re.DOTALL)
+                response = __execute_show__(self.device, cmd, self.timeout, self.recorder, self.backend)
 
-            if match is not None:
-                response = match.group(1)
-            return response
+            return __strip_show_output__(response)
 
         if item.startswith('show'):
             return wrapper
         else:
             raise AttributeError("type object '%s' has no attribute '%s'" % (self.__class__.__name__, item))
 
-    def make_rpc_call(self, rpc_command):
+    def make_rpc_call(self, rpc_command, element=False, raw=False):
         """
         Allow a user to query a device directly using XML-requests.
 
+        The response is returned serialized again by the XML backend by default. For large responses it is cheaper
+        to get the parsed element, or the response exactly as the device sent it, which saves the serialization.
+
         :param rpc_command: (str) rpc command such as:
                                   <Get><Operational><LLDP><NodeTable></NodeTable></LLDP></Operational></Get>
+        :param element:     (bool) Return the Response element instead of a string (default: False)
+        :param raw:         (bool) Return the response as received from the device, from the XML declaration
+                            to </Response> (default: False)
+        """
+        result = __execute_rpc__(self.device, rpc_command, self.timeout, recorder=self.recorder, raw=raw,
+                                 backend=self.backend)
+        if raw or element:
+            return result
+        return (self.backend or get_backend()).tostring(result)
+
+    def query(self, query, factory=None):
+        """
+        Run a Get query and decode the response.
+
+        :param query:   pyIOSXR.query.Query, e.g. Query('Interfaces/InterfaceTable/Interface',
+                        keys={'InterfaceName': 'GigabitEthernet0/0/0/0'}, fields=['State', 'MTU'])
+        :param factory: Callable turning the dict of every element into the record to return
+        :return:        List of the decoded elements at the path of the query, see Query.decode
+        """
+        return query.decode(self.make_rpc_call(query.rpc_command, element=True), factory)
+
+    def iter_rpc(self, rpc_command):
         """
-        result = __execute_rpc__(self.device, rpc_command, self.timeout)
-        return ET.tostring(result)
+        Query a device using a XML-request and fetch large responses in chunks on demand.
+
+        If iteration is enabled on the XML agent ('xml agent [tty | ssl] iteration on size <kbytes>'), the
+        device returns large responses in chunks with an IteratorID. The next chunk is requested with GetNext
+        only once the previous one has been consumed. If the consumer stops early the iterator on the device
+        is aborted, so the rest of the response is never transferred.
+
+        :param rpc_command: (str) rpc command, see make_rpc_call
+        :return:            Generator of ElementTree.Element objects, one Response element per chunk
+        """
+        root = __execute_rpc__(self.device, rpc_command, self.timeout, iterator=True, recorder=self.recorder,
+                               backend=self.backend)
+        iterator_id = root.get('IteratorID')
+        try:
+            while True:
+                yield root
+                if iterator_id is None:
+                    return
+                root = __execute_rpc__(self.device, '<GetNext IteratorID="%s"/>' % iterator_id, self.timeout,
+                                       iterator=True, recorder=self.recorder, backend=self.backend)
+                iterator_id = root.get('IteratorID')
+        except GeneratorExit:
+            if iterator_id is not None:
+                __execute_rpc__(self.device, '<GetNext IteratorID="%s" Abort="true"/>' % iterator_id, self.timeout,
+                                iterator=True, recorder=self.recorder, backend=self.backend)
+            raise
+
+    def stream_rpc_call(self, rpc_command, tag):
+        """
+        Query a device using a XML-request and process the response while it arrives.
+
+        Elements with the given tag are yielded as soon as they are complete and detached from the response
+        tree, so memory use does not grow with the size of the response. Errors reported by the device in the
+        result summary are raised once the response is complete.
+
+        :param rpc_command: (str) rpc command, see make_rpc_call
+        :param tag:         (str) Tag of the elements to yield, e.g. 'Entry' or 'Neighbor'
+        :return:            Generator of ElementTree.Element objects
+        """
+        return __stream_rpc__(self.device, rpc_command, self.timeout, __StreamTarget__(tag=tag, backend=self.backend),
+                              self.recorder)
+
+    def stream_show(self, show_command, config=False):
+        """
+        Run a show command and yield its output line by line while it arrives.
+
+        Used by the show_* methods when called with stream=True.
+
+        :param show_command: (str) show command, e.g. 'show running-config'
+        :param config:       (bool) Run the show command in config mode
+        :return:             Generator of output lines without line endings
+        """
+        kind = 'Configuration' if config else 'Exec'
+        rpc_command = '<CLI><'+kind+'>'+show_command+'</'+kind+'></CLI>'
+        target = __StreamTarget__(text_of=kind, backend=self.backend)
+        lines = __stream_rpc__(self.device, rpc_command, self.timeout, target, self.recorder)
+        leading = True
+        for line in lines:
+            line = line.rstrip('\r')
+            if leading and not line.strip():
+                continue
+            leading = False
+            yield line
+
+    def make_rpc_calls(self, rpc_commands, batch_size=None):
+        """
+        Send several XML-requests in a single round-trip.
+
+        The operations are packed into one <Request> and the response is split up again per rpc command.
+        An error of one rpc command does not affect the others, its place in the result holds the exception
+        (XMLCLIError or InvalidInputError) instead.
+
+        :param rpc_commands: List of rpc commands (str) as accepted by make_rpc_call
+        :param batch_size:   (int) Maximum number of rpc commands per request, None to send all at once
+        :return:             List with the xml of the operations of each rpc command (str), or the exception
+        """
+        return __execute_rpcs__(self.device, rpc_commands, self.timeout, batch_size, self.recorder, self.backend)
 
     def open(self):
         """
         Open a connection to an IOS-XR device.
 
-        Connects to the device using SSH (pexpect) and drops into XML mode.
+        Connects to the device using SSH (pexpect) and drops into XML mode, or logs in to the dedicated XML
+        agent with the tcp and ssl transports.
         """
-        device = pexpect.spawn('ssh -o ConnectTimeout={} -p {} {}@{}'.format(self.timeout, self.port, self.username,
-                               self.hostname), logfile=self.logfile)
+        if self.timeouts is None:
+            device = self.__connect__(self.timeout)
+        else:
+            timeout = self.timeouts.timeout(self.hostname, OPEN, self.timeout)
+            start = time.time()
+            try:
+                device = self.__connect__(timeout)
+            except Exception as e:
+                self.timeouts.record(self.hostname, OPEN, time.time() - start, e)
+                raise
+            self.timeouts.record(self.hostname, OPEN, time.time() - start)
+        # pexpect sleeps 50ms before every send to let password prompts turn echo off, the XML agent does not
+        # need that and it would add up to most of the time spent on small requests
+        device.delaybeforesend = None
+        # pexpect reads with select() by default, which fails on file descriptors from 1024 up
+        device.use_poll = True
+        if self.record is not None:
+            device = RecordingTransport(device, RecordingWriter(self.record, self.hostname))
+        self.device = device
+        if self.lock_on_connect:
+            self.lock()
+
+    # Connect and log in to the XML agent, returns the connection.
+    def __connect__(self, timeout):
+        if self.replay is not None:
+            # recordings start after the login
+            return self.replay.connect(self.logfile, timeout)
+        device = self.__spawn__(timeout)
         try:
-            index = device.expect(['\(yes\/no\)\?', 'password:', '#', pexpect.EOF], timeout=self.timeout)
-            if index == 0:
-                device.sendline('yes')
-                index = device.expect(['\(yes\/no\)\?', 'password:', '#', pexpect.EOF], timeout=self.timeout)
-            if index == 1:
-                device.sendline(self.password)
-            elif index == 3:
-                pass
-            if index != 2:
-                device.expect('#', timeout=self.timeout)
-            device.sendline('xml')
-            index = device.expect(['XML>', 'ERROR: 0x24319600'], timeout=self.timeout)
-            if index == 1:
-                raise XMLCLIError('XML TTY agent has not been started. Please configure \'xml agent tty\'.')
+            if self.transport in ('tcp', 'ssl'):
+                self.__login__(device, timeout)
+            else:
+                index = device.expect(['\(yes\/no\)\?', 'password:', '#', pexpect.EOF], timeout=timeout)
+                if index == 0:
+                    device.sendline('yes')
+                    index = device.expect(['\(yes\/no\)\?', 'password:', '#', pexpect.EOF], timeout=timeout)
+                if index == 1:
+                    device.sendline(self.password)
+                elif index == 3:
+                    pass
+                if index != 2:
+                    device.expect('#', timeout=timeout)
+                device.sendline('xml')
+                index = device.expect(['XML>', 'ERROR: 0x24319600'], timeout=timeout)
+                if index == 1:
+                    raise XMLCLIError('XML TTY agent has not been started. Please configure \'xml agent tty\'.')
         except pexpect.TIMEOUT:
             raise TimeoutError("pexpect timeout error")
         except pexpect.EOF:
             raise EOFError("pexpect EOF error")
-        self.device = device
-        if self.lock_on_connect:
-            self.lock()
+        return device
+
+    # Start the connection of the transport.
+    def __spawn__(self, timeout=None):
+        timeout = timeout if timeout is not None else self.timeout
+        try:
+            if self.transport == 'paramiko':
+                return connect_ssh(self.hostname, self.port, self.username, self.password, timeout, self.logfile)
+            if self.transport in ('tcp', 'ssl'):
+                return connect_socket(self.hostname, self.port, timeout, self.transport == 'ssl', self.ca_certs,
+                                      self.logfile)
+        except socket.timeout:
+            raise TimeoutError("connect timeout error")
+        except socket.error as e:
+            raise EOFError("connect error: %s" % e)
+        return pexpect.spawn('ssh -o ConnectTimeout={} -p {} {}@{}'.format(int(math.ceil(timeout)), self.port,
+                             self.username, self.hostname), logfile=self.logfile)
+
+    # Log in to the dedicated XML agent, which prompts for username and password unless configured not to.
+    def __login__(self, device, timeout):
+        index = device.expect_exact(['Username:', 'XML>'], timeout=timeout)
+        if index == 0:
+            device.sendline(self.username)
+            device.expect_exact('Password:', timeout=timeout)
+            device.sendline(self.password)
+            index = device.expect_exact(['XML>', 'Username:'], timeout=timeout)
+            if index == 1:
+                raise XMLCLIError('Login to the XML agent failed, check username and password.')
 
     def close(self):
         """
@@ -216,7 +803,7 @@ class IOSXR:
         """
         if not self.locked:
             rpc_command = '<Lock/>'
-            __execute_rpc__(self.device, rpc_command, self.timeout)
+            __execute_rpc__(self.device, rpc_command, self.timeout, recorder=self.recorder, backend=self.backend)
             self.locked = True
 
     def unlock(self):
@@ -227,10 +814,10 @@ class IOSXR:
         """
         if self.locked:
             rpc_command = '<Unlock/>'
-            __execute_rpc__(self.device, rpc_command, self.timeout)
+            __execute_rpc__(self.device, rpc_command, self.timeout, recorder=self.recorder, backend=self.backend)
             self.locked = False
 
-    def load_candidate_config(self, filename=None, config=None):
+    def load_candidate_config(self, filename=None, config=None, chunk_size=None, progress=None):
         """
         Load candidate confguration.
 
@@ -239,10 +826,18 @@ class IOSXR:
         a file or from a string. If you send both a filename and a string
         containing the configuration, the file takes precedence.
 
-        :param filename:  Path to the file containing the desired
-                          configuration. By default is None.
-        :param config:    String containing the desired configuration.
+        :param filename:   Path to the file containing the desired
+                           configuration. By default is None.
+        :param config:     String containing the desired configuration.
+        :param chunk_size: (int) Load the configuration in several requests of about chunk_size bytes, split
+                           at top-level stanzas. The file is read while loading, so large configurations do
+                           not need to fit in one request or in memory. None loads it in one request.
+        :param progress:   Callable called with the bytes loaded so far and the total bytes after every
+                           request. By default is None.
         """
+        if chunk_size is not None:
+            return self.__load_chunked_config__(filename, config, chunk_size, progress)
+
         configuration = ''
 
         if filename is None:
@@ -254,10 +849,38 @@ class IOSXR:
         rpc_command = '<CLI><Configuration>'+configuration+'</Configuration></CLI>'
 
         try:
-            __execute_rpc__(self.device, rpc_command, self.timeout)
+            __execute_rpc__(self.device, rpc_command, self.timeout, recorder=self.recorder, backend=self.backend)
         except InvalidInputError as e:
             self.discard_config()
             raise InvalidInputError(e.message)
+        if progress is not None:
+            progress(len(configuration), len(configuration))
+
+    def __load_chunked_config__(self, filename, config, chunk_size, progress):
+        if filename is None:
+            f = None
+            total = len(config)
+            lines = config.splitlines(True)
+        else:
+            f = open(filename)
+            total = os.fstat(f.fileno()).st_size
+            lines = f
+        loaded = 0
+        try:
+            for chunk in __config_chunks__(lines, chunk_size):
+                rpc_command = '<CLI><Configuration>'+chunk+'</Configuration></CLI>'
+                try:
+                    __execute_rpc__(self.device, rpc_command, self.timeout, recorder=self.recorder,
+                                    backend=self.backend)
+                except InvalidInputError as e:
+                    self.discard_config()
+                    raise InvalidInputError(e.message)
+                loaded += len(chunk)
+                if progress is not None:
+                    progress(loaded, total)
+        finally:
+            if f is not None:
+                f.close()
 
     def get_candidate_config(self, merge=False, formal=False):
         """
@@ -272,15 +895,15 @@ class IOSXR:
             command += " merge"
         if formal:
             command += " formal"
-        response = __execute_config_show__(self.device, command, self.timeout)
+        response = __execute_config_show__(self.device, command, self.timeout, self.recorder, self.backend)
 
-        match = re.search(".*(!! IOS XR Configuration.*)$", response, re.DOTALL)
-        if match is not None:
-            response = match.group(1)
+        start = response.rfind('!! IOS XR Configuration')
+        if start != -1:
+            response = response[start:]
 
         return response
 
-    def compare_config(self):
+    def compare_config(self, structured=False):
         """
         Compare configuration to be merged with the one on the device.
 
@@ -288,14 +911,16 @@ class IOSXR:
         return a diff, assuming the loaded config will be merged with the
         existing one.
 
+        :param structured: (bool) Return a list of diff.Change records
+                           instead of a unified diff (default: False)
         :return:  Config diff.
         """
-        show_merge = __execute_config_show__(self.device, 'show configuration merge', self.timeout)
-        show_run = __execute_config_show__(self.device, 'show running-config', self.timeout)
+        show_merge = __execute_config_show__(self.device, 'show configuration merge', self.timeout, self.recorder,
+                                             self.backend)
+        show_run = __running_config__(self.device, self.hostname, self.timeout, self.config_cache, self.recorder,
+                                      self.backend)
 
-        diff = difflib.unified_diff(show_run.splitlines(1)[2:-2], show_merge.splitlines(1)[2:-2], n=0)
-        diff = ''.join([x.replace('\r', '') for x in diff])
-        return diff
+        return __diff_config__(show_run, show_merge, structured)
 
     def compare_replace_config(self):
         """
@@ -306,52 +931,66 @@ class IOSXR:
 
         :return:  Config diff.
         """
-        diff = __execute_config_show__(self.device, 'show configuration changes diff', self.timeout)
+        diff = __execute_config_show__(self.device, 'show configuration changes diff', self.timeout, self.recorder,
+                                       self.backend)
 
         return ''.join(diff.splitlines(1)[2:-2])
 
-    def commit_config(self, label=None, comment=None, confirmed=None):
+    def __invalidate_config_cache__(self):
+        if self.config_cache is not None:
+            self.config_cache.invalidate(self.hostname)
+
+    def get_config_changes(self):
         """
-        Commit the candidate config to the device, by merging it with the existing one.
+        Retrieve the changes the candidate config makes to the running config.
 
-        :param label:     Commit comment, displayed in the commit entry on the device.
-        :param comment:   Commit label, displayed instead of the commit ID on the device.
-        :param confirmed: Commit with auto-rollback if new commit is not made in 30 to 300 sec
-        """
-        rpc_command = '<Commit'
-        if label:
-            rpc_command += ' Label="%s"' % label
-        if comment:
-            rpc_command += ' Comment="%s"' % comment
-        if confirmed:
-            if 30 <= int(confirmed) <= 300:
-                rpc_command += ' Confirmed="%d"' % int(confirmed)
-            else:
-                raise InvalidInputError('confirmed needs to be between 30 and 300')
-        rpc_command += '/>'
+        Cheaper than compare_config, as only the changed lines are transferred rather than the running config
+        and the merged config.
 
-        __execute_rpc__(self.device, rpc_command, self.timeout)
+        :return:  (str) The changed lines, empty if the candidate config changes nothing
+        """
+        response = __execute_config_show__(self.device, 'show configuration changes', self.timeout, self.recorder,
+                                           self.backend)
+        return __config_changes__(response)
+
+    def __commit__(self, rpc_command, skip_if_empty, confirmed=None):
+        # a confirmed commit is confirmed by committing an empty candidate, which is never skipped
+        if skip_if_empty and not self.pending_confirm and not self.get_config_changes():
+            return False
+        self.__invalidate_config_cache__()
+        __execute_rpc__(self.device, rpc_command, self.timeout, recorder=self.recorder, backend=self.backend)
+        self.pending_confirm = bool(confirmed)
+        return True
+
+    def commit_config(self, label=None, comment=None, confirmed=None, skip_if_empty=False):
+        """
+        Commit the candidate config to the device, by merging it with the existing one.
+
+        :param label:         Commit comment, displayed in the commit entry on the device.
+        :param comment:       Commit label, displayed instead of the commit ID on the device.
+        :param confirmed:     Commit with auto-rollback if new commit is not made in 30 to 300 sec
+        :param skip_if_empty: (bool) Do not commit if the candidate config changes nothing, see
+                              get_config_changes. A commit confirming an earlier confirmed one is never skipped
+                              (default: False)
+        :return:              (bool) True if committed, False if skipped as there were no changes
+        """
+        rpc_command = __build_commit__(label=label, comment=comment, confirmed=confirmed)
+        return self.__commit__(rpc_command, skip_if_empty, confirmed)
 
-    def commit_replace_config(self, label=None, comment=None, confirmed=None):
+    def commit_replace_config(self, label=None, comment=None, confirmed=None, skip_if_empty=False):
         """
         Commit the candidate config to the device, by replacing the existing one.
 
-        :param comment:   User comment saved on this commit on the device
-        :param label:     User label saved on this commit on the device
-        :param confirmed: Commit with auto-rollback if new commit is not made in 30 to 300 sec
-        """
-        rpc_command = '<Commit Replace="true"'
-        if label:
-            rpc_command += ' Label="%s"' % label
-        if comment:
-            rpc_command += ' Comment="%s"' % comment
-        if confirmed:
-            if 30 <= int(confirmed) <= 300:
-                rpc_command += ' Confirmed="%d"' % int(confirmed)
-            else:
-                raise InvalidInputError('confirmed needs to be between 30 and 300')
-        rpc_command += '/>'
-        __execute_rpc__(self.device, rpc_command, self.timeout)
+        :param comment:       User comment saved on this commit on the device
+        :param label:         User label saved on this commit on the device
+        :param confirmed:     Commit with auto-rollback if new commit is not made in 30 to 300 sec
+        :param skip_if_empty: (bool) Do not commit if the candidate config changes nothing, see
+                              get_config_changes. A commit confirming an earlier confirmed one is never skipped
+                              (default: False)
+        :return:              (bool) True if committed, False if skipped as there were no changes
+        """
+        rpc_command = __build_commit__(replace=True, label=label, comment=comment, confirmed=confirmed)
+        return self.__commit__(rpc_command, skip_if_empty, confirmed)
 
     def discard_config(self):
         """
@@ -360,7 +999,7 @@ class IOSXR:
         Clear previously loaded configuration on the device without committing it.
         """
         rpc_command = '<Clear/>'
-        __execute_rpc__(self.device, rpc_command, self.timeout)
+        __execute_rpc__(self.device, rpc_command, self.timeout, recorder=self.recorder, backend=self.backend)
 
     def rollback(self):
         """
@@ -370,4 +1009,6 @@ class IOSXR:
         previous committed state.
         """
         rpc_command = '<Unlock/><Rollback><Previous>1</Previous></Rollback><Lock/>'
-        __execute_rpc__(self.device, rpc_command, self.timeout)
+        self.__invalidate_config_cache__()
+        __execute_rpc__(self.device, rpc_command, self.timeout, recorder=self.recorder, backend=self.backend)
+        self.pending_confirm = False
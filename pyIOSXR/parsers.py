@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Parsers turning the output of show commands into records."""
+
+# Copyright 2015 Netflix. All rights reserved.
+# Copyright 2016 BigWaveIT. All rights reserved.
+#
+# The contents of this file are licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the
+# License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import re
+import collections
+
+from exceptions import NoParserError
+
+# Parsers are registered by the command they handle. A parser takes an iterable of output lines, so it works
+# on complete outputs as well as on the streamed output of show_*(stream=True).
+PARSERS = {}
+
+Interface = collections.namedtuple('Interface', [
+    'name', 'state', 'protocol', 'description', 'hardware', 'mac_address', 'ip_address', 'mtu', 'bandwidth',
+    'input_rate', 'input_packet_rate', 'output_rate', 'output_packet_rate', 'input_packets', 'input_bytes',
+    'input_drops', 'output_packets', 'output_bytes', 'output_drops', 'input_errors', 'crc', 'output_errors',
+    'carrier_transitions'])
+
+BGPNeighbor = collections.namedtuple('BGPNeighbor', [
+    'neighbor', 'speaker', 'remote_as', 'messages_received', 'messages_sent', 'table_version', 'input_queue',
+    'output_queue', 'up_down', 'state', 'prefixes_received'])
+
+RouteSource = collections.namedtuple('RouteSource', ['source', 'routes', 'backup', 'deleted', 'memory'])
+
+
+def register(command):
+    """
+    Register a parser for a show command.
+
+    The parser is used for the command itself and for the command followed by arguments, unless a parser
+    for the longer command is registered as well.
+
+    :param command: (str) show command, e.g. 'show interfaces'
+    """
+    def decorator(parser):
+        PARSERS[' '.join(command.split())] = parser
+        return parser
+    return decorator
+
+
+def parse(command, output):
+    """
+    Parse the output of a show command.
+
+    :param command: (str) show command the output belongs to
+    :param output:  Output of the command as str or as an iterable of lines
+    :return:        Records of the parser registered for the command
+    """
+    words = command.split()
+    for length in range(len(words), 0, -1):
+        parser = PARSERS.get(' '.join(words[:length]))
+        if parser is not None:
+            break
+    else:
+        raise NoParserError('No parser registered for \'%s\'' % command)
+
+    if isinstance(output, basestring):
+        output = output.splitlines()
+    return parser(output)
+
+
+_INTERFACE_HEADER = re.compile(r'^(\S+) is (.+?), line protocol is (.+?)\s*$')
+_INTERFACE_HARDWARE = re.compile(r'^\s+Hardware is ([^,]+?)(?:, address is (\S+).*)?\s*$')
+_INTERFACE_ADDRESS = re.compile(r'^\s+Internet address is (\S+)')
+_INTERFACE_MTU = re.compile(r'^\s+MTU (\d+) bytes, BW (\d+) Kbit')
+_INTERFACE_RATE = re.compile(r'^\s+\d+ minute (input|output) rate (\d+) bits/sec, (\d+) packets/sec')
+_INTERFACE_PACKETS = re.compile(r'^\s+(\d+) packets (input|output), (\d+) bytes, (\d+) total (?:input|output) drops')
+_INTERFACE_INPUT_ERRORS = re.compile(r'^\s+(\d+) input errors, (\d+) CRC')
+_INTERFACE_OUTPUT_ERRORS = re.compile(r'^\s+(\d+) output errors')
+_INTERFACE_CARRIER = re.compile(r'^\s+(\d+) carrier transitions')
+
+
+@register('show interfaces')
+@register('show interface')
+def parse_interfaces(lines):
+    """
+    Parse 'show interfaces'.
+
+    :return: List of Interface records
+    """
+    interfaces = []
+    fields = None
+    for line in lines:
+        if not line or line.isspace():
+            continue
+        if not line[0].isspace():
+            match = _INTERFACE_HEADER.match(line)
+            if match is None:
+                continue
+            if fields is not None:
+                interfaces.append(Interface(**fields))
+            fields = dict.fromkeys(Interface._fields)
+            fields['name'], fields['state'], fields['protocol'] = match.groups()
+            continue
+        if fields is None:
+            continue
+
+        # dispatch on a keyword first, so every line is matched against a single pattern at most
+        stripped = line.lstrip()
+        if stripped.startswith('Description: '):
+            fields['description'] = stripped[len('Description: '):].rstrip()
+        elif stripped.startswith('Hardware is '):
+            match = _INTERFACE_HARDWARE.match(line)
+            if match is not None:
+                fields['hardware'], fields['mac_address'] = match.groups()
+        elif stripped.startswith('Internet address is '):
+            match = _INTERFACE_ADDRESS.match(line)
+            if match is not None:
+                address = match.group(1)
+                fields['ip_address'] = None if address == 'Unknown' else address
+        elif stripped.startswith('MTU '):
+            match = _INTERFACE_MTU.match(line)
+            if match is not None:
+                fields['mtu'], fields['bandwidth'] = int(match.group(1)), int(match.group(2))
+        elif ' minute ' in stripped:
+            match = _INTERFACE_RATE.match(line)
+            if match is not None:
+                direction = match.group(1)
+                fields[direction + '_rate'] = int(match.group(2))
+                fields[direction + '_packet_rate'] = int(match.group(3))
+        elif ' packets input, ' in stripped or ' packets output, ' in stripped:
+            match = _INTERFACE_PACKETS.match(line)
+            if match is not None:
+                direction = match.group(2)
+                fields[direction + '_packets'] = int(match.group(1))
+                fields[direction + '_bytes'] = int(match.group(3))
+                fields[direction + '_drops'] = int(match.group(4))
+        elif ' input errors, ' in stripped:
+            match = _INTERFACE_INPUT_ERRORS.match(line)
+            if match is not None:
+                fields['input_errors'], fields['crc'] = int(match.group(1)), int(match.group(2))
+        elif ' output errors, ' in stripped:
+            match = _INTERFACE_OUTPUT_ERRORS.match(line)
+            if match is not None:
+                fields['output_errors'] = int(match.group(1))
+        elif stripped.endswith(' carrier transitions'):
+            match = _INTERFACE_CARRIER.match(line)
+            if match is not None:
+                fields['carrier_transitions'] = int(match.group(1))
+
+    if fields is not None:
+        interfaces.append(Interface(**fields))
+    return interfaces
+
+
+@register('show bgp summary')
+@register('show bgp ipv4 unicast summary')
+@register('show bgp ipv6 unicast summary')
+@register('show bgp vpnv4 unicast summary')
+@register('show bgp vpnv6 unicast summary')
+def parse_bgp_summary(lines):
+    """
+    Parse 'show bgp summary' and its per address family variants.
+
+    :return: List of BGPNeighbor records
+    """
+    neighbors = []
+    in_table = False
+    wrapped = None
+    for line in lines:
+        columns = line.split()
+        if not in_table:
+            in_table = bool(columns) and columns[0] == 'Neighbor' and 'Spk' in columns
+            continue
+        if not columns:
+            continue
+        # long (IPv6) neighbor addresses are printed on a line of their own
+        if len(columns) == 1:
+            wrapped = columns[0]
+            continue
+        if wrapped is not None:
+            columns.insert(0, wrapped)
+            wrapped = None
+        # other text, e.g. a footer, has no numbers where the counters are
+        if len(columns) < 10 or not all(column.isdigit() for column in columns[1:2] + columns[3:8]):
+            continue
+        # states may be several words, e.g. Idle (Admin)
+        state = ' '.join(columns[9:])
+        prefixes = None
+        if state.isdigit():
+            state, prefixes = 'Established', int(state)
+        neighbors.append(BGPNeighbor(columns[0], int(columns[1]), columns[2], int(columns[3]), int(columns[4]),
+                                     int(columns[5]), int(columns[6]), int(columns[7]), columns[8], state,
+                                     prefixes))
+    return neighbors
+
+
+@register('show route summary')
+@register('show route ipv4 summary')
+@register('show route ipv6 summary')
+def parse_route_summary(lines):
+    """
+    Parse 'show route summary' and its per address family variants.
+
+    :return: List of RouteSource records, including the 'Total' line
+    """
+    sources = []
+    in_table = False
+    for line in lines:
+        if not in_table:
+            in_table = line.startswith('Route Source')
+            continue
+        columns = line.split()
+        if len(columns) < 5 or not all(column.isdigit() for column in columns[-4:]):
+            continue
+        sources.append(RouteSource(' '.join(columns[:-4]), *[int(column) for column in columns[-4:]]))
+    return sources
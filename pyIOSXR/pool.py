@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Keep sessions to Cisco devices running IOS-XR open for reuse."""
+
+# Copyright 2015 Netflix. All rights reserved.
+# Copyright 2016 BigWaveIT. All rights reserved.
+#
+# The contents of this file are licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the
+# License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import time
+import threading
+import contextlib
+
+from iosxr import IOSXR
+from transport import PORTS
+from exceptions import TimeoutError, EOFError
+
+
+class SessionPool:
+    """A pool of open IOSXR sessions keyed by hostname, port and username."""
+
+    def __init__(self, max_size=4, max_idle=300, check_after=60, health_check='<GetVersionInfo/>',
+                 reset=True, **kwargs):
+        """
+        A pool of IOS-XR sessions.
+
+        :param max_size:     (int) Maximum number of sessions per hostname, port and username (default: 4)
+        :param max_idle:     (int) Seconds an unused session is kept open (default: 300)
+        :param check_after:  (int) Seconds a session may be idle before it is health checked on acquire (default: 60)
+        :param health_check: (str) Cheap rpc command used as health check (default: <GetVersionInfo/>)
+        :param reset:        (bool) Discard uncommitted changes when a session is released (default: True)
+        :param kwargs:       Keyword arguments passed to IOSXR, e.g. timeout or logfile. Sessions are opened
+                             without config lock unless lock=True is given.
+        """
+        self.max_size = int(max_size)
+        self.max_idle = max_idle
+        self.check_after = check_after
+        self.health_check = health_check
+        self.reset = reset
+        self.kwargs = dict({'lock': False}, **kwargs)
+        self.__idle = {}
+        self.__size = {}
+        self.__condition = threading.Condition()
+        self.__closed = False
+
+    @staticmethod
+    def __key__(device):
+        return (device.hostname, device.port, device.username)
+
+    @staticmethod
+    def __alive__(device):
+        spawn = getattr(device, 'device', None)
+        return spawn is not None and spawn.isalive()
+
+    def __healthy__(self, device, idle_since):
+        if not self.__alive__(device) or time.time() - idle_since >= self.max_idle:
+            return False
+        if time.time() - idle_since < self.check_after:
+            return True
+        try:
+            device.make_rpc_call(self.health_check)
+        except Exception:
+            return False
+        return True
+
+    @staticmethod
+    def __close__(device):
+        try:
+            device.close()
+        except Exception:
+            spawn = getattr(device, 'device', None)
+            if spawn is not None:
+                spawn.close(force=True)
+
+    def acquire(self, hostname, username, password, port=None, timeout=None):
+        """
+        Check out an open session, opening a new one if no healthy idle session is available.
+
+        :param hostname: (str) IP or FQDN of the device
+        :param username: (str) Username
+        :param password: (str) Password, only used if a new session is opened
+        :param port:     (int) Port, None for the default of the transport of the pool (default: None)
+        :param timeout:  (int) Seconds to wait for a session if max_size sessions are checked out, None to wait
+                         forever. TimeoutError is raised if none becomes available in time.
+        :return:         An opened IOSXR instance, hand it back with release()
+        """
+        if port is None:
+            port = PORTS[self.kwargs.get('transport', 'ssh')]
+        key = (str(hostname), int(port), str(username))
+        deadline = time.time() + timeout if timeout is not None else None
+        with self.__condition:
+            while True:
+                idle = self.__idle.setdefault(key, [])
+                if idle:
+                    device, idle_since = idle.pop()
+                    break
+                if self.__size.get(key, 0) < self.max_size:
+                    self.__size[key] = self.__size.get(key, 0) + 1
+                    device, idle_since = None, None
+                    break
+                remaining = deadline - time.time() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError('No session to %s available after %s sec' % (hostname, timeout))
+                self.__condition.wait(remaining)
+
+        # health checks and the ssh handshake are done without holding the pool lock
+        if device is not None and not self.__healthy__(device, idle_since):
+            self.__close__(device)
+            device = None
+        if device is None:
+            # the slot is handed back if the session can not be created or opened
+            try:
+                device = IOSXR(hostname=hostname, username=username, password=password, port=port, **self.kwargs)
+                device.open()
+            except Exception:
+                self.__discard__(key)
+                raise
+        return device
+
+    def __discard__(self, key):
+        with self.__condition:
+            self.__size[key] -= 1
+            self.__condition.notify()
+
+    def release(self, device, broken=False):
+        """
+        Hand a session back to the pool.
+
+        :param device: IOSXR instance returned by acquire()
+        :param broken: (bool) Close the session instead of keeping it, e.g. after a timeout (default: False)
+        """
+        key = self.__key__(device)
+        if not broken and self.reset and self.__alive__(device):
+            try:
+                device.discard_config()
+            except Exception:
+                broken = True
+        if broken or self.__closed or not self.__alive__(device):
+            self.__close__(device)
+            self.__discard__(key)
+            return
+        with self.__condition:
+            self.__idle.setdefault(key, []).append((device, time.time()))
+            self.__condition.notify()
+
+    @contextlib.contextmanager
+    def session(self, hostname, username, password, port=None, timeout=None):
+        """
+        Check out a session for the duration of a with block.
+
+        Sessions are closed rather than reused if the block raised TimeoutError or EOFError, as the state of
+        the connection is unknown then. Same arguments as acquire().
+        """
+        device = self.acquire(hostname, username, password, port=port, timeout=timeout)
+        try:
+            yield device
+        except (TimeoutError, EOFError):
+            self.release(device, broken=True)
+            raise
+        except Exception:
+            self.release(device)
+            raise
+        else:
+            self.release(device)
+
+    def evict(self, max_idle=None):
+        """
+        Close sessions idle for longer than max_idle seconds.
+
+        :param max_idle: (int) Seconds, defaults to the max_idle of the pool. 0 closes all idle sessions.
+        :return:         Number of sessions closed
+        """
+        max_idle = self.max_idle if max_idle is None else max_idle
+        now = time.time()
+        evicted = []
+        with self.__condition:
+            for key, idle in self.__idle.items():
+                keep = [(device, idle_since) for device, idle_since in idle if now - idle_since < max_idle]
+                evicted.extend((key, device) for device, idle_since in idle if now - idle_since >= max_idle)
+                self.__idle[key] = keep
+        for key, device in evicted:
+            self.__close__(device)
+            self.__discard__(key)
+        return len(evicted)
+
+    def close(self):
+        """Close all idle sessions. Sessions checked out are closed when they are released."""
+        self.__closed = True
+        self.evict(max_idle=0)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Build Get requests for devices running IOS-XR and decode their responses into dicts."""
+
+# Copyright 2015 Netflix. All rights reserved.
+# Copyright 2016 BigWaveIT. All rights reserved.
+#
+# The contents of this file are licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the
+# License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import re
+import collections
+from xml.sax.saxutils import escape
+
+from backend import get_backend
+
+# A segment of a path: a tag, optionally with the naming of the single entry to select,
+# e.g. Instance[InstanceName=default].
+__SEGMENT__ = re.compile(r'^(\w+)(?:\[(.*)\])?$')
+
+# Integers as they appear in responses, without leading zeros which would be lost.
+__INTEGER__ = re.compile(r'-?(0|[1-9][0-9]*)$')
+
+
+# Split a path into (tag, naming) pairs, naming is a list of (leaf, value) or None.
+def __segments__(path):
+    segments = []
+    for segment in re.split(r'/(?![^\[]*\])', path.strip('/')):
+        match = __SEGMENT__.match(segment)
+        if match is None:
+            raise ValueError('Invalid path segment %r in %s' % (segment, path))
+        tag, naming = match.groups()
+        if naming is not None:
+            naming = [tuple(part.strip() for part in key.split('=', 1)) for key in naming.split(',')]
+            if any(len(key) != 2 or not key[0] for key in naming):
+                raise ValueError('Invalid naming in path segment %r, use Tag[Leaf=value,...]' % segment)
+        segments.append((tag, naming))
+    return segments
+
+
+# Naming element selecting an entry.
+def __naming__(naming):
+    return '<Naming>%s</Naming>' % ''.join('<%s>%s</%s>' % (leaf, escape('%s' % value), leaf)
+                                           for leaf, value in naming)
+
+
+# Elements requesting the leaves of a tree of fields, a dict of tag to the tree below it.
+def __fields__(tree):
+    return ''.join('<%s>%s</%s>' % (tag, __fields__(below), tag) if below else '<%s/>' % tag
+                   for tag, below in tree.items())
+
+
+# A leaf value: int for integers, bool for true and false, None if empty, str otherwise.
+def __scalar__(text):
+    text = (text or '').strip()
+    if not text:
+        return None
+    if __INTEGER__.match(text):
+        return int(text)
+    if text in ('true', 'false'):
+        return text == 'true'
+    return text
+
+
+def decode(element):
+    """
+    Decode an element of a response.
+
+    :param element: Element
+    :return:        OrderedDict of tag to value for elements with children, elements repeated within their
+                    parent are collected in a list. Leaves are decoded to int, bool, None or str.
+    """
+    if len(element) == 0:
+        return __scalar__(element.text)
+    result = collections.OrderedDict()
+    repeated = set()
+    for child in element:
+        if not isinstance(child.tag, basestring):
+            continue
+        value = decode(child)
+        if child.tag not in result:
+            result[child.tag] = value
+        elif child.tag in repeated:
+            result[child.tag].append(value)
+        else:
+            result[child.tag] = [result[child.tag], value]
+            repeated.add(child.tag)
+    return result
+
+
+class Query:
+    """A Get request for the entries at a path, filtered by naming on the device."""
+
+    def __init__(self, path, keys=None, fields=None, configuration=False):
+        """
+        A Get query.
+
+        Filters are sent to the device, which only returns the entries and leaves asked for.
+
+        :param path:          (str) Path below Operational or Configuration to the elements to get,
+                              e.g. 'Interfaces/InterfaceBriefTable/InterfaceBrief'. A segment may select a single
+                              entry by its naming: 'BGP/InstanceTable/Instance[InstanceName=default]/...'
+        :param keys:          dict of naming leaf to value selecting one entry of the last segment, or a list
+                              of such dicts to select several. None for all entries.
+        :param fields:        List of the leaves to return of every entry, by their path within the entry,
+                              e.g. ['State', 'Statistics/BytesReceived']. None for all.
+        :param configuration: (bool) Get configuration instead of operational data (default: False)
+        """
+        self.segments = __segments__(path)
+        if isinstance(keys, dict):
+            keys = [keys]
+        self.keys = [sorted(key.items()) if isinstance(key, dict) else list(key) for key in keys or []]
+        self.fields = list(fields or [])
+        self.source = 'Configuration' if configuration else 'Operational'
+
+    @property
+    def rpc_command(self):
+        """The rpc command, e.g. for IOSXR.make_rpc_call."""
+        tree = collections.OrderedDict()
+        for field in self.fields:
+            node = tree
+            for tag in field.strip('/').split('/'):
+                node = node.setdefault(tag, collections.OrderedDict())
+        inner = __fields__(tree)
+
+        tag, naming = self.segments[-1]
+        namings = [naming + key if naming else key for key in self.keys] or [naming]
+        entries = ''.join('<%s>%s%s</%s>' % (tag, __naming__(entry) if entry else '', inner, tag)
+                          if entry or inner else '<%s/>' % tag for entry in namings)
+        for tag, naming in reversed(self.segments[:-1]):
+            entries = '<%s>%s%s</%s>' % (tag, __naming__(naming) if naming else '', entries, tag)
+        return '<Get><%s>%s</%s></Get>' % (self.source, entries, self.source)
+
+    def elements(self, response, backend=None):
+        """
+        Find the elements at the path of the query in a response.
+
+        :param response: Response, Get or Operational/Configuration element, or a string of one of them as
+                         returned by make_rpc_call
+        :param backend:  Backend to parse the string with, None for the default one
+        :return:         List of elements
+        """
+        if isinstance(response, basestring):
+            response = (backend or get_backend()).fromstring(response)
+        if response.tag == 'Response':
+            found = response.findall('Get/' + self.source)
+        elif response.tag == 'Get':
+            found = response.findall(self.source)
+        else:
+            found = [response]
+        for tag, _ in self.segments:
+            found = [child for element in found for child in element.findall(tag)]
+        return found
+
+    def decode(self, response, factory=None, backend=None):
+        """
+        Decode the elements at the path of the query in a response.
+
+        :param response: Response element, or its string as returned by make_rpc_call
+        :param factory:  Callable turning the dict of every element into the record to return, e.g. a class
+        :param backend:  Backend to parse the string with, None for the default one
+        :return:         List with the dict of every element, see decode(), or what factory made of it
+        """
+        decoded = [decode(element) for element in self.elements(response, backend)]
+        if factory is not None:
+            return [factory(entry) for entry in decoded]
+        return decoded
@@ -0,0 +1,357 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Record the rpc calls of sessions with devices running IOS-XR and replay them without the device."""
+
+# Copyright 2015 Netflix. All rights reserved.
+# Copyright 2016 BigWaveIT. All rights reserved.
+#
+# The contents of this file are licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the
+# License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import json
+import time
+import zlib
+import struct
+import collections
+import pexpect
+
+from transport import SocketTransport
+from exceptions import ReplayError
+
+# A request sent to the device and the data received for it, up to the next request. sent is the time it was
+# sent at, elapsed the seconds until the last of the response was received.
+Exchange = collections.namedtuple('Exchange', ['request', 'response', 'sent', 'elapsed'])
+
+# Layout of a recording: the magic, the size of the JSON metadata and the metadata, then every exchange as a
+# record header followed by the compressed request and response. Closing the recording appends the index, the
+# offset of every record with a copy of its header, and the footer pointing to the index. Recordings not
+# closed, e.g. of a process killed, have no index and are read by walking the records.
+__MAGIC__ = 'PYIOSXR-REC\x01'
+__LENGTH__ = struct.Struct('<I')
+# sent, elapsed, crc32 of the request, size of the compressed request and of the compressed response
+__RECORD__ = struct.Struct('<ddiII')
+# offset of the record, and its header
+__ENTRY__ = struct.Struct('<QddiII')
+# offset of the index, number of exchanges
+__FOOTER__ = struct.Struct('<QI')
+
+# Requests and responses are compressed fast, as recording runs alongside the session.
+__LEVEL__ = 1
+
+
+# Checksum of a request, to find the exchanges of a request without reading them.
+def __checksum__(request):
+    return zlib.crc32(request)
+
+
+class RecordingWriter(object):
+    """Writes the exchanges of a session to a recording as they happen."""
+
+    def __init__(self, filename, hostname=None):
+        """
+        Start a recording, overwriting the file.
+
+        :param filename: (str) File to write to
+        :param hostname: (str) Hostname of the device, kept in the metadata
+        """
+        self.file = open(filename, 'wb')
+        self.index = []
+        metadata = json.dumps({'hostname': hostname, 'started': time.time()})
+        self.file.write(__MAGIC__ + __LENGTH__.pack(len(metadata)) + metadata)
+
+    def add(self, request, response, sent, elapsed):
+        """
+        Append an exchange.
+
+        :param request:  (str) Request as sent, without the line feed
+        :param response: (str) Data received for it
+        :param sent:     (float) Time the request was sent at
+        :param elapsed:  (float) Seconds until the last of the response was received
+        """
+        checksum = __checksum__(request)
+        request = zlib.compress(request, __LEVEL__)
+        response = zlib.compress(response, __LEVEL__)
+        header = (sent, elapsed, checksum, len(request), len(response))
+        self.index.append((self.file.tell(), ) + header)
+        self.file.write(__RECORD__.pack(*header) + request + response)
+
+    def close(self):
+        """Write the index and close the file."""
+        if self.file.closed:
+            return
+        offset = self.file.tell()
+        self.file.write(''.join(__ENTRY__.pack(*entry) for entry in self.index))
+        self.file.write(__FOOTER__.pack(offset, len(self.index)) + __MAGIC__)
+        self.file.close()
+
+
+class Recording:
+    """The exchanges of a recorded session, read as they are accessed."""
+
+    def __init__(self, filename):
+        """
+        Open a recording.
+
+        Only the index is read, requests and responses are read from the file when accessed.
+
+        :param filename: (str) File written by IOSXR(record=filename) or RecordingWriter
+        """
+        self.filename = filename
+        self.file = open(filename, 'rb')
+        if self.file.read(len(__MAGIC__)) != __MAGIC__:
+            self.file.close()
+            raise ValueError('%s is not a recording' % filename)
+        size, = __LENGTH__.unpack(self.file.read(__LENGTH__.size))
+        self.metadata = json.loads(self.file.read(size))
+        self.hostname = self.metadata.get('hostname')
+        self.started = self.metadata.get('started')
+        self.__start = self.file.tell()
+        self.index = self.__read_index__()
+
+    def __read_index__(self):
+        self.file.seek(0, 2)
+        end = self.file.tell()
+        tail = __FOOTER__.size + len(__MAGIC__)
+        if end - self.__start >= tail:
+            self.file.seek(end - tail)
+            footer = self.file.read(tail)
+            if footer.endswith(__MAGIC__):
+                offset, count = __FOOTER__.unpack(footer[:__FOOTER__.size])
+                self.file.seek(offset)
+                data = self.file.read(count * __ENTRY__.size)
+                return [__ENTRY__.unpack_from(data, position * __ENTRY__.size) for position in range(count)]
+        # not closed: walk the records, leaving out a last one cut short
+        index = []
+        offset = self.__start
+        while offset + __RECORD__.size <= end:
+            self.file.seek(offset)
+            header = __RECORD__.unpack(self.file.read(__RECORD__.size))
+            following = offset + __RECORD__.size + header[3] + header[4]
+            if following > end:
+                break
+            index.append((offset, ) + header)
+            offset = following
+        return index
+
+    def __len__(self):
+        """Number of exchanges."""
+        return len(self.index)
+
+    def __getitem__(self, position):
+        """The exchange at a position, an Exchange."""
+        offset, sent, elapsed, _, request_size, response_size = self.index[position]
+        self.file.seek(offset + __RECORD__.size)
+        request = zlib.decompress(self.file.read(request_size))
+        response = zlib.decompress(self.file.read(response_size))
+        return Exchange(request, response, sent, elapsed)
+
+    def __iter__(self):
+        """Iterate over the exchanges in the order they happened."""
+        for position in range(len(self.index)):
+            yield self[position]
+
+    def request(self, position):
+        """The request of the exchange at a position, without reading its response."""
+        offset, request_size = self.index[position][0], self.index[position][4]
+        self.file.seek(offset + __RECORD__.size)
+        return zlib.decompress(self.file.read(request_size))
+
+    def checksum(self, position):
+        """Checksum of the request of the exchange at a position."""
+        return self.index[position][3]
+
+    def close(self):
+        """Close the file."""
+        self.file.close()
+
+
+class Replay:
+    """A recorded session served to IOSXR in place of the device."""
+
+    def __init__(self, filename, speed=1.0):
+        """
+        A replay, e.g. IOSXR(hostname, username, password, replay=Replay('r1.rec', speed=10)).
+
+        Every session opened gets its own copy of the recording. Requests are answered with the response
+        recorded for them: the next exchange if its request matches, otherwise the first exchange not served yet
+        with that request. A request not recorded raises ReplayError. Responses recorded cut short, e.g. of a
+        call which timed out, time out again.
+
+        :param filename: (str) File written by IOSXR(record=filename)
+        :param speed:    (float) Responses take their recorded time divided by speed, None to answer right away
+                         (default: 1.0)
+        """
+        self.filename = filename
+        self.speed = speed
+
+    def connect(self, logfile=None, timeout=30):
+        """
+        Open a session.
+
+        :param logfile: File-like object to save the communication to or None to disable logging
+        :param timeout: (int) Timeout of calls not given one (default: 30 sec)
+        :return:        ReplayTransport, logged in like at the start of the recording
+        """
+        return ReplayTransport(Recording(self.filename), self.speed, logfile, timeout)
+
+
+class ReplayTransport(SocketTransport):
+    """Serves the responses of a recording, offering the same interface as the other transports."""
+
+    def __init__(self, recording, speed=1.0, logfile=None, timeout=30):
+        """
+        Wrap a recording.
+
+        :param recording: Recording to serve
+        :param speed:     (float) Responses take their recorded time divided by speed, None for no delay
+        :param logfile:   File-like object to save the communication to or None to disable logging
+        :param timeout:   (int) Timeout of calls not given one (default: 30 sec)
+        """
+        SocketTransport.__init__(self, None, logfile, timeout)
+        self.recording = recording
+        self.speed = speed
+        self.position = 0
+        self.served = set()
+        self.__by_checksum = collections.defaultdict(list)
+        for position in range(len(recording)):
+            self.__by_checksum[recording.checksum(position)].append(position)
+        self.__pending = ''
+        self.__ready = 0
+
+    def fileno(self):
+        """There is no file descriptor to select() on."""
+        return None
+
+    def __pending__(self):
+        return False
+
+    def __find__(self, request):
+        checksum = __checksum__(request)
+        candidates = []
+        if self.position < len(self.recording) and self.recording.checksum(self.position) == checksum:
+            candidates.append(self.position)
+        candidates.extend(self.__by_checksum.get(checksum, []))
+        for position in candidates:
+            if position not in self.served and self.recording.request(position) == request:
+                return position
+        return None
+
+    def send(self, s):
+        """Answer a request with its recorded response, returns the number of bytes sent."""
+        if self.closed:
+            raise IOError('The replay is closed')
+        self.__log__(s)
+        request = s[:-1] if s.endswith('\n') else s
+        position = self.__find__(request)
+        if position is None:
+            raise ReplayError('No response to %s recorded in %s' % (request[:200], self.recording.filename))
+        self.served.add(position)
+        self.position = position + 1
+        exchange = self.recording[position]
+        delay = exchange.elapsed / self.speed if self.speed else 0
+        self.__pending += exchange.response
+        self.__ready = time.time() + delay
+        return len(s)
+
+    def __recv__(self, size, deadline):
+        if self.closed:
+            raise pexpect.EOF('End Of File (EOF).')
+        if not self.__pending:
+            # nothing more was recorded for the request, as when the device did not answer
+            if deadline is None:
+                self.eof = True
+                raise pexpect.EOF('End of the recording.')
+            time.sleep(max(0, deadline - time.time()))
+            raise pexpect.TIMEOUT('Timeout exceeded.')
+        if deadline is not None and deadline < self.__ready:
+            time.sleep(max(0, deadline - time.time()))
+            raise pexpect.TIMEOUT('Timeout exceeded.')
+        wait = self.__ready - time.time()
+        if wait > 0:
+            time.sleep(wait)
+        data, self.__pending = self.__pending[:size], self.__pending[size:]
+        self.__log__(data)
+        return data
+
+    def close(self, force=False):
+        """Close the recording, force is accepted for compatibility with pexpect."""
+        if not self.closed:
+            self.recording.close()
+            self.closed = True
+
+
+class RecordingTransport(object):
+    """Records the exchanges of the connection it wraps, passing everything on to it."""
+
+    __slots__ = ('device', 'writer', 'request', 'sent', 'received', 'chunks', '__weakref__')
+
+    def __init__(self, device, writer):
+        """
+        Wrap a connection.
+
+        :param device: pexpect.spawn or transport of pyIOSXR.transport, logged in
+        :param writer: RecordingWriter to add the exchanges to
+        """
+        self.device = device
+        self.writer = writer
+        self.request = None
+        self.sent = self.received = 0
+        self.chunks = []
+
+    def __getattr__(self, item):
+        return getattr(self.device, item)
+
+    def __flush__(self):
+        if self.request is not None:
+            self.writer.add(self.request, ''.join(self.chunks), self.sent, self.received - self.sent)
+            self.request = None
+            self.chunks = []
+
+    def __receive__(self, data):
+        # data received before the first request, if any, is not part of an exchange
+        if self.request is not None:
+            self.chunks.append(data)
+            self.received = time.time()
+
+    def sendline(self, s=''):
+        """Send a request followed by a line feed, see pexpect.spawn.sendline."""
+        self.__flush__()
+        self.request = s
+        self.sent = self.received = time.time()
+        return self.device.sendline(s)
+
+    def expect_exact(self, pattern_list, timeout=-1):
+        """Wait for one of several strings, see pexpect.spawn.expect_exact."""
+        index = self.device.expect_exact(pattern_list, timeout=timeout)
+        self.__receive__(self.device.before + self.device.match)
+        return index
+
+    def expect(self, pattern, timeout=-1):
+        """Wait for one of several regular expressions, see pexpect.spawn.expect."""
+        index = self.device.expect(pattern, timeout=timeout)
+        after = self.device.after
+        self.__receive__(self.device.before + (after if isinstance(after, basestring) else ''))
+        return index
+
+    def read_nonblocking(self, size=1, timeout=-1):
+        """Read what is available, see pexpect.spawn.read_nonblocking."""
+        data = self.device.read_nonblocking(size, timeout)
+        self.__receive__(data)
+        return data
+
+    def close(self, *args, **kwargs):
+        """Close the connection and the recording."""
+        try:
+            self.device.close(*args, **kwargs)
+        finally:
+            self.__flush__()
+            self.writer.close()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Render the configs of devices running IOS-XR from a template."""
+
+# Copyright 2015 Netflix. All rights reserved.
+# Copyright 2016 BigWaveIT. All rights reserved.
+#
+# The contents of this file are licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the
+# License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import os
+import re
+import json
+import errno
+import string
+import hashlib
+import tempfile
+import threading
+import collections
+import multiprocessing
+
+from fleet import Fleet, DeviceResult
+from rollout import Rollout, Outcome, COMMITTED, UNCHANGED
+
+# Template engines: 'string' substitutes $name and ${name} (string.Template), 'jinja2' needs jinja2.
+ENGINES = ('string', 'jinja2')
+
+# The template compiled in a worker process of the pool, set once per process by __init_worker__.
+__WORKER_TEMPLATE__ = None
+
+
+def compile_template(source, engine='string'):
+    """
+    Compile a template.
+
+    :param source: (str) The template
+    :param engine: (str) 'string' or 'jinja2'
+    :return:       Callable taking a dict of variables, returning the rendered config
+    """
+    if engine == 'string':
+        return string.Template(source).substitute
+    if engine == 'jinja2':
+        try:
+            import jinja2
+        except ImportError:
+            raise ImportError("The 'jinja2' engine needs jinja2, install it with 'pip install jinja2'")
+        # undefined variables fail the rendering rather than silently leaving a gap in the config
+        environment = jinja2.Environment(undefined=jinja2.StrictUndefined, keep_trailing_newline=True)
+        return environment.from_string(source).render
+    raise ValueError('Unknown template engine %s, use one of %s' % (engine, ', '.join(ENGINES)))
+
+
+def __init_worker__(source, engine):
+    global __WORKER_TEMPLATE__
+    __WORKER_TEMPLATE__ = compile_template(source, engine)
+
+
+def __render_worker__(variables):
+    return __WORKER_TEMPLATE__(variables)
+
+
+def digest(config):
+    """SHA-1 of a config, ignoring trailing whitespace on lines and blank lines at the end."""
+    lines = [line.rstrip() for line in config.strip('\r\n').splitlines()]
+    return hashlib.sha1('\n'.join(lines).encode('utf-8') if isinstance(config, unicode)
+                        else '\n'.join(lines)).hexdigest()
+
+
+class Renderer:
+    """A config template rendered for many devices, skipping devices whose config was committed already."""
+
+    def __init__(self, template=None, filename=None, engine='string', processes=None, cache_size=10000,
+                 directory=None):
+        """
+        A config renderer.
+
+        The template is compiled once, in every worker process of the pool if processes are used. Rendered
+        configs are cached by the hash of their variables. Configs committed through the renderer are
+        remembered by their digest, so a device is not pushed the same config again.
+
+        :param template:   (str) The template
+        :param filename:   (str) File with the template, instead of template
+        :param engine:     (str) 'string' for $name substitution, or 'jinja2' (default: 'string')
+        :param processes:  (int) Worker processes rendering many devices, None to render in this process, which
+                           is faster unless rendering takes longer than sending the variables to a worker
+        :param cache_size: (int) Number of rendered configs cached (default: 10000)
+        :param directory:  (str) Directory to keep the digests of the configs committed in, so they survive the
+                           process. None to keep them in memory only.
+        """
+        if template is None:
+            if filename is None:
+                raise ValueError('Pass one of template or filename')
+            with open(filename) as template_file:
+                template = template_file.read()
+        self.source = template
+        self.engine = engine
+        self.processes = processes
+        self.cache_size = int(cache_size)
+        self.directory = directory
+        self.template = compile_template(template, engine)
+        self.__template_key = hashlib.sha1(engine + '\0' + template).hexdigest()
+        self.__cache = collections.OrderedDict()
+        self.__committed = {}
+        self.__lock = threading.Lock()
+        if directory is not None and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def __key__(self, variables):
+        # the template is part of the key, so configs of an earlier template are never taken for this one
+        return hashlib.sha1(self.__template_key + json.dumps(variables, sort_keys=True, default=repr)).hexdigest()
+
+    def __cached__(self, key):
+        with self.__lock:
+            config = self.__cache.pop(key, None)
+            if config is not None:
+                self.__cache[key] = config
+            return config
+
+    def __store__(self, key, config):
+        with self.__lock:
+            self.__cache[key] = config
+            while len(self.__cache) > self.cache_size:
+                self.__cache.popitem(last=False)
+
+    def render(self, variables):
+        """
+        Render the config of a device.
+
+        :param variables: dict of the variables of the template
+        :return:          (str) The config
+        """
+        key = self.__key__(variables)
+        config = self.__cached__(key)
+        if config is None:
+            config = self.template(variables)
+            self.__store__(key, config)
+        return config
+
+    def render_all(self, variables):
+        """
+        Render the configs of many devices, in the process pool if processes is set.
+
+        :param variables: dict of hostname to the variables of its config
+        :return:          OrderedDict of hostname to config, in the order of variables
+        """
+        keys = collections.OrderedDict((hostname, self.__key__(values)) for hostname, values in variables.items())
+        configs = dict((hostname, self.__cached__(key)) for hostname, key in keys.items())
+        missing = [hostname for hostname in keys if configs[hostname] is None]
+        # devices with the same variables are rendered once
+        unique = collections.OrderedDict((keys[hostname], variables[hostname]) for hostname in missing)
+        if self.processes and len(unique) > 1:
+            pool = multiprocessing.Pool(self.processes, __init_worker__, (self.source, self.engine))
+            try:
+                chunksize = max(len(unique) / (4 * self.processes), 1)
+                rendered = pool.map(__render_worker__, unique.values(), chunksize)
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            rendered = [self.template(values) for values in unique.values()]
+        for key, config in zip(unique, rendered):
+            self.__store__(key, config)
+        rendered = dict(zip(unique, rendered))
+        return collections.OrderedDict((hostname, configs[hostname] if configs[hostname] is not None
+                                        else rendered[keys[hostname]]) for hostname in keys)
+
+    def __path__(self, hostname):
+        name = re.sub(r'[^\w.-]', '_', hostname) + '-' + hashlib.sha1(hostname).hexdigest()[:8]
+        return os.path.join(self.directory, name + '.sha1')
+
+    def last_committed(self, hostname):
+        """
+        Get the digest of the config last committed to a device through the renderer.
+
+        :param hostname: (str) Hostname of the device
+        :return:         (str) The digest, see digest(), None if unknown
+        """
+        with self.__lock:
+            committed = self.__committed.get(hostname)
+        if committed is not None or self.directory is None:
+            return committed
+        try:
+            with open(self.__path__(hostname), 'rb') as digest_file:
+                committed = digest_file.read().strip() or None
+        except IOError:
+            return None
+        with self.__lock:
+            self.__committed[hostname] = committed
+        return committed
+
+    def mark_committed(self, hostname, config):
+        """
+        Remember that a config was committed to a device.
+
+        :param hostname: (str) Hostname of the device
+        :param config:   (str) The config committed
+        """
+        committed = digest(config)
+        with self.__lock:
+            self.__committed[hostname] = committed
+        if self.directory is None:
+            return
+        # write to a temporary file first, so readers never see a partial digest
+        fd, path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as digest_file:
+                digest_file.write(committed + '\n')
+            os.rename(path, self.__path__(hostname))
+        except Exception:
+            os.remove(path)
+            raise
+
+    def forget(self, hostname):
+        """
+        Drop what is known about the config of a device, e.g. after it was changed by other means.
+
+        :param hostname: (str) Hostname of the device
+        """
+        with self.__lock:
+            self.__committed.pop(hostname, None)
+        if self.directory is None:
+            return
+        try:
+            os.remove(self.__path__(hostname))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def changed(self, configs):
+        """
+        Leave out the configs committed already.
+
+        :param configs: dict of hostname to config, e.g. from render_all()
+        :return:        OrderedDict of hostname to config of the devices whose last committed config differs
+        """
+        return collections.OrderedDict((hostname, config) for hostname, config in configs.items()
+                                       if self.last_committed(hostname) != digest(config))
+
+    def push(self, device, variables, replace=False, label=None, comment=None, confirmed=None):
+        """
+        Render, load and commit the config of a single device, unless it was committed already.
+
+        :param device:    Opened IOSXR instance
+        :param variables: dict of the variables of the template
+        :param replace:   (bool) Replace the running config instead of merging the config into it
+        :param label:     Commit label, see IOSXR.commit_config
+        :param comment:   Commit comment, see IOSXR.commit_config
+        :param confirmed: Commit with auto-rollback, see IOSXR.commit_config. A confirmed commit is only
+                          remembered once confirmed, so the renderer does not mark it
+        :return:          (bool) True if the config was committed, False if it was skipped
+        """
+        config = self.render(variables)
+        if self.last_committed(device.hostname) == digest(config):
+            return False
+        device.load_candidate_config(config=config)
+        try:
+            if replace:
+                device.commit_replace_config(label, comment, confirmed)
+            else:
+                device.commit_config(label, comment, confirmed)
+        except Exception:
+            device.discard_config()
+            raise
+        if not confirmed:
+            self.mark_committed(device.hostname, config)
+        return True
+
+    def rollout(self, fleet, variables, **kwargs):
+        """
+        Render the configs of a fleet and roll out those not committed already.
+
+        :param fleet:     Fleet of the devices
+        :param variables: dict of hostname to the variables of its config, devices of the fleet without
+                          variables are left alone
+        :param kwargs:    Keyword arguments of Rollout, e.g. canary, batch, confirmed or verify
+        :return:          OrderedDict of hostname to DeviceResult like Rollout.run(). Devices skipped as their
+                          config was committed already are UNCHANGED.
+        """
+        configs = self.changed(self.render_all(variables))
+        results = collections.OrderedDict()
+        inventory = [params for params in fleet.inventory if params['hostname'] in configs]
+        rolled = {}
+        if inventory:
+            subset = Fleet(inventory, workers=fleet.workers, device_timeout=fleet.device_timeout)
+            rolled = Rollout(subset, configs=configs, **kwargs).run()
+        for params in fleet.inventory:
+            hostname = params['hostname']
+            if hostname not in variables:
+                continue
+            if hostname not in rolled:
+                results[hostname] = DeviceResult(hostname, Outcome(UNCHANGED, '', None))
+                continue
+            result = rolled[hostname]
+            if result.ok and result.result.state in (COMMITTED, UNCHANGED):
+                self.mark_committed(hostname, configs[hostname])
+            results[hostname] = result
+        return results
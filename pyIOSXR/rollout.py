@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Commit a configuration change to a fleet of devices running IOS-XR in waves."""
+
+# Copyright 2015 Netflix. All rights reserved.
+# Copyright 2016 BigWaveIT. All rights reserved.
+#
+# The contents of this file are licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the
+# License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import math
+import time
+import Queue
+import threading
+import collections
+
+from iosxr import IOSXR
+from fleet import DeviceResult
+from exceptions import CancelledError, VerificationError
+
+# States of a device at the end of a rollout.
+UNCHANGED = 'unchanged'          # the loaded config did not change anything, nothing was committed
+COMMITTED = 'committed'          # committed, and confirmed if the commits were confirmed ones
+ROLLED_BACK = 'rolled back'      # committed and rolled back, as it or its wave failed
+# committed, rolling it back failed: a confirmed commit still rolls back once its timer expires, other commits
+# are still in place
+ROLLBACK_FAILED = 'rollback failed'
+NOT_COMMITTED = 'not committed'  # the rollout stopped before the wave of the device
+FAILED = 'failed'                # opening, loading, comparing or committing failed
+
+# What happened to a device: its state, the config diff and the number of its wave (0 is the canary wave),
+# None if it was not in any wave.
+Outcome = collections.namedtuple('Outcome', ['state', 'diff', 'wave'])
+
+
+class Rollout:
+    """A configuration change committed to the devices of a fleet wave by wave."""
+
+    def __init__(self, fleet, config=None, filename=None, configs=None, replace=False, canary=1, batch=0.25,
+                 confirmed=300, verify=None, max_failures=0, label=None, comment=None):
+        """
+        A staged rollout.
+
+        The config is loaded and compared on all devices in parallel first. Devices it changes are then
+        committed in waves: the canary devices first, then batches of the others. After a wave is committed
+        verify is run on each of its devices, and only then are the commits confirmed. If more devices failed
+        than max_failures allows, the wave is rolled back and the rollout stops. The sessions stay open for
+        the whole rollout, so the candidate config loaded in the first phase is the one committed.
+
+        :param fleet:        Fleet with the devices and the IOSXR arguments to use, at most fleet.workers
+                             devices are worked on at a time
+        :param config:       (str) Config to load on every device
+        :param filename:     (str) File with the config to load on every device, instead of config
+        :param configs:      dict of hostname to the config of that device, instead of config and filename
+        :param replace:      (bool) Replace the running config instead of merging the config into it
+        :param canary:       (int) Number of devices in the first wave (default: 1)
+        :param batch:        (float) Share of the changed devices in every later wave, e.g. 0.25 for a quarter,
+                             or (int) number of devices per wave (default: 0.25)
+        :param confirmed:    (int) Commit with auto-rollback after 30 to 300 sec unless confirmed, which
+                             happens after verify passed. verify has to finish within that time. None to commit
+                             without (default: 300)
+        :param verify:       Callable taking the opened IOSXR instance after the commit, returning True if the
+                             device is fine. Returning False or raising fails the device. None to check nothing.
+        :param max_failures: (int) Number of failed devices tolerated over the whole rollout. Failed devices
+                             within the tolerance are rolled back alone and the rollout goes on (default: 0)
+        :param label:        Commit label, see IOSXR.commit_config
+        :param comment:      Commit comment, see IOSXR.commit_config
+        """
+        if config is None and filename is None and configs is None:
+            raise ValueError('Pass one of config, filename or configs')
+        self.fleet = fleet
+        self.config = config
+        self.filename = filename
+        self.configs = configs
+        self.replace = replace
+        self.canary = int(canary)
+        self.batch = batch
+        self.confirmed = confirmed
+        self.verify = verify
+        self.max_failures = int(max_failures)
+        self.label = label
+        self.comment = comment
+
+    def waves(self, hostnames):
+        """
+        Split devices into waves.
+
+        :param hostnames: List of the hostnames of the devices to commit, in order
+        :return:          List of lists of hostnames, the canary wave first
+        """
+        hostnames = list(hostnames)
+        if isinstance(self.batch, float):
+            size = max(int(math.ceil(len(hostnames) * self.batch)), 1)
+        else:
+            size = max(int(self.batch), 1)
+        waves = []
+        if self.canary > 0:
+            waves.append(hostnames[:self.canary])
+            hostnames = hostnames[self.canary:]
+        waves.extend(hostnames[start:start + size] for start in range(0, len(hostnames), size))
+        return [wave for wave in waves if wave]
+
+    def __parallel__(self, hostnames, operation, elapsed):
+        # Run operation(hostname) on fleet.workers threads, returns a dict of hostname to DeviceResult. The time
+        # spent is added to elapsed.
+        pending = Queue.Queue()
+        for hostname in hostnames:
+            pending.put(hostname)
+        results = {}
+
+        def worker():
+            while True:
+                try:
+                    hostname = pending.get_nowait()
+                except Queue.Empty:
+                    return
+                start = time.time()
+                try:
+                    result = operation(hostname)
+                except Exception as e:
+                    results[hostname] = DeviceResult(hostname, exception=e, elapsed=time.time() - start)
+                else:
+                    results[hostname] = DeviceResult(hostname, result=result, elapsed=time.time() - start)
+                elapsed[hostname] += results[hostname].elapsed
+
+        workers = [threading.Thread(target=worker) for _ in range(min(self.fleet.workers, len(hostnames)))]
+        for thread in workers:
+            thread.daemon = True
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return results
+
+    def run(self):
+        """
+        Run the rollout.
+
+        :return: OrderedDict of hostname to DeviceResult in the order of the fleet inventory. The result of
+                 every device is an Outcome, the exception the reason it failed, was rolled back or was not
+                 committed, None for devices committed or unchanged.
+        """
+        params = collections.OrderedDict((entry['hostname'], entry) for entry in self.fleet.inventory)
+        devices = {}
+        diffs = {}
+        outcomes = {}
+        elapsed = collections.defaultdict(float)
+
+        def record(hostname, state, wave, exception=None):
+            outcomes[hostname] = DeviceResult(hostname, Outcome(state, diffs.get(hostname), wave), exception,
+                                              elapsed[hostname])
+
+        def prepare(hostname):
+            device = IOSXR(**params[hostname])
+            device.open()
+            devices[hostname] = device
+            if self.configs is not None:
+                device.load_candidate_config(config=self.configs[hostname])
+            else:
+                device.load_candidate_config(filename=self.filename, config=self.config)
+            if self.replace:
+                return device.compare_replace_config()
+            return device.compare_config()
+
+        def commit(hostname):
+            if self.replace:
+                devices[hostname].commit_replace_config(self.label, self.comment, self.confirmed)
+            else:
+                devices[hostname].commit_config(self.label, self.comment, self.confirmed)
+
+        def verify(hostname):
+            if self.verify is not None and not self.verify(devices[hostname]):
+                raise VerificationError('Verification failed on %s' % hostname)
+
+        def confirm(hostname):
+            if self.confirmed:
+                devices[hostname].commit_config()
+
+        def rollback(hostname):
+            devices[hostname].rollback()
+
+        try:
+            failures = 0
+            prepared = self.__parallel__(list(params), prepare, elapsed)
+            for hostname in params:
+                result = prepared[hostname]
+                if not result.ok:
+                    failures += 1
+                    record(hostname, FAILED, None, result.exception)
+                    continue
+                diffs[hostname] = result.result
+                if not result.result.strip():
+                    record(hostname, UNCHANGED, None)
+
+            waves = self.waves(hostname for hostname in params if hostname not in outcomes)
+            for number, wave in enumerate(waves):
+                if failures > self.max_failures:
+                    break
+                committed = self.__parallel__(wave, commit, elapsed)
+                results = dict(committed)
+                results.update(self.__parallel__([host for host in wave if committed[host].ok], verify, elapsed))
+                failed = [hostname for hostname in wave if not results[hostname].ok]
+                failures += len(failed)
+
+                # too many failures: roll back the whole wave and stop, otherwise only the failed devices
+                stop = failures > self.max_failures
+                back = [hostname for hostname in wave if committed[hostname].ok and (stop or hostname in failed)]
+                rolled = self.__parallel__(back, rollback, elapsed)
+                confirmed = {}
+                if not stop:
+                    confirmed = self.__parallel__([host for host in wave if host not in failed], confirm, elapsed)
+                for hostname in wave:
+                    if hostname in rolled and not rolled[hostname].ok:
+                        if hostname not in failed:
+                            failures += 1
+                        record(hostname, ROLLBACK_FAILED, number, rolled[hostname].exception)
+                    elif hostname in rolled:
+                        reason = CancelledError('Rolled back after %d failures' % failures)
+                        record(hostname, ROLLED_BACK, number,
+                               results[hostname].exception or reason)
+                    elif hostname in confirmed and confirmed[hostname].ok:
+                        record(hostname, COMMITTED, number)
+                    elif hostname in confirmed:
+                        failures += 1
+                        record(hostname, FAILED, number, confirmed[hostname].exception)
+                    else:
+                        record(hostname, FAILED, number, results[hostname].exception)
+
+            for hostname in diffs:
+                if hostname not in outcomes:
+                    record(hostname, NOT_COMMITTED, None,
+                           CancelledError('Rollout stopped after %d failures' % failures))
+        finally:
+            def close(hostname):
+                self.__close__(devices[hostname], outcomes.get(hostname))
+            self.__parallel__(list(devices), close, elapsed)
+
+        return collections.OrderedDict((hostname, outcomes[hostname]) for hostname in params)
+
+    @staticmethod
+    def __close__(device, outcome):
+        try:
+            if outcome is None or outcome.result.state not in (COMMITTED, ROLLED_BACK):
+                device.discard_config()
+        finally:
+            device.close()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Poll devices running IOS-XR periodically over long-lived sessions."""
+
+# Copyright 2015 Netflix. All rights reserved.
+# Copyright 2016 BigWaveIT. All rights reserved.
+#
+# The contents of this file are licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the
+# License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import time
+import heapq
+import Queue
+import random
+import threading
+import collections
+
+from pool import SessionPool
+from backend import get_backend
+from iosxr import __strip_show_output__
+
+# The result of one run of a job on a device. scheduled is the time the run was due, timestamp the time the
+# response arrived, elapsed the seconds the exchange took, skipped the number of runs of the job missed since
+# the previous sample as the device was busy or the consumer too slow. result is the xml of the operations (str)
+# for rpc jobs, the output for show jobs and the return value for callable jobs, exception is set instead if
+# the run failed.
+Sample = collections.namedtuple('Sample', [
+    'hostname', 'job', 'scheduled', 'timestamp', 'elapsed', 'result', 'exception', 'skipped'])
+
+
+class _Job(object):
+
+    __slots__ = ('name', 'rpc_command', 'show', 'function', 'interval', 'hostnames')
+
+    def __init__(self, name, rpc_command, show, function, interval, hostnames):
+        self.name = name
+        self.rpc_command = rpc_command
+        self.show = show
+        self.function = function
+        self.interval = interval
+        self.hostnames = hostnames
+
+    def result(self, xml):
+        if self.show is None:
+            return xml
+        output = get_backend().fromstring(xml).find('Exec').text or ''
+        return __strip_show_output__(output.lstrip())
+
+
+class _Device(object):
+
+    __slots__ = ('params', 'phase', 'due', 'skipped')
+
+    def __init__(self, params, phase):
+        self.params = params
+        self.phase = phase
+        # job name to the time its next run is due, and to the runs skipped since its last sample
+        self.due = {}
+        self.skipped = {}
+
+
+class Scheduler:
+    """Named collection jobs run on a set of devices at fixed intervals."""
+
+    def __init__(self, inventory, username=None, password=None, workers=20, jitter=0.1, window=1.0, pool=None,
+                 **kwargs):
+        """
+        A polling scheduler.
+
+        Every device has a session of its own, kept open between runs. The jobs of a device due at about the
+        same time are coalesced: their rpc and show commands are sent in a single request.
+
+        :param inventory: List of hostnames or dicts with 'hostname' and optionally 'username', 'password'
+                          and 'port', entries override the defaults
+        :param username:  (str) Default username
+        :param password:  (str) Default password
+        :param workers:   (int) Maximum number of devices polled concurrently (default: 20)
+        :param jitter:    (float) Runs of a device are offset by a random share of the interval up to this,
+                          so the devices of the inventory are not all polled at the same instant (default: 0.1)
+        :param window:    (float) Seconds ahead of time a job may run to join the request of another job of
+                          the same device (default: 1.0)
+        :param pool:      SessionPool to take the sessions from, None for a pool of its own keeping one session
+                          per device, which does not discard the candidate config after every run
+        :param kwargs:    Keyword arguments passed to IOSXR by the pool of its own, e.g. timeout or transport
+        """
+        self.workers = int(workers)
+        self.jitter = jitter
+        self.window = window
+        self.pool = pool if pool is not None else SessionPool(max_size=1, reset=False, **kwargs)
+        self.jobs = collections.OrderedDict()
+        self.__devices = collections.OrderedDict()
+        self.__stopped = threading.Event()
+        for entry in inventory:
+            params = {'username': username, 'password': password, 'port': None}
+            if isinstance(entry, dict):
+                params.update(entry)
+            else:
+                params['hostname'] = entry
+            self.__devices[params['hostname']] = _Device(params, random.uniform(0, jitter))
+
+    def add(self, name, rpc_command=None, show=None, job=None, interval=60, hostnames=None):
+        """
+        Add a collection job, given by exactly one of rpc_command, show and job.
+
+        :param name:        (str) Name of the job, found in the samples
+        :param rpc_command: (str) rpc command, see IOSXR.make_rpc_call
+        :param show:        (str) show command, e.g. 'show bgp summary'
+        :param job:         Callable taking the opened IOSXR instance, run on its own rather than coalesced
+        :param interval:    (float) Seconds between runs (default: 60)
+        :param hostnames:   List of the hostnames to run the job on, None for all devices
+        """
+        if len([spec for spec in (rpc_command, show, job) if spec is not None]) != 1:
+            raise ValueError('Pass exactly one of rpc_command, show and job')
+        if show is not None:
+            rpc_command = '<CLI><Exec>' + show + '</Exec></CLI>'
+        self.jobs[name] = _Job(name, rpc_command, show, job, float(interval),
+                               set(hostnames) if hostnames is not None else None)
+
+    def stop(self):
+        """Make run() return once the devices being polled are done."""
+        self.__stopped.set()
+
+    def close(self):
+        """Close the idle sessions of the pool."""
+        self.pool.close()
+
+    def __worker__(self, tasks, results):
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            device, jobs, scheduled = task
+            params = device.params
+            samples = []
+            start = time.time()
+            try:
+                with self.pool.session(params['hostname'], params['username'], params['password'],
+                                       port=params['port']) as session:
+                    coalesced = [job for job in jobs if job.function is None]
+                    outputs = session.make_rpc_calls([job.rpc_command for job in coalesced]) if coalesced else []
+                    now = time.time()
+                    for job, output in zip(coalesced, outputs):
+                        if isinstance(output, Exception):
+                            samples.append((job, scheduled[job.name], now, now - start, None, output))
+                            continue
+                        try:
+                            samples.append((job, scheduled[job.name], now, now - start, job.result(output), None))
+                        except Exception as e:
+                            samples.append((job, scheduled[job.name], now, now - start, None, e))
+                    for job in jobs:
+                        if job.function is None:
+                            continue
+                        begin = time.time()
+                        try:
+                            result, exception = job.function(session), None
+                        except Exception as e:
+                            result, exception = None, e
+                        now = time.time()
+                        samples.append((job, scheduled[job.name], now, now - begin, result, exception))
+            except Exception as e:
+                # the session could not be opened or broke, every job not done yet failed
+                now = time.time()
+                done = set(job.name for job, _, _, _, _, _ in samples)
+                samples.extend((job, scheduled[job.name], now, now - start, None, e)
+                               for job in jobs if job.name not in done)
+            results.put((device, samples))
+
+    def __due__(self, device, now):
+        # Jobs of a device due within the window, their due time is advanced by one interval.
+        jobs = []
+        scheduled = {}
+        for name, job in self.jobs.items():
+            if job.hostnames is not None and device.params['hostname'] not in job.hostnames:
+                continue
+            if name not in device.due:
+                device.due[name] = now + device.phase * job.interval
+                device.skipped[name] = 0
+            if device.due[name] <= now + self.window:
+                jobs.append(job)
+                scheduled[name] = device.due[name]
+                device.due[name] += job.interval
+        return jobs, scheduled
+
+    def __next__(self, device, now):
+        # Skip the runs missed while the device was busy, returns the time the next job of the device is due.
+        for name, due in device.due.items():
+            interval = self.jobs[name].interval
+            if due < now:
+                missed = int((now - due) / interval) + 1
+                device.due[name] = due + missed * interval
+                device.skipped[name] += missed
+        return min(device.due.values()) if device.due else None
+
+    def run(self, duration=None):
+        """
+        Poll the devices until stop() is called or duration has passed.
+
+        Samples are yielded as the responses arrive. Consuming them slowly holds up the polling, runs due in
+        the meantime are then skipped rather than queued.
+
+        :param duration: (float) Seconds to poll for, None to poll until stop() is called
+        :return:         Generator of Sample
+        """
+        self.__stopped.clear()
+        tasks = Queue.Queue()
+        results = Queue.Queue()
+        workers = [threading.Thread(target=self.__worker__, args=(tasks, results))
+                   for _ in range(min(self.workers, len(self.__devices)))]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        start = time.time()
+        end = start + duration if duration is not None else None
+        queue = [(start, hostname) for hostname in self.__devices]
+        busy = 0
+        try:
+            while not self.__stopped.is_set() or busy:
+                now = time.time()
+                if end is not None and now >= end:
+                    self.__stopped.set()
+                while queue and queue[0][0] <= now and not self.__stopped.is_set():
+                    _, hostname = heapq.heappop(queue)
+                    device = self.__devices[hostname]
+                    jobs, scheduled = self.__due__(device, now)
+                    if jobs:
+                        busy += 1
+                        tasks.put((device, jobs, scheduled))
+                        continue
+                    due = self.__next__(device, now)
+                    if due is not None:
+                        heapq.heappush(queue, (due, hostname))
+
+                wakeups = [queue[0][0]] if queue and not self.__stopped.is_set() else []
+                if end is not None and not self.__stopped.is_set():
+                    wakeups.append(end)
+                if not busy and not wakeups:
+                    break
+                try:
+                    timeout = max(min(wakeups) - time.time(), 0) if wakeups else None
+                    # wake up now and then to notice stop()
+                    device, samples = results.get(timeout=min(timeout, 1.0) if timeout is not None else 1.0)
+                except Queue.Empty:
+                    continue
+
+                busy -= 1
+                for job, scheduled, timestamp, elapsed, result, exception in samples:
+                    skipped = device.skipped[job.name]
+                    device.skipped[job.name] = 0
+                    yield Sample(device.params['hostname'], job.name, scheduled, timestamp, elapsed, result,
+                                 exception, skipped)
+                due = self.__next__(device, time.time())
+                if due is not None:
+                    heapq.heappush(queue, (due, device.params['hostname']))
+        finally:
+            self.__stopped.set()
+            for _ in workers:
+                tasks.put(None)
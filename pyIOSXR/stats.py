@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Latency and size statistics of the rpc calls made to devices running IOS-XR."""
+
+# Copyright 2015 Netflix. All rights reserved.
+# Copyright 2016 BigWaveIT. All rights reserved.
+#
+# The contents of this file are licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the
+# License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import re
+import time
+import heapq
+import bisect
+import threading
+import collections
+
+# Phases of an rpc call, in order: sending the request, waiting for the response, removing the XML agent
+# prompt, parsing the XML and checking the response for errors. Streamed calls only have send and wait.
+PHASES = ('send', 'wait', 'strip', 'parse', 'check')
+
+# Upper bounds of the histogram buckets in seconds.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Calls are classified from the start of the command: its operations open there, configurations loaded can be
+# megabytes long.
+__KIND_PREFIX__ = 512
+
+# Length the commands of RPCRecords are cut to, so records kept do not hold on to whole configurations.
+__COMMAND_LENGTH__ = 200
+
+__TAG__ = re.compile(r'<(/?)(\w+)[^>]*?(/?)>')
+
+# A finished rpc call. rpc_command is cut to __COMMAND_LENGTH__ characters. phases maps the phases completed to
+# their duration in seconds, error is the exception raised or None.
+RPCRecord = collections.namedtuple('RPCRecord', [
+    'hostname', 'kind', 'rpc_command', 'started', 'elapsed', 'phases', 'bytes_sent', 'bytes_received', 'error'])
+
+
+def rpc_kind(rpc_command):
+    """
+    Classify a rpc command.
+
+    :param rpc_command: (str) rpc command, e.g. <Get><Operational>...</Operational></Get>
+    :return:            (str) Tag of the first operation, e.g. 'Get' or 'Commit', 'CLI Exec' and
+                        'CLI Configuration' for CLI commands. Lock and Unlock only count if the command does
+                        nothing else, so <Unlock/><Rollback>...</Rollback><Lock/> is a 'Rollback'.
+    """
+    first = None
+    cli = False
+    depth = 0
+    # stop at the first operation other than Lock and Unlock, looking at the start of the command only
+    for match in __TAG__.finditer(rpc_command, 0, __KIND_PREFIX__):
+        closing, tag, empty = match.groups()
+        if closing:
+            depth -= 1
+            if cli and depth == 0:
+                return 'CLI'
+            continue
+        if depth == 0:
+            if tag == 'Request' and first is None and not cli:
+                continue
+            if tag in ('Lock', 'Unlock'):
+                first = first or tag
+            elif tag == 'CLI' and not empty:
+                cli = True
+            else:
+                return tag
+        elif depth == 1 and cli:
+            return 'CLI ' + tag
+        if not empty:
+            depth += 1
+    if cli:
+        return 'CLI'
+    return first or 'Unknown'
+
+
+class Histogram(object):
+    """Count of durations per bucket, plus their sum, minimum and maximum."""
+
+    __slots__ = ('counts', 'count', 'sum', 'min', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        """Add a duration in seconds."""
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, percent):
+        """
+        Estimate a percentile from the buckets.
+
+        :param percent: (float) Percentile, e.g. 99
+        :return:        (float) Upper bound of the bucket the percentile falls in, capped at the maximum
+        """
+        if not self.count:
+            return None
+        rank = self.count * percent / 100.0
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        """Export as dict, buckets are keyed by their upper bound like '0.25' and '+Inf'."""
+        buckets = collections.OrderedDict()
+        for bound, count in zip(BUCKETS + ('+Inf',), self.counts):
+            buckets[str(bound)] = count
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+            'buckets': buckets
+        }
+
+
+class _Totals(object):
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.elapsed = Histogram()
+        self.phases = collections.defaultdict(Histogram)
+
+    def add(self, record):
+        self.count += 1
+        self.errors += record.error is not None
+        self.bytes_sent += record.bytes_sent
+        self.bytes_received += record.bytes_received
+        self.elapsed.add(record.elapsed)
+        for phase, duration in record.phases.items():
+            self.phases[phase].add(duration)
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'elapsed': self.elapsed.as_dict(),
+            'phases': dict((phase, self.phases[phase].as_dict()) for phase in PHASES if phase in self.phases)
+        }
+
+
+class RPCStats:
+    """Statistics of rpc calls, aggregated per rpc kind and per device."""
+
+    def __init__(self, callbacks=None, slowest=10):
+        """
+        Rpc call statistics, a single instance can be shared by many devices.
+
+        :param callbacks: List of callables called with the RPCRecord of every call, e.g. to log slow calls
+        :param slowest:   (int) Number of slowest calls to keep the records of (default: 10)
+        """
+        self.callbacks = list(callbacks or [])
+        self.keep_slowest = slowest
+        self.__kinds = collections.defaultdict(_Totals)
+        self.__hosts = collections.defaultdict(_Totals)
+        self.__slowest = []
+        self.__lock = threading.Lock()
+
+    def recorder(self, hostname):
+        """Recorder for the calls to a device, handed to the functions executing rpc calls."""
+        return _Recorder(self, hostname)
+
+    def add(self, record):
+        """
+        Add a finished call.
+
+        :param record: RPCRecord of the call
+        """
+        with self.__lock:
+            self.__kinds[record.kind].add(record)
+            self.__hosts[record.hostname].add(record)
+            if self.keep_slowest:
+                entry = (record.elapsed, record.started, record)
+                if len(self.__slowest) < self.keep_slowest:
+                    heapq.heappush(self.__slowest, entry)
+                else:
+                    heapq.heappushpop(self.__slowest, entry)
+        for callback in self.callbacks:
+            callback(record)
+
+    def slowest(self):
+        """List of the RPCRecords of the slowest calls, slowest first."""
+        with self.__lock:
+            return [record for _, _, record in sorted(self.__slowest, reverse=True)]
+
+    def as_dict(self):
+        """
+        Export the statistics.
+
+        :return: dict with the totals and histograms of elapsed time and per phase time, keyed by rpc kind
+                 under 'kinds' and by hostname under 'hosts', and the slowest calls under 'slowest'
+        """
+        with self.__lock:
+            kinds = dict((kind, totals.as_dict()) for kind, totals in self.__kinds.items())
+            hosts = dict((hostname, totals.as_dict()) for hostname, totals in self.__hosts.items())
+        slowest = [{
+            'hostname': record.hostname,
+            'kind': record.kind,
+            'rpc_command': record.rpc_command,
+            'elapsed': record.elapsed,
+            'error': repr(record.error) if record.error is not None else None
+        } for record in self.slowest()]
+        return {'kinds': kinds, 'hosts': hosts, 'slowest': slowest}
+
+    def reset(self):
+        """Drop everything recorded so far."""
+        with self.__lock:
+            self.__kinds.clear()
+            self.__hosts.clear()
+            self.__slowest = []
+
+
+class _Recorder(object):
+
+    __slots__ = ('stats', 'hostname')
+
+    def __init__(self, stats, hostname):
+        self.stats = stats
+        self.hostname = hostname
+
+    def timeout(self, rpc_command, timeout):
+        """Timeout of a call, the one given as statistics do not change it."""
+        return timeout
+
+    def record(self, rpc_command, stamps, bytes_sent, bytes_received, error=None, kind=None):
+        """
+        Record a call.
+
+        :param rpc_command:    (str) rpc command without request envelope
+        :param stamps:         List of time.time() values taken at the start of the call and at the end of
+                               every phase completed, in the order of PHASES
+        :param bytes_sent:     (int) Size of the request
+        :param bytes_received: (int) Size of the response
+        :param error:          Exception raised by the call or None
+        :param kind:           (str) rpc_kind(rpc_command) if already known
+        """
+        now = time.time()
+        phases = dict(zip(PHASES, [end - start for start, end in zip(stamps, stamps[1:])]))
+        self.stats.add(RPCRecord(self.hostname, kind or rpc_kind(rpc_command), rpc_command[:__COMMAND_LENGTH__],
+                                 stamps[0], now - stamps[0], phases, bytes_sent, bytes_received, error))
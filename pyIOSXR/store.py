@@ -0,0 +1,440 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Compact columnar storage of the records collected from many devices running IOS-XR."""
+
+# Copyright 2015 Netflix. All rights reserved.
+# Copyright 2016 BigWaveIT. All rights reserved.
+#
+# The contents of this file are licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the
+# License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import os
+import re
+import json
+import mmap
+import array
+import struct
+import collections
+
+from backend import get_backend
+
+# Array type codes of integer columns, by increasing width. A column starts narrow and is widened when a value
+# does not fit. The smallest value of each type stands for None.
+__INT_TYPES__ = ('i', 'l')
+
+# Integers as they appear in XML responses, without leading zeros which would be lost.
+__INTEGER__ = re.compile(r'-?(0|[1-9][0-9]*)$')
+
+
+def __none__(typecode):
+    return -(1 << (8 * array.array(typecode).itemsize - 1))
+
+
+# Kind of column a value goes to.
+def __kind__(value):
+    if isinstance(value, (int, long)):
+        return 'int'
+    if isinstance(value, float):
+        return 'float'
+    return 'str'
+
+
+# Strings read back from JSON are unicode, ASCII ones are turned back into str as they were stored.
+def __text__(string):
+    try:
+        return string.encode('ascii')
+    except UnicodeEncodeError:
+        return string
+
+
+class _Column(object):
+    # A column of integers, floats or strings, strings are stored as codes into the table of the distinct
+    # strings of the column. The kind is set by the first value other than None, a column holding integers
+    # becomes a float column when a float comes along, and a string column for anything else.
+
+    __slots__ = ('kind', 'values', 'strings', 'codes', 'size')
+
+    def __init__(self, size=0):
+        self.kind = None
+        self.values = None
+        self.strings = None
+        self.codes = None
+        self.size = size
+
+    def __start__(self, kind, typecode=None):
+        self.kind = kind
+        if kind == 'int':
+            typecode = typecode or __INT_TYPES__[0]
+            self.values = array.array(typecode, [__none__(typecode)]) * self.size
+        elif kind == 'float':
+            self.values = array.array('d', [float('nan')]) * self.size
+        else:
+            self.values = array.array('I', [0]) * self.size
+            self.strings = [None]
+            self.codes = {}
+
+    def __convert__(self, kind, typecode=None):
+        values = [self.get(index) for index in range(self.size)]
+        self.size = 0
+        self.__start__(kind, typecode)
+        for value in values:
+            self.append(value)
+
+    def append(self, value):
+        if value is not None:
+            kind = __kind__(value)
+            if self.kind is None:
+                self.__start__(kind)
+            elif kind != self.kind and self.kind != 'str':
+                # integers and floats make a float column, anything else a string column
+                self.__convert__('float' if set([kind, self.kind]) == set(['int', 'float']) else 'str')
+        self.__store__(value)
+        self.size += 1
+
+    def __store__(self, value):
+        if self.kind is None:
+            return
+        if self.kind == 'str':
+            self.values.append(self.__code__(value) if value is not None else 0)
+            return
+        if self.kind == 'float':
+            self.values.append(float(value) if value is not None else float('nan'))
+            return
+        typecode = self.values.typecode
+        if value is None:
+            self.values.append(__none__(typecode))
+            return
+        if value != __none__(typecode):
+            try:
+                self.values.append(value)
+                return
+            except OverflowError:
+                pass
+        wider = __INT_TYPES__.index(typecode) + 1
+        if wider < len(__INT_TYPES__):
+            self.__convert__('int', __INT_TYPES__[wider])
+        else:
+            self.__convert__('str')
+        self.__store__(value)
+
+    def __code__(self, value):
+        if not isinstance(value, basestring):
+            value = str(value)
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.strings)
+            self.strings.append(value)
+        return code
+
+    def get(self, index):
+        if self.kind is None:
+            return None
+        value = self.values[index]
+        if self.kind == 'int':
+            return None if value == __none__(self.values.typecode) else value
+        if self.kind == 'float':
+            return None if value != value else value
+        return self.strings[value]
+
+    @property
+    def nbytes(self):
+        if self.kind is None:
+            return 0
+        size = self.values.itemsize * len(self.values)
+        if self.strings is not None:
+            size += sum(len(string) for string in self.strings[1:])
+        return size
+
+
+class _MappedColumn(object):
+    # A column saved by ResultStore.save(), its values are read from the memory mapped file on access.
+
+    __slots__ = ('kind', 'typecode', 'itemsize', 'file', 'map', 'strings', 'size')
+
+    def __init__(self, path, kind, typecode, size, strings=None):
+        self.kind = kind
+        self.typecode = typecode
+        self.itemsize = struct.calcsize(typecode)
+        self.strings = strings
+        self.size = size
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    def get(self, index):
+        if not 0 <= index < self.size:
+            raise IndexError('column index out of range')
+        value = struct.unpack_from(self.typecode, self.map, index * self.itemsize)[0]
+        if self.kind == 'int':
+            return None if value == __none__(self.typecode) else value
+        if self.kind == 'float':
+            return None if value != value else value
+        return self.strings[value]
+
+    @property
+    def nbytes(self):
+        return 0
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
+
+
+class Row(object):
+    """A view of one row of a ResultStore, its fields are read from the columns on access."""
+
+    __slots__ = ('_store', '_index')
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    def __getattr__(self, name):
+        try:
+            return self._store.value(self._index, name)
+        except KeyError:
+            raise AttributeError(name)
+
+    def __getitem__(self, name):
+        return self._store.value(self._index, name)
+
+    def _asdict(self):
+        """The fields of the row as an OrderedDict."""
+        return collections.OrderedDict((name, self._store.value(self._index, name)) for name in self._store.fields)
+
+    def __eq__(self, other):
+        return isinstance(other, Row) and self._asdict() == other._asdict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'Row(%s)' % ', '.join('%s=%r' % item for item in self._asdict().items())
+
+
+# Table entries of a response: the outermost elements with a Naming child.
+def __entries__(element):
+    if element.find('Naming') is not None:
+        yield element
+        return
+    for child in element:
+        if isinstance(child.tag, basestring):
+            for entry in __entries__(child):
+                yield entry
+
+
+# Leaves of an entry as fields named by their path within the entry, e.g. Naming_InterfaceName.
+def __flatten__(element, prefix, fields):
+    for child in element:
+        if not isinstance(child.tag, basestring):
+            continue
+        if len(child):
+            __flatten__(child, prefix + child.tag + '_', fields)
+            continue
+        text = (child.text or '').strip()
+        if not text:
+            fields[prefix + child.tag] = None
+        elif __INTEGER__.match(text):
+            fields[prefix + child.tag] = int(text)
+        else:
+            fields[prefix + child.tag] = text
+    return fields
+
+
+class ResultStore:
+    """Records of many devices in typed columns, with a hostname column."""
+
+    def __init__(self, fields=None):
+        """
+        An empty store.
+
+        Records are stored column by column in arrays: integers take 4 or 8 bytes, floats 8 bytes and strings a
+        4 byte code into the distinct strings of their column. Columns are added as records with new fields come
+        in, earlier rows have None in them.
+
+        :param fields: List of field names to create the columns of up front, in order
+        """
+        self.__columns = collections.OrderedDict([('hostname', _Column())])
+        for name in fields or []:
+            self.__columns.setdefault(name, _Column())
+        self.__length = 0
+        self.__mapped = False
+
+    @property
+    def fields(self):
+        """Names of the columns, hostname first."""
+        return list(self.__columns)
+
+    @property
+    def nbytes(self):
+        """Bytes taken by the values of the columns and their distinct strings, 0 for a loaded store."""
+        return sum(column.nbytes for column in self.__columns.values())
+
+    def __len__(self):
+        return self.__length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.__length
+        if not 0 <= index < self.__length:
+            raise IndexError('row index out of range')
+        return Row(self, index)
+
+    def __iter__(self):
+        for index in xrange(self.__length):
+            yield Row(self, index)
+
+    def value(self, index, name):
+        """
+        Get a single value.
+
+        :param index: (int) Row
+        :param name:  (str) Field name, KeyError is raised for unknown fields
+        """
+        return self.__columns[name].get(index)
+
+    def column(self, name):
+        """
+        Get all values of a field.
+
+        :param name: (str) Field name
+        :return:     List of the values, in row order
+        """
+        column = self.__columns[name]
+        return [column.get(index) for index in xrange(self.__length)]
+
+    def append(self, hostname, record):
+        """
+        Add a record.
+
+        :param hostname: (str) Device the record belongs to
+        :param record:   namedtuple such as the records of pyIOSXR.parsers, or dict of field name to value.
+                         Values are int, long, float, str or None.
+        """
+        if self.__mapped:
+            raise TypeError('A loaded ResultStore is read-only')
+        values = record._asdict() if hasattr(record, '_asdict') else record
+        for name in values:
+            if name not in self.__columns:
+                self.__columns[name] = _Column(self.__length)
+        for name, column in self.__columns.items():
+            column.append(hostname if name == 'hostname' else values.get(name))
+        self.__length += 1
+
+    def extend(self, hostname, records):
+        """
+        Add several records of the same device.
+
+        :param hostname: (str) Device the records belong to
+        :param records:  Iterable of records, see append()
+        :return:         (int) Number of records added
+        """
+        count = 0
+        for record in records:
+            self.append(hostname, record)
+            count += 1
+        return count
+
+    def add_response(self, hostname, response, backend=None):
+        """
+        Add the table entries of an XML response, one row per entry.
+
+        The leaves of an entry become its fields, named by their path within the entry, e.g. the name of an
+        interface is in Naming_InterfaceName. Integer values are stored as int, all others as str.
+
+        :param hostname: (str) Device the response is from
+        :param response: Response element, or its string as returned by make_rpc_call
+        :param backend:  Backend to parse the string with, None for the default one
+        :return:         (int) Number of entries added
+        """
+        if isinstance(response, basestring):
+            response = (backend or get_backend()).fromstring(response)
+        return self.extend(hostname, (__flatten__(entry, '', collections.OrderedDict())
+                                      for entry in __entries__(response)))
+
+    def collect(self, results):
+        """
+        Add the results of a fleet job as they come in, e.g. from Fleet.run().
+
+        :param results: Iterable of DeviceResult. The result of every device is a list of records, a list of
+                        XML responses, or a single XML response.
+        :return:        List of the DeviceResult of the devices failed
+        """
+        failed = []
+        for result in results:
+            if not result.ok:
+                failed.append(result)
+                continue
+            items = result.result if isinstance(result.result, (list, tuple)) else [result.result]
+            for item in items:
+                if isinstance(item, basestring) or hasattr(item, 'tag'):
+                    self.add_response(result.hostname, item)
+                else:
+                    self.append(result.hostname, item)
+        return failed
+
+    def save(self, directory):
+        """
+        Write the store to a directory, a file per column, to be loaded memory mapped by load().
+
+        :param directory: (str) Directory, created if it does not exist
+        """
+        if self.__mapped:
+            raise TypeError('A loaded ResultStore cannot be saved again')
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        columns = []
+        for index, (name, column) in enumerate(self.__columns.items()):
+            path = os.path.join(directory, '%d.col' % index)
+            with open(path, 'wb') as column_file:
+                if column.values is not None:
+                    column.values.tofile(column_file)
+            typecode = column.values.typecode if column.values is not None else None
+            columns.append({'name': name, 'kind': column.kind, 'typecode': typecode,
+                            'itemsize': struct.calcsize(typecode) if typecode else None,
+                            'strings': column.strings[1:] if column.strings is not None else None})
+        with open(os.path.join(directory, 'schema.json'), 'wb') as schema:
+            json.dump({'length': self.__length, 'columns': columns}, schema)
+
+    @staticmethod
+    def load(directory):
+        """
+        Load a store written by save(). The columns are memory mapped rather than read, the store is read-only.
+
+        :param directory: (str) Directory given to save()
+        :return:          ResultStore
+        """
+        with open(os.path.join(directory, 'schema.json'), 'rb') as schema:
+            schema = json.load(schema)
+        store = ResultStore()
+        store.__columns = collections.OrderedDict()
+        store.__length = schema['length']
+        store.__mapped = True
+        for index, column in enumerate(schema['columns']):
+            name = str(column['name'])
+            if column['kind'] is None:
+                store.__columns[name] = _Column(store.__length)
+                continue
+            typecode = str(column['typecode'])
+            if struct.calcsize(typecode) != column['itemsize']:
+                raise ValueError('Column %s was saved on a platform with other integer sizes' % name)
+            strings = [None] + [__text__(string) for string in column['strings']] \
+                if column['strings'] is not None else None
+            store.__columns[name] = _MappedColumn(os.path.join(directory, '%d.col' % index), column['kind'],
+                                                  typecode, store.__length, strings)
+        return store
+
+    def close(self):
+        """Unmap the columns of a loaded store."""
+        for column in self.__columns.values():
+            if isinstance(column, _MappedColumn):
+                column.close()
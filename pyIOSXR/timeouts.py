@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Timeouts of the rpc calls to devices running IOS-XR, per rpc kind and learned from every device."""
+
+# Copyright 2015 Netflix. All rights reserved.
+# Copyright 2016 BigWaveIT. All rights reserved.
+#
+# The contents of this file are licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the
+# License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import math
+import time
+import threading
+import collections
+
+from stats import rpc_kind
+from exceptions import TimeoutError, EOFError, DeviceDownError
+
+# Kind of the login in open(), next to the rpc kinds of pyIOSXR.stats.rpc_kind.
+OPEN = 'Open'
+
+
+class _Latencies(object):
+
+    __slots__ = ('samples', 'timed_out')
+
+    def __init__(self, window):
+        self.samples = collections.deque(maxlen=window)
+        # set by a timeout, the adaptive timeout is not used again before a call succeeded
+        self.timed_out = False
+
+
+class _Breaker(object):
+
+    __slots__ = ('failures', 'until')
+
+    def __init__(self):
+        self.failures = 0
+        self.until = None
+
+
+class Timeouts:
+    """Timeouts per rpc kind, adapted to the latency of every device, and a circuit breaker per device."""
+
+    def __init__(self, kinds=None, adaptive=False, percentile=99, factor=3.0, minimum=5, samples=20, window=200,
+                 failures=3, cooldown=60):
+        """
+        Timeouts shared by many devices.
+
+        The timeout of a call is the one given for its kind, or the timeout of the device. In adaptive mode it
+        is lowered to factor times the percentile of the latency of the last window calls of that kind to the
+        device, once there are enough samples. A call timing out falls back to the full timeout for the next
+        call of its kind. A device with failures timeouts or lost connections in a row is taken as down:
+        calls to it fail right away with DeviceDownError for cooldown seconds, then a single call is let
+        through again to probe it.
+
+        :param kinds:      dict of rpc kind to timeout in seconds, e.g. {'Lock': 10, 'CLI Configuration': 300}.
+                           Kinds are those of pyIOSXR.stats.rpc_kind, 'Open' for the login in open()
+        :param adaptive:   (bool) Learn the timeouts from the latency of every device (default: False)
+        :param percentile: (float) Latency percentile the adaptive timeout is based on (default: 99)
+        :param factor:     (float) Adaptive timeout as a multiple of that percentile (default: 3.0)
+        :param minimum:    (float) Lowest adaptive timeout in seconds (default: 5)
+        :param samples:    (int) Calls of a kind to a device before its timeout is adapted (default: 20)
+        :param window:     (int) Number of the latest calls the percentile is taken over (default: 200)
+        :param failures:   (int) Timeouts or lost connections in a row a device is taken as down after, None
+                           to never take devices as down (default: 3)
+        :param cooldown:   (float) Seconds calls to a device taken as down fail right away (default: 60)
+        """
+        self.kinds = dict(kinds or {})
+        self.adaptive = adaptive
+        self.percentile = percentile
+        self.factor = factor
+        self.minimum = minimum
+        self.samples = int(samples)
+        self.window = int(window)
+        self.failures = failures
+        self.cooldown = cooldown
+        self.__latencies = {}
+        self.__breakers = collections.defaultdict(_Breaker)
+        self.__lock = threading.Lock()
+
+    def recorder(self, hostname, recorder=None):
+        """
+        Recorder for the calls to a device, handed to the functions executing rpc calls.
+
+        :param hostname: (str) Hostname of the device
+        :param recorder: Recorder of pyIOSXR.stats to pass the calls on to, None for none
+        """
+        return _Recorder(self, hostname, recorder)
+
+    def timeout(self, hostname, kind, default):
+        """
+        Get the timeout of a call, DeviceDownError is raised if the device is taken as down.
+
+        :param hostname: (str) Hostname of the device
+        :param kind:     (str) Kind of the call, see pyIOSXR.stats.rpc_kind
+        :param default:  (float) Timeout of the device, used for kinds without a timeout of their own
+        :return:         (float) Seconds
+        """
+        self.check(hostname)
+        timeout = self.kinds.get(kind, default)
+        if not self.adaptive:
+            return timeout
+        with self.__lock:
+            latencies = self.__latencies.get((hostname, kind))
+            if latencies is None or latencies.timed_out or len(latencies.samples) < self.samples:
+                return timeout
+            ordered = sorted(latencies.samples)
+        rank = int(math.ceil(len(ordered) * self.percentile / 100.0)) - 1
+        return min(timeout, max(self.minimum, ordered[max(rank, 0)] * self.factor))
+
+    def record(self, hostname, kind, elapsed, error=None):
+        """
+        Record the outcome of a call.
+
+        :param hostname: (str) Hostname of the device
+        :param kind:     (str) Kind of the call
+        :param elapsed:  (float) Duration in seconds
+        :param error:    Exception raised by the call or None. Only TimeoutError and EOFError count as
+                         failures of the device, any other response shows it is up.
+        """
+        failed = isinstance(error, (TimeoutError, EOFError))
+        with self.__lock:
+            latencies = self.__latencies.get((hostname, kind))
+            if latencies is None:
+                latencies = self.__latencies[(hostname, kind)] = _Latencies(self.window)
+            breaker = self.__breakers[hostname]
+            if not failed:
+                latencies.timed_out = False
+                if error is None:
+                    latencies.samples.append(elapsed)
+                breaker.failures = 0
+                breaker.until = None
+                return
+            latencies.timed_out = latencies.timed_out or isinstance(error, TimeoutError)
+            breaker.failures += 1
+            if self.failures is not None and breaker.failures >= self.failures:
+                breaker.until = time.time() + self.cooldown
+
+    def check(self, hostname):
+        """
+        Raise DeviceDownError if a device is taken as down.
+
+        :param hostname: (str) Hostname of the device
+        """
+        with self.__lock:
+            breaker = self.__breakers.get(hostname)
+            if breaker is None or breaker.until is None:
+                return
+            remaining = breaker.until - time.time()
+            if remaining <= 0:
+                # let a single call through to probe the device, it is down again if that one fails too
+                breaker.until = None
+                return
+            failures = breaker.failures
+        raise DeviceDownError('%s is down after %d failed calls in a row, retrying in %d sec' %
+                              (hostname, failures, math.ceil(remaining)))
+
+    def down(self):
+        """List of the hostnames of the devices taken as down."""
+        now = time.time()
+        with self.__lock:
+            return sorted(hostname for hostname, breaker in self.__breakers.items()
+                          if breaker.until is not None and breaker.until > now)
+
+    def reset(self, hostname=None):
+        """
+        Forget the latencies and failures of a device.
+
+        :param hostname: (str) Hostname of the device, None for all devices
+        """
+        with self.__lock:
+            for key in list(self.__latencies):
+                if hostname is None or key[0] == hostname:
+                    del self.__latencies[key]
+            for key in list(self.__breakers):
+                if hostname is None or key == hostname:
+                    del self.__breakers[key]
+
+
+class _Recorder(object):
+
+    __slots__ = ('timeouts', 'hostname', 'recorder', 'command', 'kind')
+
+    def __init__(self, timeouts, hostname, recorder):
+        self.timeouts = timeouts
+        self.hostname = hostname
+        self.recorder = recorder
+        self.command = self.kind = None
+
+    def __kind__(self, rpc_command):
+        # timeout() and record() of a call get the same command, it is classified once
+        if rpc_command is not self.command:
+            self.command, self.kind = rpc_command, rpc_kind(rpc_command)
+        return self.kind
+
+    def timeout(self, rpc_command, timeout):
+        """Timeout of a call, see Timeouts.timeout."""
+        if self.recorder is not None:
+            timeout = self.recorder.timeout(rpc_command, timeout)
+        return self.timeouts.timeout(self.hostname, self.__kind__(rpc_command), timeout)
+
+    def record(self, rpc_command, stamps, bytes_sent, bytes_received, error=None):
+        """Record a call, see pyIOSXR.stats."""
+        kind = self.__kind__(rpc_command)
+        self.command = None
+        self.timeouts.record(self.hostname, kind, time.time() - stamps[0], error)
+        if self.recorder is not None:
+            self.recorder.record(rpc_command, stamps, bytes_sent, bytes_received, error, kind=kind)
@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Connections to the XML agent of devices running IOS-XR without an ssh process in between."""
+
+# Copyright 2015 Netflix. All rights reserved.
+# Copyright 2016 BigWaveIT. All rights reserved.
+#
+# The contents of this file are licensed under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with the
+# License. You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations under
+# the License.
+
+import re
+import ssl
+import time
+import select
+import socket
+import pexpect
+
+from exceptions import EOFError
+
+# Transports by name and their default port: the ssh binary run by pexpect, an ssh channel opened by paramiko
+# in process, and the dedicated XML agent ('xml agent' and 'xml agent ssl') over plain TCP and over SSL.
+PORTS = {
+    'ssh': 22,
+    'paramiko': 22,
+    'tcp': 38751,
+    'ssl': 38752,
+}
+
+
+# Wait for a socket to be readable, returns False on timeout. select() fails on file descriptors from
+# FD_SETSIZE (1024) up, which a process with many devices open reaches, poll() has no such limit.
+def __wait_readable__(sock, timeout):
+    if not hasattr(select, 'poll'):
+        return bool(select.select([sock], [], [], timeout)[0])
+    poller = select.poll()
+    poller.register(sock, select.POLLIN | select.POLLPRI)
+    return bool(poller.poll(None if timeout is None else timeout * 1000))
+
+
+class SocketTransport(object):
+    """
+    A connection to the XML agent over a socket.
+
+    Offers the part of the pexpect.spawn interface pyIOSXR uses, so the helpers executing rpc calls work on
+    either. Responses are framed by their terminator: expect_exact() only searches the data received since
+    the last call, plus as much of the data before as the longest pattern needs.
+    """
+
+    def __init__(self, sock, logfile=None, timeout=30):
+        """
+        Wrap a connected socket.
+
+        Sends block for timeout at most, the socket is expected to have it set, e.g. with sock.settimeout().
+
+        :param sock:    Socket, SSL socket or anything else with recv, sendall, fileno and close
+        :param logfile: File-like object to save the communication to or None to disable logging
+        :param timeout: (int) Timeout of calls not given one (default: 30 sec)
+        """
+        self.sock = sock
+        self.logfile = logfile
+        self.timeout = timeout
+        self.delaybeforesend = None
+        self.buffer = ''
+        self.before = None
+        self.after = None
+        self.match = None
+        self.closed = False
+        self.eof = False
+
+    def fileno(self):
+        """File descriptor to select() on."""
+        return self.sock.fileno()
+
+    def __pending__(self):
+        # SSL sockets may hold data already decrypted, which select() does not see
+        pending = getattr(self.sock, 'pending', None)
+        return pending is not None and pending() > 0
+
+    def __log__(self, data):
+        if self.logfile is not None:
+            self.logfile.write(data)
+            self.logfile.flush()
+
+    def __recv__(self, size, deadline):
+        if not self.__pending__():
+            timeout = None if deadline is None else max(0, deadline - time.time())
+            if not __wait_readable__(self.sock, timeout):
+                raise pexpect.TIMEOUT('Timeout exceeded.')
+        try:
+            data = self.sock.recv(size)
+        except socket.timeout:
+            # e.g. the rest of a SSL record not arriving
+            raise pexpect.TIMEOUT('Timeout exceeded.')
+        except (socket.error, ssl.SSLError) as e:
+            raise pexpect.EOF(str(e))
+        if not data:
+            self.eof = True
+            raise pexpect.EOF('End Of File (EOF).')
+        self.__log__(data)
+        return data
+
+    def __deadline__(self, timeout):
+        if timeout == -1:
+            timeout = self.timeout
+        return None if timeout is None else time.time() + timeout
+
+    def send(self, s):
+        """Send a string, returns the number of bytes sent. Raises pexpect.TIMEOUT if the device stops reading."""
+        self.__log__(s)
+        try:
+            self.sock.sendall(s)
+        except socket.timeout:
+            raise pexpect.TIMEOUT('Timeout exceeded.')
+        except (socket.error, ssl.SSLError) as e:
+            raise IOError(str(e))
+        return len(s)
+
+    def sendline(self, s=''):
+        """Send a string followed by a line feed, returns the number of bytes sent."""
+        return self.send(s + '\n')
+
+    def read_nonblocking(self, size=1, timeout=-1):
+        """
+        Read what is available, up to size bytes.
+
+        :param timeout: (int) Seconds to wait for data, -1 for the default timeout, None to wait forever
+        :return:        (str) The data, pexpect.TIMEOUT or pexpect.EOF are raised like by pexpect
+        """
+        if self.buffer:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+            return data
+        return self.__recv__(size, self.__deadline__(timeout))
+
+    def expect_exact(self, pattern_list, timeout=-1):
+        """
+        Wait for one of several strings.
+
+        :param pattern_list: List of strings, or a single string
+        :param timeout:      (int) Seconds to wait, -1 for the default timeout, None to wait forever
+        :return:             (int) Index of the string found first. The data in front of it is in before, the
+                             string itself in match and after, the data following it is kept for the next call.
+        """
+        if isinstance(pattern_list, basestring):
+            pattern_list = [pattern_list]
+        overlap = max(len(pattern) for pattern in pattern_list) - 1
+        deadline = self.__deadline__(timeout)
+        chunks = []
+        size = 0
+        tail = ''
+        chunk, self.buffer = self.buffer, ''
+        try:
+            while True:
+                window = tail + chunk
+                chunks.append(chunk)
+                size += len(chunk)
+                found = [(window.find(pattern), index) for index, pattern in enumerate(pattern_list)]
+                found = [(position, index) for position, index in found if position != -1]
+                if found:
+                    position, index = min(found)
+                    start = size - len(window) + position
+                    end = start + len(pattern_list[index])
+                    data = ''.join(chunks) if len(chunks) > 1 else chunk
+                    self.before = data[:start]
+                    self.match = self.after = pattern_list[index]
+                    self.buffer = data[end:]
+                    return index
+                tail = window[len(window) - overlap:] if overlap else ''
+                chunk = self.__recv__(65536, deadline)
+        except (pexpect.TIMEOUT, pexpect.EOF):
+            self.before = self.buffer = ''.join(chunks)
+            raise
+
+    def expect(self, pattern, timeout=-1):
+        """
+        Wait for one of several regular expressions, used to log in.
+
+        :param pattern: List of regular expressions or pexpect.EOF, or a single one
+        :param timeout: (int) Seconds to wait, -1 for the default timeout, None to wait forever
+        :return:        (int) Index of the pattern matching first
+        """
+        patterns = pattern if isinstance(pattern, list) else [pattern]
+        expressions = [re.compile(p) if p is not pexpect.EOF else None for p in patterns]
+        deadline = self.__deadline__(timeout)
+        data, self.buffer = self.buffer, ''
+        while True:
+            found = None
+            for index, expression in enumerate(expressions):
+                match = expression.search(data) if expression is not None else None
+                if match is not None and (found is None or match.start() < found[1].start()):
+                    found = (index, match)
+            if found is not None:
+                index, match = found
+                self.before = data[:match.start()]
+                self.match = match
+                self.after = match.group()
+                self.buffer = data[match.end():]
+                return index
+            try:
+                data += self.__recv__(65536, deadline)
+            except pexpect.EOF:
+                self.before = data
+                if pexpect.EOF in patterns:
+                    return patterns.index(pexpect.EOF)
+                raise
+            except pexpect.TIMEOUT:
+                self.before = self.buffer = data
+                raise
+
+    def isalive(self):
+        """True until the connection is closed, by either side."""
+        return not self.closed and not self.eof
+
+    def close(self, force=False):
+        """Close the connection, force is accepted for compatibility with pexpect."""
+        if not self.closed:
+            self.sock.close()
+            self.closed = True
+
+
+class ParamikoTransport(SocketTransport):
+    """A connection to the XML TTY agent over an ssh channel opened by paramiko."""
+
+    def __init__(self, channel, client=None, logfile=None, timeout=30):
+        """
+        Wrap an ssh channel.
+
+        :param channel: paramiko.Channel with a shell on the device
+        :param client:  paramiko.SSHClient the channel belongs to, closed with the channel
+        :param logfile: File-like object to save the communication to or None to disable logging
+        :param timeout: (int) Timeout of calls not given one (default: 30 sec)
+        """
+        SocketTransport.__init__(self, channel, logfile, timeout)
+        self.client = client
+
+    def __pending__(self):
+        return self.sock.recv_ready()
+
+    def close(self, force=False):
+        """Close the channel and the ssh connection."""
+        SocketTransport.close(self, force)
+        if self.client is not None:
+            self.client.close()
+
+
+def connect_socket(hostname, port, timeout, use_ssl=False, ca_certs=None, logfile=None):
+    """
+    Connect to the dedicated XML agent, 'xml agent' or 'xml agent ssl' on the device.
+
+    :param hostname: (str) IP or FQDN of the device
+    :param port:     (int) Port of the agent, 38751 for TCP and 38752 for SSL by default
+    :param timeout:  (int) Timeout to connect, and of calls not given one
+    :param use_ssl:  (bool) Connect to the SSL agent
+    :param ca_certs: (str) File with the certificates to verify the device with. None to accept any
+                     certificate, as devices usually have self-signed ones.
+    :param logfile:  File-like object to save the communication to or None to disable logging
+    :return:         SocketTransport, not yet logged in
+    """
+    sock = socket.create_connection((hostname, port), timeout)
+    # reads wait in select(), the timeout bounds sends to a device not reading
+    sock.settimeout(timeout)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if use_ssl:
+        context = ssl.create_default_context(cafile=ca_certs)
+        if ca_certs is None:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        sock = context.wrap_socket(sock, server_hostname=hostname)
+    return SocketTransport(sock, logfile, timeout)
+
+
+def connect_ssh(hostname, port, username, password, timeout, logfile=None):
+    """
+    Open a shell on the device over ssh in process, needs paramiko.
+
+    Like the ssh binary run by pexpect, unknown host keys are accepted. Failing to authenticate or to open the
+    shell raises EOFError, as the device closing the connection does with the ssh binary.
+
+    :param hostname: (str) IP or FQDN of the device
+    :param port:     (int) SSH port
+    :param username: (str) Username
+    :param password: (str) Password
+    :param timeout:  (int) Timeout to connect, and of calls not given one
+    :param logfile:  File-like object to save the communication to or None to disable logging
+    :return:         ParamikoTransport, at the exec prompt
+    """
+    try:
+        import paramiko
+    except ImportError:
+        raise ImportError("The 'paramiko' transport needs paramiko, install it with 'pip install paramiko'")
+    client = paramiko.SSHClient()
+    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    try:
+        client.connect(hostname, port=port, username=username, password=password, timeout=timeout,
+                       look_for_keys=False, allow_agent=False)
+        channel = client.invoke_shell()
+        # reads wait in select(), the timeout bounds sends to a device not reading
+        channel.settimeout(timeout)
+    except paramiko.AuthenticationException as e:
+        client.close()
+        raise EOFError('ssh authentication failed: %s' % e)
+    except paramiko.SSHException as e:
+        client.close()
+        raise EOFError('ssh error: %s' % e)
+    except Exception:
+        client.close()
+        raise
+    return ParamikoTransport(channel, client, logfile, timeout)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""A stand-in for the login shell and XML TTY agent of a device running IOS-XR.
+
+Usage: fake_agent.py [latency [size [port]]]
+
+latency is the number of seconds to wait before every response, size the number of bytes of output the
+show commands and Get requests return besides the echo of the command, other commands are just echoed. The
+running config and the merged candidate config are about size bytes long and differ in one line.
+
+If a port is given, the agent stands in for the dedicated XML agent over TCP instead and serves any number
+of connections on that port, logging in with any username and password. Port 0 picks a free port, which is
+printed on the first line of the output.
+"""
+
+import os
+import re
+import sys
+import tty
+import time
+import socket
+import threading
+
+PROMPT = '\r\nRP/0/RSP0/CPU0:router#'
+XML_PROMPT = '\r\nXML> '
+RESPONSE = '<?xml version="1.0" encoding="UTF-8"?><Response MajorVersion="1" MinorVersion="0">%s' \
+           '<ResultSummary ErrorCount="0"/></Response>'
+CONFIG_HEADER = 'Building configuration...\r\n!! IOS XR Configuration 5.3.3\r\n'
+
+
+def main(latency=0.0, size=0, port=None):
+    if port is not None:
+        return listen(latency, size, port)
+    fd = sys.stdin.fileno()
+    # no echo and no line length limit, like the agent on the device
+    tty.setraw(fd)
+    reader = Reader(fd)
+
+    write(sys.stdout.fileno(), 'password:')
+    reader.read(r'\r|\n')
+    write(sys.stdout.fileno(), PROMPT)
+    reader.read(r'\r|\n')
+    write(sys.stdout.fileno(), XML_PROMPT)
+    serve(reader, sys.stdout.fileno(), latency, size)
+
+
+def listen(latency, size, port):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('127.0.0.1', port))
+    server.listen(16)
+    write(sys.stdout.fileno(), '%d\n' % server.getsockname()[1])
+    while True:
+        connection, _ = server.accept()
+        thread = threading.Thread(target=login, args=(connection, latency, size))
+        thread.daemon = True
+        thread.start()
+
+
+def login(connection, latency, size):
+    connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    fd = connection.fileno()
+    reader = Reader(fd)
+    try:
+        write(fd, 'Username: ')
+        reader.read(r'\r|\n')
+        write(fd, 'Password: ')
+        reader.read(r'\r|\n')
+        write(fd, XML_PROMPT)
+        serve(reader, fd, latency, size)
+    except OSError:
+        # the client went away
+        pass
+    finally:
+        connection.close()
+
+
+def serve(reader, fd, latency, size):
+    outputs = {}
+    while True:
+        request = reader.read('</Request>')
+        if request is None:
+            return
+        time.sleep(latency)
+        write(fd, respond(request, size, outputs) + XML_PROMPT)
+
+
+class Reader(object):
+    """Reads the input up to a pattern, requests may span several lines."""
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.buf = ''
+
+    def read(self, pattern):
+        match = re.search(pattern, self.buf)
+        while match is None:
+            data = os.read(self.fd, 65536)
+            if not data:
+                return None
+            self.buf += data
+            match = re.search(pattern, self.buf)
+        data, self.buf = self.buf[:match.end()], self.buf[match.end():]
+        return data
+
+
+def write(fd, data):
+    while data:
+        data = data[os.write(fd, data):]
+
+
+def config(size, description='port'):
+    lines = ['hostname router', '!']
+    index = 0
+    length = 0
+    while length < size:
+        stanza = ['interface GigabitEthernet0/0/0/%d' % index, ' description %s %d' % (description, index),
+                  ' ipv4 address 10.%d.%d.1 255.255.255.0' % (index / 256 % 256, index % 256), '!']
+        lines += stanza
+        length += sum(len(line) + 2 for line in stanza)
+        index += 1
+    return CONFIG_HEADER + '\r\n'.join(lines + ['end', '', ''])
+
+
+def output(command, size):
+    if command == 'show running-config':
+        return config(size)
+    if command == 'show configuration merge':
+        return config(size).replace(' description port 0\r\n', ' description merged 0\r\n', 1)
+    if command == 'show configuration changes':
+        # the candidate config of the agent never changes anything
+        return CONFIG_HEADER + 'end\r\n'
+    lines = [command]
+    length = 0
+    while length < size:
+        line = '%-70d' % len(lines)
+        lines.append(line)
+        length += len(line) + 2
+    return '\r\n'.join(lines)
+
+
+def entries(size):
+    entry = '<Entry><Naming><Name>GigabitEthernet0/0/0/%d</Name></Naming><State>im-state-up</State>' \
+            '<MTU>9000</MTU><Bandwidth>1000000</Bandwidth></Entry>'
+    return ''.join(entry % index for index in range(size / len(entry % 0) + 1))
+
+
+def respond(request, size, outputs):
+    body = re.search('<Request[^>]*>(.*)</Request>', request, re.DOTALL).group(1)
+    match = re.match('<CLI><(Exec|Configuration)>(.*)</\\1></CLI>$', body, re.DOTALL)
+    if match is not None:
+        kind, command = match.groups()
+        if command.startswith('show') and command not in outputs:
+            outputs[command] = output(command, size)
+        return RESPONSE % ('<CLI><%s>\r\n%s\r\n</%s></CLI>' % (kind, outputs.get(command, command), kind))
+    if body.startswith('<Get>') and size:
+        if 'Get' not in outputs:
+            outputs['Get'] = entries(size)
+        return RESPONSE % body.replace('</Get>', outputs['Get'] + '</Get>', 1)
+    return RESPONSE % body
+
+
+if __name__ == '__main__':
+    main(*[float(arg) for arg in sys.argv[1:2]] + [int(arg) for arg in sys.argv[2:4]])
@@ -2,15 +2,47 @@
 # coding=utf-8
 """Unit tests for pyiosxr, a module to interact with Cisco devices running IOS-XR."""
 
+import os
 import sys
+import time
 import mock
 import unittest
+import difflib
+import collections
+import shutil
+import socket
+import tempfile
+import subprocess
 from xml.etree import ElementTree
 
 import pexpect
 from pyIOSXR import IOSXR
-from pyIOSXR.iosxr import __execute_show__, __execute_config_show__, __execute_rpc__
+from pyIOSXR.iosxr import __execute_show__, __execute_config_show__, __execute_rpc__, __execute_rpcs__
+from pyIOSXR.iosxr import __stream_rpc__, __StreamTarget__, __strip_show_output__
 from pyIOSXR.exceptions import XMLCLIError, InvalidInputError, TimeoutError, EOFError, IteratorIDError
+from pyIOSXR.exceptions import CancelledError, NoParserError
+from pyIOSXR import parsers
+from pyIOSXR.fleet import Fleet
+from pyIOSXR import aio
+from pyIOSXR import diff
+from pyIOSXR.diff import Change
+from pyIOSXR.pool import SessionPool
+from pyIOSXR.cache import ConfigCache, parse_commit_id
+from pyIOSXR.stats import RPCStats, rpc_kind, PHASES
+from pyIOSXR.backend import Backend, get_backend, set_backend, available, detect
+from pyIOSXR.transport import SocketTransport
+from pyIOSXR.rollout import Rollout, COMMITTED, UNCHANGED, ROLLED_BACK, NOT_COMMITTED, ROLLBACK_FAILED
+from pyIOSXR.exceptions import VerificationError
+from pyIOSXR.scheduler import Scheduler, Sample
+from pyIOSXR.delta import ChangeDetector, records
+from pyIOSXR.store import ResultStore
+from pyIOSXR.fleet import DeviceResult
+from pyIOSXR.timeouts import Timeouts
+from pyIOSXR.exceptions import DeviceDownError
+from pyIOSXR.query import Query, decode
+from pyIOSXR.render import Renderer, digest
+from pyIOSXR.recording import Recording, Replay, RecordingWriter, ReplayTransport
+from pyIOSXR.exceptions import ReplayError
 
 
 # test helpers
@@ -238,6 +270,118 @@ class TestExecuteRpc(unittest.TestCase):
         self.assertRaises(IteratorIDError, __execute_rpc__, device=device, rpc_command='<Get></Get>', timeout=10)
 
 
+# def __execute_rpcs__(device, rpc_commands, timeout, batch_size=None):
+
+class TestExecuteRpcs(unittest.TestCase):
+
+    def test_execute_rpcs_device_make_rpc_calls_xml(self):
+        '''
+        Test pyiosxr helper __execute_rpcs__ with responses from xml files
+        Should return the operations per rpc command and the error of the failed one
+        '''
+        def expect_exact(foo, timeout):
+            return 0
+        device = mock.Mock()
+        setattr(device, 'sendline', mock.Mock())
+        setattr(device, 'expect_exact', expect_exact)
+        setattr(device, 'match', '')
+        setattr(device, 'before', open('test/device_make_rpc_calls.xml').read())
+        results = __execute_rpcs__(device=device, rpc_commands=['<Get><Operational><SystemTime/></Operational></Get>',
+                                                                '<Get><Operational><Foo/></Operational></Get>',
+                                                                '<Unlock/><Rollback><Previous>1</Previous></Rollback><Lock/>'],
+                                   timeout=10)
+        self.assertEqual(1, device.sendline.call_count)
+        self.assertIn('<Hour>14</Hour>', results[0])
+        self.assertIsInstance(results[1], XMLCLIError)
+        self.assertEqual('<Unlock /><Rollback><Previous>1</Previous></Rollback><Lock />', results[2])
+
+    def test_execute_rpcs_XMLCLIError(self):
+        '''
+        Test pyiosxr helper __execute_rpcs__ with a response not matching the request
+        Should return XMLCLIError
+        '''
+        def sendline(foo):
+            pass
+        def expect_exact(foo, timeout):
+            return 0
+        device = mock.Mock()
+        setattr(device, 'sendline', sendline)
+        setattr(device, 'expect_exact', expect_exact)
+        setattr(device, 'match', '')
+        setattr(device, 'before', open('test/device_close.xml').read())
+        self.assertRaises(XMLCLIError, __execute_rpcs__, device=device, rpc_commands=['<Unlock/>', '<Lock/>'],
+                          timeout=10)
+
+
+# def __stream_rpc__(device, rpc_command, timeout, target):
+
+def chunked_device(filename, size):
+    '''
+    Mock device returning the content of a xml file in chunks of the given size
+    '''
+    data = open(filename).read().replace('\\r\\n', '\r\n') + '\r\nXML> '
+    chunks = [data[i:i+size] for i in range(0, len(data), size)]
+    device = mock.Mock()
+    device.read_nonblocking.side_effect = chunks
+    return device
+
+
+class TestStreamRpc(unittest.TestCase):
+
+    def test_stream_rpc_elements(self):
+        '''
+        Test pyiosxr helper __stream_rpc__ yielding elements
+        Should return the elements and detach them from the tree
+        '''
+        device = chunked_device('test/device_make_rpc_call.xml', 7)
+        target = __StreamTarget__(tag='Instance')
+        instances = list(__stream_rpc__(device, '<Get></Get>', 10, target))
+        self.assertEqual(1, len(instances))
+        self.assertEqual('default', instances[0].find('Naming/InstanceName').text)
+        self.assertIsNone(target.root.find('.//Instance'))
+
+    def test_stream_rpc_lines(self):
+        '''
+        Test pyiosxr helper __stream_rpc__ yielding text lines
+        Should return the output line by line
+        '''
+        device = chunked_device('test/device_show_interfaces.xml', 100)
+        lines = list(__stream_rpc__(device, '<CLI><Exec>show interfaces</Exec></CLI>', 10,
+                                    __StreamTarget__(text_of='Exec')))
+        response = open('test/device_show_interfaces.xml').read().replace('\\r\\n', '\r\n')
+        root = ElementTree.fromstring(response[response.index('<'):])
+        self.assertEqual(root.find('CLI/Exec').text.split('\n'), lines)
+
+    def test_stream_rpc_stop_early(self):
+        '''
+        Test pyiosxr helper __stream_rpc__ closed before the response is complete
+        Should read the rest of the response
+        '''
+        device = chunked_device('test/device_show_interfaces.xml', 100)
+        lines = __stream_rpc__(device, '<CLI><Exec>show interfaces</Exec></CLI>', 10, __StreamTarget__(text_of='Exec'))
+        next(lines)
+        lines.close()
+        self.assertRaises(StopIteration, device.read_nonblocking)
+
+    def test_stream_rpc_XMLCLIError(self):
+        '''
+        Test pyiosxr helper __stream_rpc__ with an error in the result summary
+        Should return XMLCLIError
+        '''
+        device = chunked_device('test/device_make_rpc_calls.xml', 50)
+        self.assertRaises(XMLCLIError, list, __stream_rpc__(device, '<Get></Get>', 10, __StreamTarget__(tag='Get')))
+
+    def test_stream_rpc_TimeoutError(self):
+        '''
+        Test pyiosxr helper __stream_rpc__ with pexpect.TIMEOUT
+        Should return TimeoutError
+        '''
+        device = mock.Mock()
+        device.read_nonblocking.side_effect = pexpect.TIMEOUT('error')
+        self.assertRaises(TimeoutError, list, __stream_rpc__(device, '<Get></Get>', 10, __StreamTarget__(tag='Get')))
+        self.assertEqual(1, device.read_nonblocking.call_count)
+
+
 # def __execute_show__(device, show_command, timeout):
 
 class TestExecuteShow(unittest.TestCase):
@@ -276,6 +420,24 @@ class TestExecuteConfigShow(unittest.TestCase):
         self.assertTrue(__execute_config_show__(device=device, show_command='show interfaces', timeout=10))
 
 
+# def __strip_show_output__(response):
+
+class TestStripShowOutput(unittest.TestCase):
+
+    def test_strip_show_output(self):
+        '''
+        Test pyiosxr helper __strip_show_output__
+        Should strip the output in front of the configuration, in linear time
+        '''
+        self.assertEqual('!! IOS XR Configuration 5.3.3\nend\n',
+                         __strip_show_output__('Building configuration...\n!! IOS XR Configuration 5.3.3\nend\n</Exec>'))
+        self.assertEqual('show version\n', __strip_show_output__('show version\n'))
+        output = 'x' * 1000000
+        started = time.time()
+        self.assertEqual(output, __strip_show_output__(output))
+        self.assertLess(time.time() - started, 1)
+
+
 # test class IOSXR
 
 #     def __init__(self, hostname, username, password, port=22, timeout=60, logfile=None, lock=True):
@@ -593,6 +755,144 @@ class TestMakeRpcCall(unittest.TestCase):
         device.open()
         self.assertTrue(device.make_rpc_call("<Get><Operational><LLDP><NodeTable></NodeTable></LLDP></Operational></Get>"))
 
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.__init__')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.expect')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.sendline')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.expect_exact')
+    def test_make_rpc_call_raw(self, mock_expect_exact, mock_sendline, mock_expect, mock_spawn):
+        '''
+        Test pyiosxr class make_rpc_call with element and raw
+        Should return the Response element, or the response as received without the prompt
+        '''
+        device = IOSXR(hostname='hostname', username='ejasinska', password='passwd', port=22, timeout=60, logfile=None, lock=False)
+        mock_spawn.return_value = None
+        mock_expect_exact.return_value = 0
+        device.open()
+        response = open('test/device_make_rpc_call.xml').read().rstrip()
+        device.device.before, device.device.match = response[:-len('</Response>')], '</Response>'
+        rpc_command = "<Get><Operational><LLDP><NodeTable></NodeTable></LLDP></Operational></Get>"
+        self.assertEqual('Response', device.make_rpc_call(rpc_command, element=True).tag)
+        self.assertEqual(response[response.find('<'):], device.make_rpc_call(rpc_command, raw=True))
+
+
+#     def iter_rpc(self, rpc_command):
+
+class TestIterRpc(unittest.TestCase):
+
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.__init__')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.expect')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.sendline')
+    @mock.patch('pyIOSXR.iosxr.__execute_rpc__')
+    def test_iter_rpc(self, mock_rpc, mock_sendline, mock_expect, mock_spawn):
+        '''
+        Test pyiosxr class iter_rpc
+        Should return every chunk, fetching the next one with GetNext
+        '''
+        device = IOSXR(hostname='hostname', username='ejasinska', password='passwd', port=22, timeout=60, logfile=None, lock=False)
+        mock_spawn.return_value = None
+        mock_rpc.side_effect = [ElementTree.fromstring('<Response IteratorID="1"><Get/></Response>'),
+                                ElementTree.fromstring('<Response IteratorID="1"><Get/></Response>'),
+                                ElementTree.fromstring('<Response><Get/></Response>')]
+        device.open()
+        self.assertEqual(3, len(list(device.iter_rpc('<Get><Operational><L2VPNForwarding/></Operational></Get>'))))
+        mock_rpc.assert_called_with(device.device, '<GetNext IteratorID="1"/>', 60, iterator=True, recorder=None,
+                                    backend=None)
+
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.__init__')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.expect')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.sendline')
+    @mock.patch('pyIOSXR.iosxr.__execute_rpc__')
+    def test_iter_rpc_stop_early(self, mock_rpc, mock_sendline, mock_expect, mock_spawn):
+        '''
+        Test pyiosxr class iter_rpc closed before the last chunk
+        Should abort the iterator on the device
+        '''
+        device = IOSXR(hostname='hostname', username='ejasinska', password='passwd', port=22, timeout=60, logfile=None, lock=False)
+        mock_spawn.return_value = None
+        mock_rpc.return_value = ElementTree.fromstring('<Response IteratorID="7"><Get/></Response>')
+        device.open()
+        chunks = device.iter_rpc('<Get><Operational><L2VPNForwarding/></Operational></Get>')
+        next(chunks)
+        chunks.close()
+        mock_rpc.assert_called_with(device.device, '<GetNext IteratorID="7" Abort="true"/>', 60, iterator=True,
+                                    recorder=None, backend=None)
+
+    def test_iter_rpc_device_iterator_id_error_xml(self):
+        '''
+        Test pyiosxr helper __execute_rpc__ with responses from xml files and iterator set
+        Should return ElementTree.Element object
+        '''
+        def expect_exact(foo, timeout):
+            return 0
+        device = mock.Mock()
+        setattr(device, 'expect_exact', expect_exact)
+        setattr(device, 'match', '')
+        setattr(device, 'before', open('test/device_iterator_id_error.xml').read())
+        root = __execute_rpc__(device=device, rpc_command='<Get></Get>', timeout=10, iterator=True)
+        self.assertEqual('1', root.get('IteratorID'))
+
+
+#     def stream_show(self, show_command, config=False):
+
+class TestStreamShow(unittest.TestCase):
+
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.__init__')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.expect')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.sendline')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.read_nonblocking')
+    def test_show_stream(self, mock_read, mock_sendline, mock_expect, mock_spawn):
+        '''
+        Test pyiosxr class show_* with stream=True
+        Should return the output lines without line endings
+        '''
+        device = IOSXR(hostname='hostname', username='ejasinska', password='passwd', port=22, timeout=60, logfile=None, lock=False)
+        mock_spawn.return_value = None
+        mock_read.side_effect = chunked_device('test/device_show_interfaces.xml', 64).read_nonblocking.side_effect
+        device.open()
+        lines = list(device.show_interfaces(stream=True))
+        self.assertEqual('Null0 is up, line protocol is up ', lines[0])
+        self.assertEqual('  Interface state transitions: 1', lines[1])
+
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.__init__')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.expect')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.sendline')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.read_nonblocking')
+    def test_show_parse(self, mock_read, mock_sendline, mock_expect, mock_spawn):
+        '''
+        Test pyiosxr class show_* with parse=True
+        Should return records
+        '''
+        device = IOSXR(hostname='hostname', username='ejasinska', password='passwd', port=22, timeout=60, logfile=None, lock=False)
+        mock_spawn.return_value = None
+        mock_read.side_effect = chunked_device('test/device_show_interfaces.xml', 64).read_nonblocking.side_effect
+        device.open()
+        interfaces = device.show_interfaces(parse=True)
+        self.assertEqual(5, len(interfaces))
+        self.assertIsInstance(interfaces[0], parsers.Interface)
+
+
+#     def make_rpc_calls(self, rpc_commands, batch_size=None):
+
+class TestMakeRpcCalls(unittest.TestCase):
+
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.__init__')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.expect')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.sendline')
+    @mock.patch('pyIOSXR.iosxr.__execute_rpc__')
+    def test_make_rpc_calls_batch_size(self, mock_rpc, mock_sendline, mock_expect, mock_spawn):
+        '''
+        Test pyiosxr class make_rpc_calls with batch_size
+        Should send one request per batch
+        '''
+        device = IOSXR(hostname='hostname', username='ejasinska', password='passwd', port=22, timeout=60, logfile=None, lock=False)
+        mock_spawn.return_value = None
+        mock_rpc.side_effect = [ElementTree.fromstring('<Response><Lock/><Unlock/></Response>'),
+                                ElementTree.fromstring('<Response><Lock/></Response>')]
+        device.open()
+        self.assertEqual(['<Lock />', '<Unlock />', '<Lock />'], device.make_rpc_calls(['<Lock/>', '<Unlock/>', '<Lock/>'],
+                                                                                     batch_size=2))
+        self.assertEqual(2, mock_rpc.call_count)
+
 
 #     def load_candidate_config(self, filename=None, config=None):
 
@@ -643,6 +943,93 @@ class TestLoadCandidateConfig(unittest.TestCase):
         self.assertRaises(InvalidInputError, device.load_candidate_config, config='config')
 
 
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.__init__')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.expect')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.sendline')
+    @mock.patch('pyIOSXR.iosxr.__execute_rpc__')
+    def test_load_candidate_config_chunked(self, mock_rpc, mock_sendline, mock_expect, mock_spawn):
+        '''
+        Test pyiosxr class load_candidate_config with chunk_size
+        Should load the config in chunks split at top-level stanzas and report the progress
+        '''
+        device = IOSXR(hostname='hostname', username='ejasinska', password='passwd', port=22, timeout=60, logfile=None, lock=False)
+        mock_spawn.return_value = None
+        device.open()
+        progress = []
+        config = 'hostname r1\ninterface Loopback0\n description lo0\n!\ninterface Loopback1\n description lo1\n!\n'
+        device.load_candidate_config(config=config, chunk_size=60, progress=lambda *args: progress.append(args))
+        self.assertEqual(['<CLI><Configuration>hostname r1\ninterface Loopback0\n description lo0\n!\n'
+                          '</Configuration></CLI>',
+                          '<CLI><Configuration>interface Loopback1\n description lo1\n!\n</Configuration></CLI>'],
+                         [call[0][1] for call in mock_rpc.call_args_list])
+        self.assertEqual([(51, 90), (90, 90)], progress)
+
+        mock_rpc.reset_mock()
+        device.load_candidate_config(filename='test/config.txt', chunk_size=1000)
+        self.assertEqual(open('test/config.txt').read(),
+                         ''.join(call[0][1][len('<CLI><Configuration>'):-len('</Configuration></CLI>')]
+                                 for call in mock_rpc.call_args_list))
+
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.__init__')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.expect')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.sendline')
+    @mock.patch('pyIOSXR.iosxr.__execute_rpc__')
+    def test_load_candidate_config_chunked_rpl(self, mock_rpc, mock_sendline, mock_expect, mock_spawn):
+        '''
+        Test pyiosxr class load_candidate_config with chunk_size and route policies and sets
+        Should never split a route-policy or a prefix-set from its end-policy or end-set
+        '''
+        device = IOSXR(hostname='hostname', username='ejasinska', password='passwd', port=22, timeout=60, logfile=None, lock=False)
+        mock_spawn.return_value = None
+        device.open()
+        policy = 'route-policy PASS\n  if destination in PREFIXES then\n    pass\n  endif\nend-policy\n!\n'
+        prefixes = 'prefix-set PREFIXES\n192.0.2.0/24,\n198.51.100.0/24\nend-set\n!\n'
+        config = 'hostname r1\n' + prefixes + policy + 'interface Loopback0\n description lo0\n!\n'
+        device.load_candidate_config(config=config, chunk_size=10)
+        self.assertEqual(['hostname r1\n', prefixes, policy, 'interface Loopback0\n description lo0\n!\n'],
+                         [call[0][1][len('<CLI><Configuration>'):-len('</Configuration></CLI>')]
+                          for call in mock_rpc.call_args_list])
+
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.__init__')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.expect')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.sendline')
+    @mock.patch('pyIOSXR.iosxr.__execute_rpc__')
+    def test_load_candidate_config_chunked_banner(self, mock_rpc, mock_sendline, mock_expect, mock_spawn):
+        '''
+        Test pyiosxr class load_candidate_config with chunk_size and banners with text at column 0
+        Should never split a banner before its closing delimiter
+        '''
+        device = IOSXR(hostname='hostname', username='ejasinska', password='passwd', port=22, timeout=60,
+                       logfile=None, lock=False)
+        mock_spawn.return_value = None
+        device.open()
+        motd = 'banner motd ^\nAuthorized access only\nDisconnect now\n^\n'
+        login = 'banner login ^C\nLab router\n^C\n'
+        config = 'hostname r1\n' + motd + login + 'banner exec #one line#\n' + 'interface Loopback0\n!\n'
+        device.load_candidate_config(config=config, chunk_size=10)
+        self.assertEqual(['hostname r1\n', motd, login, 'banner exec #one line#\n', 'interface Loopback0\n!\n'],
+                         [call[0][1][len('<CLI><Configuration>'):-len('</Configuration></CLI>')]
+                          for call in mock_rpc.call_args_list])
+
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.__init__')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.expect')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.sendline')
+    @mock.patch('pyIOSXR.iosxr.IOSXR.discard_config')
+    @mock.patch('pyIOSXR.iosxr.__execute_rpc__')
+    def test_load_candidate_config_chunked_InvalidInputError(self, mock_rpc, mock_discard, mock_sendline, mock_expect,
+                                                              mock_spawn):
+        '''
+        Test pyiosxr class load_candidate_config with chunk_size and invalid input in the first chunk
+        Should discard the config and return InvalidInputError without loading further chunks
+        '''
+        device = IOSXR(hostname='hostname', username='ejasinska', password='passwd', port=22, timeout=60, logfile=None, lock=False)
+        mock_spawn.return_value = None
+        mock_rpc.side_effect = InvalidInputError('error')
+        device.open()
+        self.assertRaises(InvalidInputError, device.load_candidate_config, config='a\nb\nc\n', chunk_size=1)
+        self.assertEqual(1, mock_rpc.call_count)
+        mock_discard.assert_called_with()
+
 #     def get_candidate_config(self, merge=False, formal=False):
 
 class TestGetCandidateConfig(unittest.TestCase):
@@ -683,6 +1070,27 @@ class TestCompareConfig(unittest.TestCase):
         self.assertEqual('', device.compare_config())
 
 
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.__init__')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.expect')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.sendline')
+    @mock.patch('pyIOSXR.iosxr.__execute_config_show__')
+    def test_compare_config_structured(self, mock_show, mock_sendline, mock_expect, mock_spawn):
+        '''
+        Test pyiosxr class compare_config with structured=True
+        Should return the changed lines with the stanzas they are in
+        '''
+        device = IOSXR(hostname='hostname', username='ejasinska', password='passwd', port=22, timeout=60, logfile=None, lock=False)
+        mock_spawn.return_value = None
+        device.open()
+        header = 'Building configuration...\r\n!! IOS XR Configuration 5.3.3\r\n'
+        show_run = header + 'interface Loopback0\r\n description lo\r\n!\r\nend\r\n\r\n'
+        show_merge = header + 'interface Loopback0\r\n description new\r\n!\r\nend\r\n\r\n'
+        mock_show.side_effect = [show_merge, show_run]
+        self.assertEqual([Change('-', ('interface Loopback0',), 'description lo'),
+                          Change('+', ('interface Loopback0',), 'description new')],
+                         device.compare_config(structured=True))
+
+
 #     def compare_replace_config(self):
 
     @mock.patch('pyIOSXR.iosxr.pexpect.spawn.__init__')
@@ -701,6 +1109,52 @@ class TestCompareConfig(unittest.TestCase):
         self.assertEqual('', device.compare_replace_config())
 
 
+# diff
+
+class TestDiff(unittest.TestCase):
+
+    def config(self, interfaces, peers):
+        lines = ['hostname router\r\n', '!\r\n']
+        for index in range(interfaces):
+            lines += ['interface GigabitEthernet0/0/0/%d\r\n' % index, ' description port %d\r\n' % index,
+                      ' mtu 9000\r\n', '!\r\n']
+        lines += ['router bgp 65000\r\n', ' address-family ipv4 unicast\r\n', ' !\r\n']
+        for index in range(peers):
+            lines += [' neighbor 192.0.2.%d\r\n' % index, '  remote-as %d\r\n' % (65001 + index),
+                      '  address-family ipv4 unicast\r\n', '   route-policy PASS in\r\n', '  !\r\n', ' !\r\n']
+        return lines + ['!\r\n', 'end\r\n']
+
+    def test_unified_diff(self):
+        '''
+        Test diff.unified_diff
+        Should apply the same changes as difflib.unified_diff
+        '''
+        old = self.config(50, 20)
+        new = list(old)
+        new[old.index(' description port 10\r\n')] = ' description changed\r\n'
+        new[new.index('  remote-as 65010\r\n')] = '  remote-as 1\r\n'
+        new[len(new) - 1:len(new) - 1] = ['ntp\r\n', ' server 192.0.2.1\r\n', '!\r\n']
+        self.assertEqual(''.join(difflib.unified_diff(old, new, n=0)), ''.join(diff.unified_diff(old, new)))
+        self.assertEqual('', ''.join(diff.unified_diff(old, old)))
+
+    def test_changes(self):
+        '''
+        Test diff.changes
+        Should return the changed lines with the path of the stanzas they are in
+        '''
+        old = self.config(50, 20)
+        new = list(old)
+        new[new.index('  remote-as 65010\r\n')] = '  remote-as 1\r\n'
+        start = new.index('interface GigabitEthernet0/0/0/7\r\n')
+        del new[start:start + 4]
+        self.assertEqual([Change('-', (), 'interface GigabitEthernet0/0/0/7'),
+                          Change('-', ('interface GigabitEthernet0/0/0/7',), 'description port 7'),
+                          Change('-', ('interface GigabitEthernet0/0/0/7',), 'mtu 9000'),
+                          Change('-', ('router bgp 65000', 'neighbor 192.0.2.9'), 'remote-as 65010'),
+                          Change('+', ('router bgp 65000', 'neighbor 192.0.2.9'), 'remote-as 1')],
+                         diff.changes(old, new))
+
+
 #     def commit_config(self, label=None, comment=None, confirmed=None):
 
 class TestCommitConfig(unittest.TestCase):
@@ -712,12 +1166,62 @@ class TestCommitConfig(unittest.TestCase):
     def test_commit_config(self, mock_rpc, mock_sendline, mock_expect, mock_spawn):
         '''
         Test pyiosxr class commit_config
-        Should return None
+        Should return True
         '''
         device = IOSXR(hostname='hostname', username='ejasinska', password='passwd', port=22, timeout=60, logfile=None, lock=False)
         mock_spawn.return_value = None
         device.open()
-        self.assertIsNone(device.commit_config(label='label', comment='comment', confirmed=30))
+        self.assertTrue(device.commit_config(label='label', comment='comment', confirmed=30))
+
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.__init__')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.expect')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.sendline')
+    @mock.patch('pyIOSXR.iosxr.__execute_rpc__')
+    @mock.patch('pyIOSXR.iosxr.__execute_config_show__')
+    def test_commit_config_skip_if_empty(self, mock_show, mock_rpc, mock_sendline, mock_expect, mock_spawn):
+        '''
+        Test pyiosxr class commit_config with skip_if_empty
+        Should only commit if show configuration changes lists changed lines
+        '''
+        device = IOSXR(hostname='hostname', username='ejasinska', password='passwd', port=22, timeout=60, logfile=None, lock=False)
+        mock_spawn.return_value = None
+        device.open()
+        mock_rpc.reset_mock()
+        mock_show.return_value = 'Building configuration...\r\n!! IOS XR Configuration 5.3.3\r\nend\r\n'
+        self.assertFalse(device.commit_config(skip_if_empty=True))
+        mock_rpc.assert_not_called()
+        self.assertEqual('show configuration changes', mock_show.call_args[0][1])
+
+        mock_show.return_value = 'Building configuration...\r\n!! IOS XR Configuration 5.3.3\r\n' \
+                                 'interface Loopback0\r\n description changed\r\n!\r\nend\r\n'
+        self.assertEqual('interface Loopback0\r\n description changed\r\n!\r\n', device.get_config_changes())
+        self.assertTrue(device.commit_config(skip_if_empty=True))
+        self.assertTrue(mock_rpc.call_args[0][1].startswith('<Commit'))
+
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.__init__')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.expect')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.sendline')
+    @mock.patch('pyIOSXR.iosxr.__execute_rpc__')
+    @mock.patch('pyIOSXR.iosxr.__execute_config_show__')
+    def test_commit_config_skip_if_empty_confirmed(self, mock_show, mock_rpc, mock_sendline, mock_expect, mock_spawn):
+        '''
+        Test pyiosxr class commit_config with skip_if_empty after a confirmed commit
+        Should confirm the pending commit although the candidate config is empty
+        '''
+        device = IOSXR(hostname='hostname', username='ejasinska', password='passwd', port=22, timeout=60, logfile=None, lock=False)
+        mock_spawn.return_value = None
+        device.open()
+        mock_show.return_value = 'Building configuration...\r\n!! IOS XR Configuration 5.3.3\r\n' \
+                                 'hostname r1\r\nend\r\n'
+        self.assertTrue(device.commit_config(confirmed=60, skip_if_empty=True))
+        self.assertTrue(device.pending_confirm)
+        mock_show.reset_mock()
+        mock_show.return_value = 'Building configuration...\r\n!! IOS XR Configuration 5.3.3\r\nend\r\n'
+        self.assertTrue(device.commit_config(skip_if_empty=True))
+        mock_show.assert_not_called()
+        self.assertEqual('<Commit/>', mock_rpc.call_args[0][1])
+        self.assertFalse(device.pending_confirm)
+        self.assertFalse(device.commit_config(skip_if_empty=True))
 
     @mock.patch('pyIOSXR.iosxr.pexpect.spawn.__init__')
     @mock.patch('pyIOSXR.iosxr.pexpect.spawn.expect')
@@ -745,12 +1249,30 @@ class TestCommitReplaceConfig(unittest.TestCase):
     def test_commit_replace_config(self, mock_rpc, mock_sendline, mock_expect, mock_spawn):
         '''
         Test pyiosxr class commit_replace_config
-        Should return None
+        Should return True
+        '''
+        device = IOSXR(hostname='hostname', username='ejasinska', password='passwd', port=22, timeout=60, logfile=None, lock=False)
+        mock_spawn.return_value = None
+        device.open()
+        self.assertTrue(device.commit_replace_config(label='label', comment='comment', confirmed=30))
+
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.__init__')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.expect')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.sendline')
+    @mock.patch('pyIOSXR.iosxr.__execute_rpc__')
+    @mock.patch('pyIOSXR.iosxr.__execute_config_show__')
+    def test_commit_replace_config_skip_if_empty(self, mock_show, mock_rpc, mock_sendline, mock_expect, mock_spawn):
+        '''
+        Test pyiosxr class commit_replace_config with skip_if_empty and no changes
+        Should return False without committing
         '''
         device = IOSXR(hostname='hostname', username='ejasinska', password='passwd', port=22, timeout=60, logfile=None, lock=False)
         mock_spawn.return_value = None
         device.open()
-        self.assertIsNone(device.commit_replace_config(label='label', comment='comment', confirmed=30))
+        mock_rpc.reset_mock()
+        mock_show.return_value = 'Building configuration...\r\n!! IOS XR Configuration 5.3.3\r\nend\r\n'
+        self.assertFalse(device.commit_replace_config(skip_if_empty=True))
+        mock_rpc.assert_not_called()
 
     @mock.patch('pyIOSXR.iosxr.pexpect.spawn.__init__')
     @mock.patch('pyIOSXR.iosxr.pexpect.spawn.expect')
@@ -767,5 +1289,1570 @@ class TestCommitReplaceConfig(unittest.TestCase):
         self.assertRaises(InvalidInputError, device.commit_replace_config, label='label', comment='comment', confirmed=900)
 
 
+# test module parsers
+
+BGP_SUMMARY = '''
+BGP router identifier 192.0.2.1, local AS number 65000
+BGP generic scan interval 60 secs
+BGP table state: Active
+Table ID: 0xe0000000   RD version: 12
+BGP main routing table version 12
+
+Process       RcvTblVer   bRIB/RIB   LabelVer  ImportVer  SendTblVer  StandbyVer
+Speaker              12         12         12         12          12           0
+
+Neighbor        Spk    AS MsgRcvd MsgSent   TblVer  InQ OutQ  Up/Down  St/PfxRcd
+192.0.2.2         0 65001    1523    1519       12    0    0 1d01h              5
+2001:db8:ffff:ffff::2
+                  0 65002       0       0        0    0    0 00:00:00 Idle
+192.0.2.3         0 65003       0       0        0    0    0 00:00:00 Idle (Admin)
+
+Total neighbors shown here may differ from the neighbors configured on the router
+'''
+
+ROUTE_SUMMARY = '''
+Route Source                     Routes     Backup     Deleted     Memory(bytes)
+connected                        2          0          0           480
+local                            2          0          0           480
+bgp 65000                        5          0          0           1200
+Total                            9          0          0           2160
+'''
+
+
+class TestParsers(unittest.TestCase):
+
+    def test_parse_interfaces(self):
+        '''
+        Test pyiosxr parsers with the output of show interfaces
+        Should return an Interface record per interface
+        '''
+        root = ElementTree.fromstring(open('test/device_show_interfaces.xml').read().replace('\\r\\n', '\r\n')[7:])
+        interfaces = parsers.parse('show interfaces', root.find('CLI/Exec').text)
+        self.assertEqual(['Null0', 'MgmtEth0/0/CPU0/0', 'GigabitEthernet0/0/0/0', 'GigabitEthernet0/0/0/1',
+                          'GigabitEthernet0/0/0/2'], [interface.name for interface in interfaces])
+        mgmt = interfaces[1]
+        self.assertEqual('192.168.1.166/24', mgmt.ip_address)
+        self.assertEqual('0800.279d.73fe', mgmt.mac_address)
+        self.assertEqual(1514, mgmt.mtu)
+        self.assertEqual(28000, mgmt.input_rate)
+        self.assertEqual(1233923, mgmt.input_bytes)
+        self.assertEqual(2178, mgmt.output_packets)
+        self.assertEqual('testing-xml-from-the-other-file', interfaces[2].description)
+        self.assertEqual('administratively down', interfaces[4].state)
+        self.assertIsNone(interfaces[0].ip_address)
+
+    def test_parse_interfaces_unexpected_lines(self):
+        '''
+        Test pyiosxr parsers with show interfaces lines starting like known ones but not matching them
+        Should skip these lines
+        '''
+        output = '\n'.join(['GigabitEthernet0/0/0/0 is up, line protocol is up',
+                             '  Internet address is ',
+                             '  No output errors, underruns or overruns',
+                             '  N/A carrier transitions',
+                             '  MTU 1514 bytes, BW 1000000 Kbit (Max: 1000000 Kbit)'])
+        interfaces = parsers.parse('show interfaces', output)
+        self.assertEqual(1, len(interfaces))
+        self.assertIsNone(interfaces[0].ip_address)
+        self.assertIsNone(interfaces[0].output_errors)
+        self.assertIsNone(interfaces[0].carrier_transitions)
+        self.assertEqual(1514, interfaces[0].mtu)
+
+    def test_parse_bgp_summary(self):
+        '''
+        Test pyiosxr parsers with the output of show bgp summary
+        Should return a BGPNeighbor record per neighbor
+        '''
+        neighbors = parsers.parse('show bgp ipv4 unicast summary', BGP_SUMMARY)
+        self.assertEqual(parsers.BGPNeighbor('192.0.2.2', 0, '65001', 1523, 1519, 12, 0, 0, '1d01h', 'Established', 5),
+                         neighbors[0])
+        self.assertEqual('2001:db8:ffff:ffff::2', neighbors[1].neighbor)
+        self.assertEqual('Idle', neighbors[1].state)
+        self.assertIsNone(neighbors[1].prefixes_received)
+        self.assertEqual('Idle (Admin)', neighbors[2].state)
+        self.assertEqual(3, len(neighbors))
+
+    def test_parse_route_summary(self):
+        '''
+        Test pyiosxr parsers with the output of show route summary
+        Should return a RouteSource record per route source
+        '''
+        sources = parsers.parse('show route summary', ROUTE_SUMMARY)
+        self.assertEqual(parsers.RouteSource('bgp 65000', 5, 0, 0, 1200), sources[2])
+        self.assertEqual('Total', sources[-1].source)
+
+    def test_parse_NoParserError(self):
+        '''
+        Test pyiosxr parsers with a command without parser
+        Should return NoParserError
+        '''
+        self.assertRaises(NoParserError, parsers.parse, 'show clock', '')
+
+
+# test class Fleet
+
+#     def run(self, job, deadline=None, fail_fast=False):
+
+class TestFleet(unittest.TestCase):
+
+    @mock.patch('pyIOSXR.fleet.IOSXR')
+    def test_run(self, mock_iosxr):
+        '''
+        Test pyiosxr fleet run
+        Should return one result per device
+        '''
+        mock_iosxr.return_value.make_rpc_call.return_value = '<Response/>'
+        fleet = Fleet(['r1', 'r2', {'hostname': 'r3', 'port': 2222}], username='ejasinska', password='passwd')
+        results = fleet.run_all(['<Get></Get>'])
+        self.assertEqual(set(['r1', 'r2', 'r3']), set(results))
+        self.assertTrue(all(result.ok for result in results.values()))
+        self.assertEqual(['<Response/>'], results['r1'].result)
+        mock_iosxr.assert_any_call(hostname='r3', username='ejasinska', password='passwd', port=2222)
+
+    def test_run_invalid_inventory(self):
+        '''
+        Test pyiosxr fleet run with an inventory entry IOSXR does not accept
+        Should report that device as failed and run the others
+        '''
+        def iosxr(hostname, username, password):
+            return mock_iosxr(hostname, username, password)
+        with mock.patch('pyIOSXR.fleet.IOSXR', side_effect=iosxr):
+            fleet = Fleet(['r1', {'hostname': 'r2', 'unknown': 1}], username='ejasinska', password='passwd')
+            results = fleet.run_all(lambda device: device.hostname)
+        self.assertEqual('r1', results['r1'].result)
+        self.assertIsInstance(results['r2'].exception, TypeError)
+
+    @mock.patch('pyIOSXR.fleet.IOSXR', side_effect=lambda **params: mock_iosxr(**params))
+    def test_run_closed_early(self, mock_class):
+        '''
+        Test pyiosxr fleet run with the loop over the results left after the first one
+        Should start no further devices
+        '''
+        def job(device):
+            time.sleep(0.05)
+            return device.hostname
+        fleet = Fleet(['r%d' % number for number in range(10)], username='ejasinska', password='passwd', workers=2)
+        results = fleet.run(job)
+        next(results)
+        results.close()
+        time.sleep(0.3)
+        # both workers may have started their next device before the loop was left
+        self.assertLessEqual(mock_class.call_count, 4)
+
+    def test_duplicate_hostname(self):
+        '''
+        Test pyiosxr fleet with a hostname twice in the inventory
+        Should return ValueError
+        '''
+        self.assertRaises(ValueError, Fleet, ['r1', {'hostname': 'r1', 'port': 2222}], username='ejasinska',
+                          password='passwd')
+
+    @mock.patch('pyIOSXR.fleet.IOSXR')
+    def test_run_collect_all(self, mock_iosxr):
+        '''
+        Test pyiosxr fleet run - failing job collecting all results
+        Should return a failed result per device
+        '''
+        def job(device):
+            raise XMLCLIError('error')
+        results = Fleet(['r1', 'r2'], username='ejasinska', password='passwd').run_all(job)
+        self.assertTrue(all(isinstance(result.exception, XMLCLIError) for result in results.values()))
+
+    @mock.patch('pyIOSXR.fleet.IOSXR')
+    def test_run_fail_fast(self, mock_iosxr):
+        '''
+        Test pyiosxr fleet run - fail fast
+        Should cancel the devices not yet run
+        '''
+        def job(device):
+            raise XMLCLIError('error')
+        fleet = Fleet(['r%d' % i for i in range(5)], username='ejasinska', password='passwd', workers=1)
+        results = list(fleet.run(job, fail_fast=True))
+        self.assertEqual(5, len(results))
+        self.assertIsInstance(results[0].exception, XMLCLIError)
+        self.assertTrue(all(isinstance(result.exception, CancelledError) for result in results[1:]))
+
+    @mock.patch('pyIOSXR.fleet.IOSXR')
+    def test_run_device_timeout(self, mock_iosxr):
+        '''
+        Test pyiosxr fleet run - device exceeding device_timeout
+        Should return TimeoutError
+        '''
+        def job(device):
+            time.sleep(1)
+        fleet = Fleet(['r1'], username='ejasinska', password='passwd', device_timeout=0.1)
+        results = fleet.run_all(job)
+        self.assertIsInstance(results['r1'].exception, TimeoutError)
+        self.assertLess(results['r1'].elapsed, 1)
+
+    @mock.patch('pyIOSXR.fleet.IOSXR')
+    def test_run_deadline(self, mock_iosxr):
+        '''
+        Test pyiosxr fleet run - global deadline
+        Should return TimeoutError for running and CancelledError for pending devices
+        '''
+        def job(device):
+            time.sleep(1)
+        fleet = Fleet(['r1', 'r2'], username='ejasinska', password='passwd', workers=1)
+        results = fleet.run_all(job, deadline=0.1)
+        self.assertIsInstance(results['r1'].exception, TimeoutError)
+        self.assertIsInstance(results['r2'].exception, CancelledError)
+
+
+# test class Rollout
+
+#     def run(self):
+
+class TestRollout(unittest.TestCase):
+
+    def devices(self, diffs):
+        '''
+        Replacement for IOSXR returning a mock per hostname, comparing to the given diff
+        '''
+        devices = {}
+        def iosxr(**params):
+            device = mock.Mock()
+            device.hostname = params['hostname']
+            device.compare_config.return_value = diffs[params['hostname']]
+            devices[params['hostname']] = device
+            return device
+        return devices, iosxr
+
+    def test_waves(self):
+        '''
+        Test pyiosxr Rollout waves
+        Should return the canary wave, then batches of the given share or size
+        '''
+        fleet = Fleet([], username='ejasinska', password='passwd')
+        hostnames = ['r%d' % i for i in range(10)]
+        self.assertEqual([['r0'], ['r1', 'r2', 'r3'], ['r4', 'r5', 'r6'], ['r7', 'r8', 'r9']],
+                         Rollout(fleet, config='', batch=0.25).waves(hostnames))
+        self.assertEqual([['r0', 'r1'], hostnames[2:6], hostnames[6:]],
+                         Rollout(fleet, config='', canary=2, batch=4).waves(hostnames))
+
+    def test_run(self):
+        '''
+        Test pyiosxr Rollout run
+        Should commit the changed devices confirmed and confirm them, leaving unchanged ones alone
+        '''
+        devices, iosxr = self.devices({'r1': '+ hostname r1', 'r2': '', 'r3': '+ hostname r3'})
+        with mock.patch('pyIOSXR.rollout.IOSXR', side_effect=iosxr):
+            fleet = Fleet(['r1', 'r2', 'r3'], username='ejasinska', password='passwd')
+            results = Rollout(fleet, config='hostname x', confirmed=60, label='change').run()
+        self.assertEqual(['r1', 'r2', 'r3'], list(results))
+        self.assertEqual([COMMITTED, UNCHANGED, COMMITTED], [result.result.state for result in results.values()])
+        self.assertEqual([0, None, 1], [result.result.wave for result in results.values()])
+        self.assertTrue(all(result.ok for result in results.values()))
+        self.assertEqual([mock.call('change', None, 60), mock.call()], devices['r1'].commit_config.call_args_list)
+        devices['r2'].commit_config.assert_not_called()
+        devices['r2'].discard_config.assert_called_with()
+        self.assertTrue(all(device.close.called for device in devices.values()))
+
+    def test_run_verify_failure(self):
+        '''
+        Test pyiosxr Rollout run with a device failing verification
+        Should roll back its wave and not commit the later waves
+        '''
+        devices, iosxr = self.devices(dict(('r%d' % i, '+ change') for i in range(5)))
+        with mock.patch('pyIOSXR.rollout.IOSXR', side_effect=iosxr):
+            fleet = Fleet(['r%d' % i for i in range(5)], username='ejasinska', password='passwd')
+            verify = lambda device: device.hostname != 'r2'
+            results = Rollout(fleet, config='hostname x', batch=2, verify=verify).run()
+        self.assertEqual([COMMITTED, ROLLED_BACK, ROLLED_BACK, NOT_COMMITTED, NOT_COMMITTED],
+                         [result.result.state for result in results.values()])
+        self.assertIsInstance(results['r2'].exception, VerificationError)
+        self.assertIsInstance(results['r1'].exception, CancelledError)
+        self.assertIsInstance(results['r3'].exception, CancelledError)
+        devices['r1'].rollback.assert_called_with()
+        devices['r3'].commit_config.assert_not_called()
+
+    def test_run_max_failures(self):
+        '''
+        Test pyiosxr Rollout run with failures within max_failures
+        Should roll back the failed devices alone and go on
+        '''
+        devices, iosxr = self.devices({'r1': '+ change', 'r2': '+ change', 'r3': '+ change'})
+        with mock.patch('pyIOSXR.rollout.IOSXR', side_effect=iosxr):
+            fleet = Fleet(['r1', 'r2', 'r3'], username='ejasinska', password='passwd')
+            verify = lambda device: device.hostname != 'r2'
+            results = Rollout(fleet, config='hostname x', batch=2, verify=verify, max_failures=1).run()
+        self.assertEqual([COMMITTED, ROLLED_BACK, COMMITTED], [result.result.state for result in results.values()])
+        devices['r3'].rollback.assert_not_called()
+
+    def test_run_rollback_failure(self):
+        '''
+        Test pyiosxr Rollout run with a rollback raising
+        Should report the device as ROLLBACK_FAILED with the exception of the rollback
+        '''
+        devices, iosxr = self.devices({'r1': '+ change', 'r2': '+ change'})
+
+        def failing(**params):
+            device = iosxr(**params)
+            if params['hostname'] == 'r2':
+                device.rollback.side_effect = TimeoutError('rollback')
+            return device
+        with mock.patch('pyIOSXR.rollout.IOSXR', side_effect=failing):
+            fleet = Fleet(['r1', 'r2'], username='ejasinska', password='passwd')
+            verify = lambda device: False
+            results = Rollout(fleet, config='hostname x', canary=0, batch=2, verify=verify).run()
+        self.assertEqual([ROLLED_BACK, ROLLBACK_FAILED], [result.result.state for result in results.values()])
+        self.assertIsInstance(results['r2'].exception, TimeoutError)
+        devices['r2'].discard_config.assert_called_with()
+
+
+# test class AsyncIOSXR
+
+def spawn_fake_agent(latency=0.0):
+    '''
+    Replacement for pexpect.spawn starting the fake XML agent instead of ssh
+    '''
+    spawn = pexpect.spawn
+    def fake_spawn(command, logfile=None):
+        return spawn(sys.executable, ['test/fake_agent.py', str(latency)], logfile=logfile)
+    return fake_spawn
+
+
+def open_descriptors(number):
+    '''
+    Open files until the file descriptors reach number, returns them. Skips the test if that many are not allowed
+    '''
+    fds = []
+    try:
+        while not fds or fds[-1] < number:
+            fds.append(os.open(os.devnull, os.O_RDONLY))
+    except OSError:
+        for fd in fds:
+            os.close(fd)
+        raise unittest.SkipTest('Not allowed to open %d files' % number)
+    return fds
+
+
+class TestAsyncIOSXR(unittest.TestCase):
+
+    def test_operations(self):
+        '''
+        Test pyiosxr AsyncIOSXR open, show, make_rpc_call and close on several devices
+        Should return the responses of every device
+        '''
+        with mock.patch('pyIOSXR.aio.pexpect.spawn', spawn_fake_agent()):
+            devices = [aio.AsyncIOSXR(hostname='r%d' % i, username='ejasinska', password='passwd') for i in range(3)]
+            aio.wait([device.open() for device in devices])
+            self.assertTrue(all(device.locked for device in devices))
+            shows = [device.show_version() for device in devices]
+            rpcs = [device.make_rpc_call('<Get><Operational><LLDP/></Operational></Get>') for device in devices]
+            completed = list(aio.as_completed(shows + rpcs))
+            self.assertEqual(6, len(completed))
+            self.assertEqual('show version\n', shows[0].result())
+            self.assertIn('<LLDP />', rpcs[2].result())
+            aio.wait([device.close() for device in devices])
+            self.assertTrue(all(device.device is None for device in devices))
+
+    def test_many_descriptors(self):
+        '''
+        Test pyiosxr AsyncIOSXR with file descriptors numbered 1024 and up, as with many devices open
+        Should wait for them like for the others, which select() can not
+        '''
+        fillers = open_descriptors(1100)
+        try:
+            with mock.patch('pyIOSXR.aio.pexpect.spawn', spawn_fake_agent()):
+                device = aio.AsyncIOSXR(hostname='r1', username='ejasinska', password='passwd', timeout=5)
+                opened = device.open()
+                show = device.show_version()
+                aio.wait([opened, show])
+                self.assertGreaterEqual(device.device.fileno(), 1024)
+                self.assertEqual('show version\n', show.result())
+                aio.wait([device.close()])
+        finally:
+            for fd in fillers:
+                os.close(fd)
+
+    def test_timeout(self):
+        '''
+        Test pyiosxr AsyncIOSXR with a device slower than its timeout
+        Should return TimeoutError
+        '''
+        with mock.patch('pyIOSXR.aio.pexpect.spawn', spawn_fake_agent(latency=2)):
+            device = aio.AsyncIOSXR(hostname='r1', username='ejasinska', password='passwd', timeout=1)
+            self.assertRaises(TimeoutError, device.open().result)
+            device.device.close()
+
+    def test_commit_skip_if_empty(self):
+        '''
+        Test pyiosxr AsyncIOSXR commit_config with skip_if_empty on a device without changes
+        Should skip the commit with skip_if_empty, and commit without
+        '''
+        with mock.patch('pyIOSXR.aio.pexpect.spawn', spawn_fake_agent()):
+            device = aio.AsyncIOSXR(hostname='r1', username='ejasinska', password='passwd')
+            opened, changes, skipped, committed = aio.wait([device.open(), device.get_config_changes(),
+                                                            device.commit_config(skip_if_empty=True),
+                                                            device.commit_config()])
+            self.assertEqual('', changes.result())
+            self.assertFalse(skipped.result())
+            self.assertTrue(committed.result())
+            aio.wait([device.close()])
+
+    def test_not_opened(self):
+        '''
+        Test pyiosxr AsyncIOSXR rpc on a device not opened
+        Should return EOFError
+        '''
+        device = aio.AsyncIOSXR(hostname='r1', username='ejasinska', password='passwd')
+        self.assertRaises(EOFError, device.discard_config().result)
+
+
+# RPCStats
+
+class TestRPCStats(unittest.TestCase):
+
+    def device(self, filename):
+        device = mock.Mock()
+        device.expect_exact.return_value = 0
+        device.match = ''
+        device.before = open(filename).read()
+        return device
+
+    def test_rpc_kind(self):
+        '''
+        Test pyiosxr rpc_kind
+        Should return the tag of the first operation
+        '''
+        self.assertEqual('Get', rpc_kind('<Get><Operational><LLDP/></Operational></Get>'))
+        self.assertEqual('CLI Exec', rpc_kind('<CLI><Exec>show version</Exec></CLI>'))
+        self.assertEqual('CLI Configuration', rpc_kind('<CLI><Configuration>hostname r1</Configuration></CLI>'))
+        self.assertEqual('Rollback', rpc_kind('<Unlock/><Rollback><Previous>1</Previous></Rollback><Lock/>'))
+        self.assertEqual('Lock', rpc_kind('<Lock/>'))
+        self.assertEqual('Get', rpc_kind('<Request MajorVersion="1" MinorVersion="0"><Get/></Request>'))
+        self.assertEqual('Unknown', rpc_kind(''))
+
+    def test_rpc_kind_long(self):
+        '''
+        Test pyiosxr rpc_kind with a configuration of thousands of lines
+        Should classify it from its start
+        '''
+        configuration = '\n'.join('interface Loopback%d\n description <%d>' % (number, number)
+                                   for number in range(10000))
+        rpc_command = '<CLI><Configuration>' + configuration + '</Configuration></CLI>'
+        self.assertEqual('CLI Configuration', rpc_kind(rpc_command))
+
+    def test_long_command(self):
+        '''
+        Test pyiosxr class RPCStats with a call of a long command
+        Should keep the start of the command only
+        '''
+        records = []
+        stats = RPCStats(callbacks=[records.append])
+        rpc_command = '<CLI><Configuration>' + 'hostname r1\n' * 1000 + '</Configuration></CLI>'
+        __execute_rpc__(self.device('test/device_make_rpc_call.xml'), rpc_command, 10, recorder=stats.recorder('r1'))
+        self.assertEqual(rpc_command[:200], records[0].rpc_command)
+        self.assertEqual('CLI Configuration', records[0].kind)
+        self.assertEqual(rpc_command[:200], stats.as_dict()['slowest'][0]['rpc_command'])
+
+    def test_execute_rpc(self):
+        '''
+        Test pyiosxr helper __execute_rpc__ with a recorder
+        Should record every phase, the sizes and errors
+        '''
+        records = []
+        stats = RPCStats(callbacks=[records.append])
+        __execute_rpc__(self.device('test/device_make_rpc_call.xml'), '<Get></Get>', 10,
+                        recorder=stats.recorder('r1'))
+        device = self.device('test/device_make_rpc_call.xml')
+        device.expect_exact.side_effect = pexpect.TIMEOUT('timeout')
+        self.assertRaises(TimeoutError, __execute_rpc__, device, '<Get></Get>', 10, recorder=stats.recorder('r2'))
+
+        self.assertEqual(['r1', 'r2'], [record.hostname for record in records])
+        self.assertEqual(['send', 'wait', 'strip', 'parse', 'check'], sorted(records[0].phases, key=PHASES.index))
+        self.assertEqual(len(open('test/device_make_rpc_call.xml').read()), records[0].bytes_received)
+        self.assertIsInstance(records[1].error, TimeoutError)
+        self.assertEqual(['send'], list(records[1].phases))
+
+        exported = stats.as_dict()
+        self.assertEqual(2, exported['kinds']['Get']['count'])
+        self.assertEqual(1, exported['kinds']['Get']['errors'])
+        self.assertEqual(1, exported['hosts']['r1']['elapsed']['count'])
+        self.assertEqual(2, len(exported['slowest']))
+
+    def test_async(self):
+        '''
+        Test pyiosxr AsyncIOSXR with stats
+        Should record the rpc calls
+        '''
+        stats = RPCStats()
+        with mock.patch('pyIOSXR.aio.pexpect.spawn', spawn_fake_agent()):
+            device = aio.AsyncIOSXR(hostname='r1', username='ejasinska', password='passwd', stats=stats)
+            aio.wait([device.open(), device.show_version(), device.close()])
+        exported = stats.as_dict()
+        self.assertEqual(['CLI Exec', 'Lock', 'Unlock'], sorted(exported['kinds']))
+        self.assertEqual(5, len(exported['kinds']['CLI Exec']['phases']))
+
+
+# test class SessionPool
+
+def mock_iosxr(hostname, username, password, port=22, **kwargs):
+    '''
+    Replacement for IOSXR returning a mock with the connection attributes set
+    '''
+    device = mock.Mock()
+    device.hostname, device.username, device.password, device.port = hostname, username, password, port
+    return device
+
+
+class TestSessionPool(unittest.TestCase):
+
+    @mock.patch('pyIOSXR.pool.IOSXR', side_effect=mock_iosxr)
+    def test_reuse(self, mock_class):
+        '''
+        Test pyiosxr SessionPool reusing a released session
+        Should open a single session
+        '''
+        pool = SessionPool()
+        with pool.session('r1', 'ejasinska', 'passwd') as device:
+            pass
+        with pool.session('r1', 'ejasinska', 'passwd') as second:
+            self.assertIs(device, second)
+        self.assertEqual(1, mock_class.call_count)
+        device.discard_config.assert_called_with()
+        mock_class.assert_called_with(hostname='r1', username='ejasinska', password='passwd', port=22, lock=False)
+
+    @mock.patch('pyIOSXR.pool.IOSXR', side_effect=mock_iosxr)
+    def test_broken(self, mock_class):
+        '''
+        Test pyiosxr SessionPool with a session failing with TimeoutError
+        Should close the session and open a new one
+        '''
+        pool = SessionPool()
+        with self.assertRaises(TimeoutError):
+            with pool.session('r1', 'ejasinska', 'passwd') as device:
+                raise TimeoutError('error')
+        device.close.assert_called_with()
+        with pool.session('r1', 'ejasinska', 'passwd') as second:
+            self.assertIsNot(device, second)
+
+    @mock.patch('pyIOSXR.pool.IOSXR', side_effect=ValueError('Unknown transport'))
+    def test_constructor_error(self, mock_class):
+        '''
+        Test pyiosxr SessionPool with IOSXR failing to create sessions more often than max_size
+        Should raise the error every time rather than run out of sessions
+        '''
+        pool = SessionPool(max_size=2)
+        for _ in range(3):
+            self.assertRaises(ValueError, pool.acquire, 'r1', 'ejasinska', 'passwd', timeout=0.1)
+        self.assertEqual(3, mock_class.call_count)
+
+    @mock.patch('pyIOSXR.pool.IOSXR', side_effect=mock_iosxr)
+    def test_health_check(self, mock_class):
+        '''
+        Test pyiosxr SessionPool health check of an idle session
+        Should replace the session if the health check fails
+        '''
+        pool = SessionPool(check_after=0)
+        device = pool.acquire('r1', 'ejasinska', 'passwd')
+        pool.release(device)
+        device.make_rpc_call.side_effect = EOFError('error')
+        self.assertIsNot(device, pool.acquire('r1', 'ejasinska', 'passwd'))
+        device.make_rpc_call.assert_called_with('<GetVersionInfo/>')
+
+    @mock.patch('pyIOSXR.pool.IOSXR', side_effect=mock_iosxr)
+    def test_max_size(self, mock_class):
+        '''
+        Test pyiosxr SessionPool with all sessions checked out
+        Should return TimeoutError
+        '''
+        pool = SessionPool(max_size=1)
+        pool.acquire('r1', 'ejasinska', 'passwd')
+        self.assertRaises(TimeoutError, pool.acquire, 'r1', 'ejasinska', 'passwd', timeout=0.1)
+        self.assertTrue(pool.acquire('r2', 'ejasinska', 'passwd'))
+
+    @mock.patch('pyIOSXR.pool.IOSXR', side_effect=mock_iosxr)
+    def test_evict(self, mock_class):
+        '''
+        Test pyiosxr SessionPool evict
+        Should close idle sessions
+        '''
+        pool = SessionPool()
+        device = pool.acquire('r1', 'ejasinska', 'passwd')
+        pool.release(device)
+        self.assertEqual(1, pool.evict(max_idle=0))
+        device.close.assert_called_with()
+
+
+# ConfigCache
+
+COMMIT_LIST = """Mon Feb  1 10:00:00.000 UTC
+SNo. Label/ID              User      Line                Client      Time Stamp
+~~~~ ~~~~~~~~              ~~~~      ~~~~                ~~~~~~      ~~~~~~~~~~
+1    %s            ejasinska vty0:node0_RSP0_CPU0  XML Agent   Mon Feb  1 09:59:00 2016
+"""
+
+
+class TestConfigCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_parse_commit_id(self):
+        '''
+        Test pyiosxr parse_commit_id
+        Should return the last commit entry or None without commits
+        '''
+        self.assertEqual('1000000123 ejasinska vty0:node0_RSP0_CPU0 XML Agent Mon Feb 1 09:59:00 2016',
+                         parse_commit_id(COMMIT_LIST % '1000000123'))
+        self.assertEqual(None, parse_commit_id('No commits found'))
+
+    def test_get_put(self):
+        '''
+        Test pyiosxr ConfigCache get and put
+        Should return the config only for the commit it was cached for, from disk in a new cache as well
+        '''
+        config_cache = ConfigCache(self.directory)
+        config_cache.put('r1', '1000000123', 'hostname r1\n')
+        self.assertEqual('hostname r1\n', config_cache.get('r1', '1000000123'))
+        self.assertEqual(None, config_cache.get('r1', '1000000124'))
+        self.assertEqual(None, config_cache.get('r2', '1000000123'))
+        self.assertEqual('hostname r1\n', ConfigCache(self.directory).get('r1', '1000000123'))
+        config_cache.invalidate('r1')
+        self.assertEqual(None, ConfigCache(self.directory).get('r1', '1000000123'))
+
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.__init__')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.expect')
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn.sendline')
+    @mock.patch('pyIOSXR.iosxr.__execute_rpc__')
+    @mock.patch('pyIOSXR.iosxr.__execute_show__')
+    @mock.patch('pyIOSXR.iosxr.__execute_config_show__')
+    def test_compare_config(self, mock_config_show, mock_show, mock_rpc, mock_sendline, mock_expect, mock_spawn):
+        '''
+        Test pyiosxr class compare_config with a config_cache
+        Should retrieve the running config only once per commit
+        '''
+        device = IOSXR(hostname='hostname', username='ejasinska', password='passwd', port=22, timeout=60,
+                       logfile=None, lock=False, config_cache=ConfigCache())
+        mock_spawn.return_value = None
+        device.open()
+        mock_show.return_value = COMMIT_LIST % '1000000123'
+        mock_config_show.return_value = ''
+        device.compare_config()
+        device.compare_config()
+        self.assertEqual(['show configuration merge', 'show running-config', 'show configuration merge'],
+                         [call[0][1] for call in mock_config_show.call_args_list])
+        device.commit_config()
+        device.compare_config()
+        self.assertEqual('show running-config', mock_config_show.call_args_list[-1][0][1])
+
+
+# XML backends
+
+class TestBackend(unittest.TestCase):
+
+    def tearDown(self):
+        set_backend()
+
+    def test_parse_fixtures(self):
+        '''
+        Test pyiosxr helper __execute_rpc__ with every XML backend installed
+        Should return the same tree as ElementTree for every response from xml files
+        '''
+        def tree(root):
+            return [(element.tag, sorted(element.attrib.items()), element.text) for element in root.iter()]
+        device = mock.Mock()
+        device.expect_exact.return_value = 0
+        device.match = ''
+        for name in ('device_close', 'device_commit_config', 'device_make_rpc_call', 'device_show_interfaces'):
+            device.before = open('test/%s.xml' % name).read().replace('\\r\\n', '\r\n')
+            expected = tree(__execute_rpc__(device, '<Get></Get>', 10, backend=get_backend('ElementTree')))
+            for backend in available():
+                root = __execute_rpc__(device, '<Get></Get>', 10, backend=get_backend(backend))
+                self.assertEqual(expected, tree(root))
+
+    def test_stream_target(self):
+        '''
+        Test pyiosxr helper __StreamTarget__ with every XML backend installed
+        Should yield the elements built by the backend, detached from the response
+        '''
+        response = '<Response><Get><Entry><Name>a</Name></Entry><Entry><Name>b</Name></Entry></Get></Response>'
+        for name in available():
+            backend = get_backend(name)
+            target = __StreamTarget__(tag='Entry', backend=backend)
+            parser = backend.XMLParser(target=target)
+            backend.feed(parser, response)
+            root = parser.close()
+            self.assertEqual(['a', 'b'], [entry.find('Name').text for entry in target.pop()])
+            self.assertEqual([], list(root.find('Get')))
+
+    def test_feed_slices(self):
+        '''
+        Test pyiosxr Backend feed with a start offset
+        Should parse the data from the offset on, in several slices for lxml
+        '''
+        response = '\r\nXML> <Response>' + '<Entry/>' * 1000 + '</Response>'
+        for name in available():
+            backend = get_backend(name)
+            parser = backend.XMLParser()
+            with mock.patch('pyIOSXR.backend.__LXML_SLICE__', 100):
+                backend.feed(parser, response, response.find('<'))
+            self.assertEqual(1000, len(parser.close()))
+
+    def test_set_backend(self):
+        '''
+        Test pyiosxr set_backend and IOSXR xml_backend
+        Should use the backend set by default, unless the device has one of its own
+        '''
+        self.assertEqual('ElementTree', get_backend().name)
+        set_backend('cElementTree')
+        self.assertEqual('cElementTree', get_backend().name)
+        self.assertEqual(None, IOSXR(hostname='hostname', username='ejasinska', password='passwd').backend)
+        device = IOSXR(hostname='hostname', username='ejasinska', password='passwd', xml_backend='ElementTree')
+        self.assertIs(get_backend('ElementTree'), device.backend)
+        set_backend()
+        self.assertEqual('ElementTree', get_backend().name)
+        self.assertEqual(available()[0], detect().name)
+        self.assertRaises(ValueError, Backend, 'minidom')
+
+
+# transports
+
+class TestSocketTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.sock, self.peer = socket.socketpair()
+        self.transport = SocketTransport(self.sock, timeout=1)
+
+    def tearDown(self):
+        self.transport.close()
+        self.peer.close()
+
+    def test_expect_exact(self):
+        '''
+        Test pyiosxr SocketTransport expect_exact with a terminator split across reads
+        Should return the index of the pattern found first and keep the data after it
+        '''
+        self.peer.sendall('\r\nXML> <Response><Get/></Resp')
+        self.assertRaises(pexpect.TIMEOUT, self.transport.expect_exact, ['</Response>', 'ERROR: 0xa240fe00'], 0.1)
+        self.peer.sendall('onse>\r\nXML> ')
+        self.assertEqual(0, self.transport.expect_exact(['</Response>', 'ERROR: 0xa240fe00']))
+        self.assertEqual('\r\nXML> <Response><Get/>', self.transport.before)
+        self.assertEqual('</Response>', self.transport.match)
+        self.assertEqual(1, self.transport.expect_exact(['</Response>', 'XML>']))
+        self.assertEqual(' ', self.transport.read_nonblocking(10))
+
+    def test_eof(self):
+        '''
+        Test pyiosxr SocketTransport closed by the device
+        Should return pexpect.EOF
+        '''
+        self.peer.close()
+        self.assertRaises(pexpect.EOF, self.transport.expect_exact, '</Response>')
+
+    def test_execute_rpc(self):
+        '''
+        Test pyiosxr helper __execute_rpc__ on a SocketTransport
+        Should send the request and return the parsed response
+        '''
+        self.peer.sendall(open('test/device_make_rpc_call.xml').read().replace('\\r\\n', '\r\n'))
+        root = __execute_rpc__(self.transport, '<Get><Operational><BGP/></Operational></Get>', 1)
+        self.assertEqual('Response', root.tag)
+        self.assertIn('<Get><Operational><BGP/></Operational></Get></Request>\n', self.peer.recv(65536))
+
+    def test_send_timeout(self):
+        '''
+        Test pyiosxr helper __execute_rpc__ on a SocketTransport the device stops reading from
+        Should return TimeoutError rather than block in the send
+        '''
+        self.sock.settimeout(0.2)
+        configuration = '<CLI><Configuration>' + 'hostname r1\n' * 1000000 + '</Configuration></CLI>'
+        start = time.time()
+        self.assertRaises(TimeoutError, __execute_rpc__, self.transport, configuration, 1)
+        self.assertLess(time.time() - start, 1)
+
+
+class TestParamikoTransport(unittest.TestCase):
+
+    class SSHException(Exception):
+        pass
+
+    class AuthenticationException(SSHException):
+        pass
+
+    def test_ssh_errors(self):
+        '''
+        Test pyiosxr class IOSXR with the paramiko transport, failing to authenticate or to negotiate
+        Should return EOFError and close the ssh client
+        '''
+        for error in (self.AuthenticationException, self.SSHException):
+            paramiko = mock.Mock(SSHException=self.SSHException, AuthenticationException=self.AuthenticationException)
+            paramiko.SSHClient.return_value.connect.side_effect = error('failed')
+            with mock.patch.dict(sys.modules, paramiko=paramiko):
+                device = IOSXR(hostname='r1', username='ejasinska', password='wrong', transport='paramiko')
+                self.assertRaises(EOFError, device.open)
+            self.assertTrue(paramiko.SSHClient.return_value.close.called)
+
+
+class TestTCPTransport(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.agent = subprocess.Popen([sys.executable, 'test/fake_agent.py', '0', '0', '0'], stdout=subprocess.PIPE)
+        cls.port = int(cls.agent.stdout.readline())
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.agent.kill()
+        cls.agent.wait()
+
+    def test_iosxr(self):
+        '''
+        Test pyiosxr class IOSXR with the tcp transport
+        Should log in to the XML agent and run requests without pexpect
+        '''
+        device = IOSXR(hostname='127.0.0.1', username='ejasinska', password='passwd', port=self.port, timeout=5,
+                       transport='tcp')
+        device.open()
+        self.assertIsInstance(device.device, SocketTransport)
+        self.assertTrue(device.locked)
+        self.assertEqual('show version\n', device.show_version())
+        self.assertIn('<LLDP />', device.make_rpc_call('<Get><Operational><LLDP/></Operational></Get>'))
+        device.close()
+
+    def test_async(self):
+        '''
+        Test pyiosxr class AsyncIOSXR with the tcp transport
+        Should log in to the XML agent and run requests
+        '''
+        devices = [aio.AsyncIOSXR(hostname='127.0.0.1', username='ejasinska', password='passwd', port=self.port,
+                                  timeout=5, transport='tcp') for _ in range(3)]
+        aio.wait([device.open() for device in devices])
+        shows = [device.show_version() for device in devices]
+        self.assertEqual(['show version\n'] * 3, [show.result() for show in shows])
+        aio.wait([device.close() for device in devices])
+
+    def test_many_descriptors(self):
+        '''
+        Test pyiosxr class IOSXR with the tcp transport and a file descriptor numbered 1024 or up
+        Should wait for responses on it, which select() can not
+        '''
+        fillers = open_descriptors(1100)
+        try:
+            device = IOSXR(hostname='127.0.0.1', username='ejasinska', password='passwd', port=self.port,
+                           timeout=5, transport='tcp')
+            device.open()
+            self.assertGreaterEqual(device.device.fileno(), 1024)
+            self.assertEqual('show version\n', device.show_version())
+            device.close()
+        finally:
+            for fd in fillers:
+                os.close(fd)
+
+    def test_default_port(self):
+        '''
+        Test pyiosxr class IOSXR port
+        Should default to the port of the transport, and reject unknown transports
+        '''
+        self.assertEqual(22, IOSXR(hostname='r1', username='ejasinska', password='passwd').port)
+        self.assertEqual(38752, IOSXR(hostname='r1', username='ejasinska', password='passwd', transport='ssl').port)
+        self.assertRaises(ValueError, IOSXR, hostname='r1', username='ejasinska', password='passwd', transport='ftp')
+
+
+class TestScheduler(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.agent = subprocess.Popen([sys.executable, 'test/fake_agent.py', '0', '0', '0'], stdout=subprocess.PIPE)
+        cls.port = int(cls.agent.stdout.readline())
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.agent.kill()
+        cls.agent.wait()
+
+    def scheduler(self, hostnames=('127.0.0.1',)):
+        inventory = [{'hostname': hostname, 'port': self.port} for hostname in hostnames]
+        return Scheduler(inventory, username='ejasinska', password='passwd', jitter=0, transport='tcp', timeout=5)
+
+    def test_coalesce(self):
+        '''
+        Test pyiosxr class Scheduler run
+        Should send the rpc and show jobs due together in one request, over a session kept open
+        '''
+        scheduler = self.scheduler(['127.0.0.1', 'localhost'])
+        scheduler.add('lldp', rpc_command='<Get><Operational><LLDP/></Operational></Get>', interval=0.2)
+        scheduler.add('version', show='show version', interval=0.2)
+        samples = list(scheduler.run(duration=0.5))
+        scheduler.close()
+
+        self.assertEqual(set(['127.0.0.1', 'localhost']), set(sample.hostname for sample in samples))
+        self.assertTrue(all(sample.exception is None for sample in samples))
+        lldp = [sample for sample in samples if sample.job == 'lldp']
+        version = [sample for sample in samples if sample.job == 'version']
+        self.assertGreaterEqual(len(lldp), 4)
+        self.assertIn('<LLDP />', lldp[0].result)
+        self.assertEqual('show version', version[0].result.strip())
+        # both jobs are answered by the same response
+        self.assertEqual(sorted((s.hostname, s.timestamp) for s in lldp),
+                         sorted((s.hostname, s.timestamp) for s in version))
+
+    def test_skip(self):
+        '''
+        Test pyiosxr class Scheduler run
+        Should skip the runs missed while a device is busy rather than queue them, reusing the session
+        '''
+        scheduler = self.scheduler()
+        scheduler.add('slow', job=lambda device: time.sleep(0.25) or device, interval=0.1)
+        samples = list(scheduler.run(duration=0.6))
+        scheduler.close()
+
+        self.assertLessEqual(len(samples), 3)
+        self.assertEqual(1, len(set(id(sample.result) for sample in samples)))
+        self.assertEqual('127.0.0.1', samples[0].result.hostname)
+        self.assertGreater(sum(sample.skipped for sample in samples), 0)
+        self.assertGreaterEqual(samples[0].elapsed, 0.25)
+
+    def test_errors(self):
+        '''
+        Test pyiosxr class Scheduler
+        Should reject jobs given no or several commands, and report devices that cannot be reached in the samples
+        '''
+        scheduler = Scheduler([{'hostname': '127.0.0.1', 'port': 1}], username='ejasinska', password='passwd',
+                              transport='tcp', timeout=1)
+        self.assertRaises(ValueError, scheduler.add, 'none')
+        self.assertRaises(ValueError, scheduler.add, 'both', rpc_command='<Get/>', show='show version')
+        scheduler.add('version', show='show version', interval=10)
+        samples = list(scheduler.run(duration=0.2))
+        self.assertEqual(1, len(samples))
+        self.assertIsNotNone(samples[0].exception)
+        self.assertIsNone(samples[0].result)
+
+
+class TestChangeDetector(unittest.TestCase):
+
+    TABLE = '<Response><Get><Operational><Interfaces><InterfaceTable>' \
+            '<Interface><Naming><InterfaceName>Gi0/0/0/0</InterfaceName></Naming><State>up</State></Interface>' \
+            '<Interface><Naming><InterfaceName>Gi0/0/0/1</InterfaceName></Naming><State>%s</State></Interface>' \
+            '%s</InterfaceTable><Summary><Up>%d</Up></Summary></Interfaces></Operational></Get>' \
+            '<ResultSummary ErrorCount="0"/></Response>'
+    ENTRY = '<Interface><Naming><InterfaceName>Gi0/0/0/2</InterfaceName></Naming><State>up</State></Interface>'
+    KEY = 'Get/Operational/Interfaces/InterfaceTable/Interface[InterfaceName=%s]'
+
+    def test_records(self):
+        '''
+        Test pyiosxr function records
+        Should split a response into its table entries and the other elements as a whole
+        '''
+        keys = [key for key, _ in records(ElementTree.fromstring(self.TABLE % ('up', self.ENTRY, 3)))]
+        self.assertEqual([self.KEY % 'Gi0/0/0/0', self.KEY % 'Gi0/0/0/1', self.KEY % 'Gi0/0/0/2',
+                          'Get/Operational/Interfaces/Summary'], keys)
+        self.assertEqual(['GetVersionInfo'], [key for key, _ in records(ElementTree.fromstring(
+            '<GetVersionInfo><Version>6.1.2</Version></GetVersionInfo>'))])
+
+    def test_update(self):
+        '''
+        Test pyiosxr class ChangeDetector update
+        Should report every record on the first poll, then only the records changed or removed
+        '''
+        detector = ChangeDetector()
+        first = detector.update('r1', '<Get/>', self.TABLE % ('up', self.ENTRY, 3))
+        self.assertFalse(first.unchanged)
+        self.assertEqual(4, len(first.changed))
+
+        same = detector.update('r1', '<Get/>', self.TABLE % ('up', self.ENTRY, 3))
+        self.assertTrue(same.unchanged)
+        self.assertEqual({}, same.changed)
+        self.assertEqual([], same.removed)
+
+        delta = detector.update('r1', '<Get/>', self.TABLE % ('down', '', 1))
+        self.assertFalse(delta.unchanged)
+        self.assertEqual([self.KEY % 'Gi0/0/0/1', 'Get/Operational/Interfaces/Summary'], list(delta.changed))
+        self.assertEqual('down', delta.changed[self.KEY % 'Gi0/0/0/1'].find('State').text)
+        self.assertEqual([self.KEY % 'Gi0/0/0/2'], delta.removed)
+
+        # devices are tracked apart, and forgotten on demand
+        self.assertFalse(detector.update('r2', '<Get/>', self.TABLE % ('down', '', 1)).unchanged)
+        detector.forget('r1')
+        self.assertEqual(3, len(detector.update('r1', '<Get/>', self.TABLE % ('down', '', 1)).changed))
+        self.assertTrue(detector.update('r2', '<Get/>', self.TABLE % ('down', '', 1)).unchanged)
+
+    def test_watch(self):
+        '''
+        Test pyiosxr class ChangeDetector watch
+        Should return deltas from make_rpc_call and the show methods of the device
+        '''
+        device = mock.Mock()
+        device.hostname = 'r1'
+        device.make_rpc_call.return_value = ElementTree.fromstring(self.TABLE % ('up', '', 2))
+        device.show_bgp_summary.side_effect = ['Neighbor 10.0.0.1 Established', 'Neighbor 10.0.0.1 Established',
+                                               'Neighbor 10.0.0.1 Idle']
+        watched = ChangeDetector().watch(device)
+
+        self.assertFalse(watched.make_rpc_call('<Get/>').unchanged)
+        self.assertTrue(watched.make_rpc_call('<Get/>').unchanged)
+        device.make_rpc_call.assert_called_with('<Get/>', element=True)
+        self.assertEqual({'show bgp summary': 'Neighbor 10.0.0.1 Established'}, watched.show_bgp_summary().changed)
+        self.assertTrue(watched.show_bgp_summary().unchanged)
+        self.assertEqual('Neighbor 10.0.0.1 Idle', watched.show_bgp_summary().changed['show bgp summary'])
+        self.assertEqual(device.close, watched.close)
+
+    def test_watch_parse_stream(self):
+        '''
+        Test pyiosxr class ChangeDetector watch with show methods called with parse=True or stream=True
+        Should raise ValueError without running the command
+        '''
+        device = mock.Mock()
+        device.hostname = 'r1'
+        watched = ChangeDetector().watch(device)
+
+        self.assertRaises(ValueError, watched.show_interfaces, parse=True)
+        self.assertRaises(ValueError, watched.show_running_config, stream=True)
+        self.assertFalse(device.show_interfaces.called)
+        self.assertFalse(device.show_running_config.called)
+
+    def test_changes(self):
+        '''
+        Test pyiosxr class ChangeDetector changes
+        Should compare the samples of a scheduler per device and job, skipping failed ones
+        '''
+        def sample(job, result, exception=None):
+            return Sample('r1', job, 0, 0, 0, result, exception, 0)
+        samples = [sample('lldp', '<Get><LLDP/></Get>'), sample('version', 'Version 6.1.2'),
+                   sample('lldp', '<Get><LLDP/></Get>'), sample('version', None, TimeoutError()),
+                   sample('version', 'Version 6.1.3')]
+        deltas = [delta for _, delta in ChangeDetector().changes(samples)]
+        self.assertEqual([False, False, True, None, False],
+                         [delta.unchanged if delta is not None else None for delta in deltas])
+        self.assertEqual(['Get'], list(deltas[0].changed))
+
+    def test_changes_several_operations(self):
+        '''
+        Test pyiosxr class ChangeDetector changes with a job of two operations and a result which does not parse
+        Should compare the records of both operations, and report the broken result in its own sample only
+        '''
+        def sample(hostname, result):
+            return Sample(hostname, 'lldp', 0, 0, 0, result, None, 0)
+        two = '<Get><Operational><LLDP/></Operational></Get>' \
+              '<Get><Operational><Hostname>%s</Hostname></Operational></Get>'
+        samples = [sample('r1', two % 'r1'), sample('r2', '<Get><Operational>'), sample('r3', two % 'r3'),
+                   sample('r1', two % 'r1-new')]
+        results = list(ChangeDetector().changes(samples))
+
+        self.assertEqual(['Get', 'Get#2'], list(results[0][1].changed))
+        self.assertIsNone(results[1][1])
+        self.assertIsNotNone(results[1][0].exception)
+        self.assertEqual('r2', results[1][0].hostname)
+        self.assertFalse(results[2][1].unchanged)
+        self.assertEqual(['Get#2'], list(results[3][1].changed))
+
+
+class TestResultStore(unittest.TestCase):
+
+    def setUp(self):
+        root = ElementTree.fromstring(open('test/device_show_interfaces.xml').read().replace('\\r\\n', '\r\n')[7:])
+        self.interfaces = parsers.parse('show interfaces', root.find('CLI/Exec').text)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_records(self):
+        '''
+        Test pyiosxr class ResultStore extend
+        Should keep parsed records in columns, handing out rows equal to the records
+        '''
+        store = ResultStore()
+        self.assertEqual(5, store.extend('r1', self.interfaces))
+        store.extend('r2', self.interfaces)
+        self.assertEqual(10, len(store))
+        self.assertEqual(['hostname'] + list(parsers.Interface._fields), store.fields)
+        self.assertEqual('r2', store[5].hostname)
+        self.assertEqual(dict(self.interfaces[1]._asdict(), hostname='r1'), store[1]._asdict())
+        self.assertEqual(1233923, store[-4].input_bytes)
+        self.assertIsNone(store[0].ip_address)
+        self.assertEqual(['r1'] * 5 + ['r2'] * 5, store.column('hostname'))
+        self.assertRaises(AttributeError, getattr, store[0], 'speed')
+        self.assertRaises(IndexError, store.__getitem__, 10)
+        # far less than the records themselves
+        self.assertLess(store.nbytes / len(store), 200)
+
+    def test_types(self):
+        '''
+        Test pyiosxr class ResultStore append
+        Should widen columns as values do not fit, and add columns for new fields
+        '''
+        store = ResultStore(['counter'])
+        store.append('r1', {'counter': None, 'rate': 1})
+        store.append('r1', {'counter': 1 << 40, 'rate': 1.5})
+        store.append('r1', {'counter': 7, 'rate': 2, 'state': 'up'})
+        self.assertEqual([None, 1 << 40, 7], store.column('counter'))
+        store.append('r1', {'counter': 'n/a'})
+        self.assertEqual(['hostname', 'counter', 'rate', 'state'], store.fields)
+        self.assertEqual([None, str(1 << 40), '7', 'n/a'], store.column('counter'))
+        self.assertEqual([1.0, 1.5, 2.0, None], store.column('rate'))
+        self.assertEqual([None, None, 'up', None], store.column('state'))
+
+    def test_add_response(self):
+        '''
+        Test pyiosxr class ResultStore add_response
+        Should add a row per table entry of an XML response
+        '''
+        store = ResultStore()
+        response = '<Response><Get><Operational><Interfaces><InterfaceTable>' \
+                   '<Interface><Naming><InterfaceName>Gi0/0/0/0</InterfaceName></Naming><MTU>9000</MTU>' \
+                   '<State>up</State></Interface>' \
+                   '<Interface><Naming><InterfaceName>Gi0/0/0/1</InterfaceName></Naming><MTU>1514</MTU>' \
+                   '<State/></Interface>' \
+                   '</InterfaceTable></Interfaces></Operational></Get></Response>'
+        self.assertEqual(2, store.add_response('r1', response))
+        self.assertEqual(['hostname', 'Naming_InterfaceName', 'MTU', 'State'], store.fields)
+        self.assertEqual('Gi0/0/0/1', store[1].Naming_InterfaceName)
+        self.assertEqual([9000, 1514], store.column('MTU'))
+        self.assertEqual(['up', None], store.column('State'))
+
+    def test_collect(self):
+        '''
+        Test pyiosxr class ResultStore collect
+        Should add the results of a fleet job, returning the devices failed
+        '''
+        store = ResultStore()
+        failed = store.collect([DeviceResult('r1', result=self.interfaces),
+                                DeviceResult('r2', exception=TimeoutError()),
+                                DeviceResult('r3', result='<Get><Entry><Naming><Name>a</Name></Naming></Entry></Get>')])
+        self.assertEqual(['r2'], [result.hostname for result in failed])
+        self.assertEqual(6, len(store))
+        self.assertEqual('a', store[5].Naming_Name)
+
+    def test_save_load(self):
+        '''
+        Test pyiosxr class ResultStore save and load
+        Should write a file per column and read them back memory mapped
+        '''
+        store = ResultStore(['empty'])
+        store.extend('r1', self.interfaces)
+        store.append('r2', {'name': u'Gi0/0/0/0 \u00e9', 'input_bytes': 1 << 40, 'input_rate': 0.5})
+        store.save(self.directory)
+        loaded = ResultStore.load(self.directory)
+        try:
+            self.assertEqual(store.fields, loaded.fields)
+            self.assertEqual(len(store), len(loaded))
+            self.assertEqual([row._asdict() for row in store], [row._asdict() for row in loaded])
+            self.assertEqual(u'Gi0/0/0/0 \u00e9', loaded[5].name)
+            self.assertIsInstance(loaded[0].name, str)
+            self.assertRaises(TypeError, loaded.append, 'r3', {})
+        finally:
+            loaded.close()
+
+
+class TestTimeouts(unittest.TestCase):
+
+    def device(self, filename='test/device_make_rpc_call.xml'):
+        device = mock.Mock()
+        device.expect_exact.return_value = 0
+        device.match = ''
+        device.before = open(filename).read()
+        return device
+
+    def test_kinds(self):
+        '''
+        Test pyiosxr class Timeouts timeout
+        Should use the timeout of the kind of the call, the timeout of the device for other kinds
+        '''
+        timeouts = Timeouts(kinds={'Lock': 10, 'CLI Configuration': 300})
+        device = self.device()
+        __execute_rpc__(device, '<Lock/>', 60, recorder=timeouts.recorder('r1'))
+        self.assertEqual(10, device.expect_exact.call_args[1]['timeout'])
+        __execute_rpc__(device, '<CLI><Configuration>show running-config</Configuration></CLI>', 60,
+                        recorder=timeouts.recorder('r1'))
+        self.assertEqual(300, device.expect_exact.call_args[1]['timeout'])
+        __execute_rpc__(device, '<Get></Get>', 60, recorder=timeouts.recorder('r1', RPCStats().recorder('r1')))
+        self.assertEqual(60, device.expect_exact.call_args[1]['timeout'])
+
+    def test_adaptive(self):
+        '''
+        Test pyiosxr class Timeouts timeout in adaptive mode
+        Should lower the timeout to a multiple of the latency seen, and fall back after a timeout
+        '''
+        timeouts = Timeouts(adaptive=True, factor=4, minimum=1, samples=10, failures=None)
+        for _ in range(9):
+            timeouts.record('r1', 'Get', 0.5)
+        self.assertEqual(60, timeouts.timeout('r1', 'Get', 60))
+        timeouts.record('r1', 'Get', 2.0)
+        self.assertEqual(8.0, timeouts.timeout('r1', 'Get', 60))
+        self.assertEqual(60, timeouts.timeout('r2', 'Get', 60))
+        self.assertEqual(60, timeouts.timeout('r1', 'Lock', 60))
+        self.assertEqual(5, timeouts.timeout('r1', 'Get', 5))
+
+        timeouts.record('r1', 'Get', 8.0, TimeoutError())
+        self.assertEqual(60, timeouts.timeout('r1', 'Get', 60))
+        timeouts.record('r1', 'Get', 0.5)
+        self.assertEqual(8.0, timeouts.timeout('r1', 'Get', 60))
+        # only the latest calls count
+        for _ in range(200):
+            timeouts.record('r1', 'Get', 0.1)
+        self.assertEqual(1, timeouts.timeout('r1', 'Get', 60))
+
+    @mock.patch('pyIOSXR.timeouts.time.time')
+    def test_breaker(self, mock_time):
+        '''
+        Test pyiosxr class Timeouts check
+        Should take a device as down after failures in a row, and probe it again after the cooldown
+        '''
+        mock_time.return_value = 1000.0
+        timeouts = Timeouts(failures=3, cooldown=60)
+        timeouts.record('r1', 'Get', 60, TimeoutError())
+        timeouts.record('r1', 'Get', 60, TimeoutError())
+        timeouts.record('r1', 'Get', 0.1, InvalidInputError())
+        timeouts.record('r1', 'Get', 60, TimeoutError())
+        timeouts.record('r1', 'Lock', 60, EOFError())
+        self.assertEqual([], timeouts.down())
+        timeouts.record('r1', 'Open', 60, TimeoutError())
+        self.assertEqual(['r1'], timeouts.down())
+        self.assertRaises(DeviceDownError, timeouts.timeout, 'r1', 'Get', 60)
+        self.assertRaises(DeviceDownError, __execute_rpc__, self.device(), '<Get></Get>', 60,
+                          recorder=timeouts.recorder('r1'))
+        timeouts.check('r2')
+
+        mock_time.return_value = 1061.0
+        self.assertEqual(60, timeouts.timeout('r1', 'Get', 60))
+        timeouts.record('r1', 'Get', 60, TimeoutError())
+        self.assertRaises(DeviceDownError, timeouts.check, 'r1')
+        mock_time.return_value = 1122.0
+        timeouts.check('r1')
+        timeouts.record('r1', 'Get', 0.1)
+        timeouts.record('r1', 'Get', 60, TimeoutError())
+        timeouts.check('r1')
+        timeouts.reset()
+        self.assertEqual([], timeouts.down())
+
+    @mock.patch('pyIOSXR.iosxr.pexpect.spawn')
+    def test_open(self, mock_spawn):
+        '''
+        Test pyiosxr class IOSXR open with timeouts
+        Should log in with the timeout of Open, and fail right away while the device is taken as down
+        '''
+        timeouts = Timeouts(kinds={'Open': 15}, failures=1)
+        device = IOSXR(hostname='r1', username='ejasinska', password='passwd', timeout=60, lock=False,
+                       timeouts=timeouts)
+        mock_spawn.return_value.expect.side_effect = [2, 0]
+        device.open()
+        self.assertIn('ConnectTimeout=15 ', mock_spawn.call_args[0][0])
+        self.assertEqual(15, mock_spawn.return_value.expect.call_args[1]['timeout'])
+
+        mock_spawn.return_value.expect.side_effect = pexpect.TIMEOUT('timeout')
+        self.assertRaises(TimeoutError, device.open)
+        mock_spawn.reset_mock()
+        self.assertRaises(DeviceDownError, device.open)
+        self.assertFalse(mock_spawn.called)
+
+    def test_late_response(self):
+        '''
+        Test pyiosxr class IOSXR with a call timing out before its response arrives
+        Should drop the late response, so the next call returns its own response
+        '''
+        agent = subprocess.Popen([sys.executable, 'test/fake_agent.py', '0.3', '0', '0'], stdout=subprocess.PIPE)
+        try:
+            port = int(agent.stdout.readline())
+            timeouts = Timeouts(kinds={'Get': 0.1})
+            device = IOSXR(hostname='127.0.0.1', username='ejasinska', password='passwd', port=port, timeout=5,
+                           transport='tcp', lock=False, timeouts=timeouts)
+            device.open()
+            self.assertRaises(TimeoutError, device.make_rpc_call, '<Get><Operational><LLDP/></Operational></Get>')
+            self.assertEqual('show version\n', device.show_version())
+            self.assertEqual('show interfaces', list(device.stream_show('show interfaces'))[0])
+            device.close()
+        finally:
+            agent.kill()
+            agent.wait()
+
+    def test_late_response_async(self):
+        '''
+        Test pyiosxr class AsyncIOSXR with a call timing out before its response arrives
+        Should drop the late response, so the next call returns its own response
+        '''
+        timeouts = Timeouts(kinds={'Get': 0.1})
+        with mock.patch('pyIOSXR.aio.pexpect.spawn', spawn_fake_agent(latency=0.3)):
+            device = aio.AsyncIOSXR(hostname='r1', username='ejasinska', password='passwd', timeout=5, lock=False,
+                                    timeouts=timeouts)
+            lldp = '<Get><Operational><LLDP/></Operational></Get>'
+            opened, timed_out, version = aio.wait([device.open(), device.make_rpc_call(lldp), device.show_version()])
+            self.assertRaises(TimeoutError, timed_out.result)
+            self.assertEqual('show version\n', version.result())
+            aio.wait([device.close()])
+
+
+class TestQuery(unittest.TestCase):
+
+    BGP = 'BGP/InstanceTable/Instance[InstanceName=default]/InstanceActive/DefaultVRF/NeighborTable/Neighbor'
+
+    def test_rpc_command(self):
+        '''
+        Test pyiosxr class Query rpc_command
+        Should build the Get request with the naming of the entries and the leaves asked for
+        '''
+        self.assertEqual('<Get><Operational><Interfaces><InterfaceTable/></Interfaces></Operational></Get>',
+                         Query('Interfaces/InterfaceTable').rpc_command)
+        self.assertEqual('<Get><Configuration><Hostname/></Configuration></Get>',
+                         Query('/Hostname/', configuration=True).rpc_command)
+        self.assertEqual('<Get><Operational><Interfaces><InterfaceTable><Interface><Naming>'
+                         '<InterfaceName>Gi0/0/0/0</InterfaceName></Naming><State/><Stats><In/><Out/></Stats>'
+                         '</Interface></InterfaceTable></Interfaces></Operational></Get>',
+                         Query('Interfaces/InterfaceTable/Interface', keys={'InterfaceName': 'Gi0/0/0/0'},
+                               fields=['State', 'Stats/In', 'Stats/Out']).rpc_command)
+        self.assertEqual('<Get><Operational><BGP><InstanceTable><Instance><Naming><InstanceName>default'
+                         '</InstanceName></Naming><InstanceActive><DefaultVRF><NeighborTable>'
+                         '<Neighbor><Naming><NeighborAddress>10.0.0.1</NeighborAddress></Naming></Neighbor>'
+                         '<Neighbor><Naming><NeighborAddress>10.0.0.2</NeighborAddress></Naming></Neighbor>'
+                         '</NeighborTable></DefaultVRF></InstanceActive></Instance></InstanceTable></BGP>'
+                         '</Operational></Get>',
+                         Query(self.BGP, keys=[{'NeighborAddress': '10.0.0.1'},
+                                               {'NeighborAddress': '10.0.0.2'}]).rpc_command)
+        self.assertIn('<Description>a &amp; b</Description>',
+                      Query('Descriptions/Description', keys={'Description': 'a & b'}).rpc_command)
+        self.assertRaises(ValueError, Query, 'Interfaces/Interface Table')
+        self.assertRaises(ValueError, Query, 'BGP/Instance[default]')
+
+    def test_decode(self):
+        '''
+        Test pyiosxr class Query decode
+        Should decode the elements at the path of the query to dicts
+        '''
+        response = open('test/device_make_rpc_call.xml').read()
+        response = response[response.index('<?xml'):]
+        instances = Query('BGP/InstanceTable/Instance').decode(response)
+        self.assertEqual([{'Naming': {'InstanceName': 'default'},
+                           'InstanceActive': {'DefaultVRF': {'NeighborTable': None}}}], instances)
+        self.assertEqual(['default'], Query('BGP/InstanceTable/Instance[InstanceName=default]').decode(
+            ElementTree.fromstring(response), factory=lambda instance: instance['Naming']['InstanceName']))
+        self.assertEqual([], Query('Interfaces/InterfaceTable').decode(response))
+
+        element = ElementTree.fromstring('<Entry><MTU>1514</MTU><Up>true</Up><Name>Gi0</Name><Empty/>'
+                                         '<Address>10.0.0.1</Address><Address>10.0.0.2</Address>'
+                                         '<Serial>007</Serial></Entry>')
+        self.assertEqual({'MTU': 1514, 'Up': True, 'Name': 'Gi0', 'Empty': None, 'Serial': '007',
+                          'Address': ['10.0.0.1', '10.0.0.2']}, decode(element))
+
+    @mock.patch('pyIOSXR.iosxr.IOSXR.make_rpc_call')
+    def test_iosxr(self, mock_rpc):
+        '''
+        Test pyiosxr class IOSXR query
+        Should send the request of the query and decode the response
+        '''
+        response = open('test/device_make_rpc_call.xml').read()
+        mock_rpc.return_value = ElementTree.fromstring(response[response.index('<?xml'):])
+        device = IOSXR(hostname='hostname', username='ejasinska', password='passwd')
+        query = Query('BGP/InstanceTable/Instance', fields=['Naming'])
+        self.assertEqual([{'InstanceName': 'default'}], device.query(query, lambda instance: instance['Naming']))
+        mock_rpc.assert_called_with(query.rpc_command, element=True)
+
+
+class TestRenderer(unittest.TestCase):
+
+    TEMPLATE = 'hostname $hostname\ninterface Loopback0\n ipv4 address $loopback 255.255.255.255\n'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def variables(self, count):
+        return dict(('r%d' % i, {'hostname': 'r%d' % i, 'loopback': '10.0.0.%d' % i}) for i in range(count))
+
+    def test_render(self):
+        '''
+        Test pyiosxr class Renderer render
+        Should render the template, and render the same variables only once
+        '''
+        renderer = Renderer(self.TEMPLATE)
+        renderer.template = mock.Mock(wraps=renderer.template)
+        config = renderer.render({'hostname': 'r1', 'loopback': '10.0.0.1'})
+        self.assertEqual('hostname r1\ninterface Loopback0\n ipv4 address 10.0.0.1 255.255.255.255\n', config)
+        self.assertEqual(config, renderer.render({'loopback': '10.0.0.1', 'hostname': 'r1'}))
+        self.assertEqual(1, renderer.template.call_count)
+        self.assertRaises(KeyError, renderer.render, {'hostname': 'r1'})
+        self.assertRaises(ValueError, Renderer, self.TEMPLATE, engine='mako')
+        self.assertRaises(ValueError, Renderer)
+
+    def test_render_all(self):
+        '''
+        Test pyiosxr class Renderer render_all
+        Should render the configs of many devices in worker processes, in order
+        '''
+        variables = collections.OrderedDict(sorted(self.variables(20).items()))
+        renderer = Renderer(self.TEMPLATE, processes=2)
+        configs = renderer.render_all(variables)
+        self.assertEqual(list(variables), list(configs))
+        self.assertEqual(Renderer(self.TEMPLATE).render(variables['r7']), configs['r7'])
+        # cached now, no process pool needed
+        with mock.patch('pyIOSXR.render.multiprocessing.Pool') as mock_pool:
+            self.assertEqual(configs, renderer.render_all(variables))
+        self.assertFalse(mock_pool.called)
+
+    def test_changed(self):
+        '''
+        Test pyiosxr class Renderer changed
+        Should leave out the configs committed already, remembered across processes in a directory
+        '''
+        renderer = Renderer(self.TEMPLATE, directory=self.directory)
+        configs = renderer.render_all(self.variables(3))
+        renderer.mark_committed('r1', configs['r1'] + '\n\n')
+        self.assertEqual(['r0', 'r2'], sorted(renderer.changed(configs)))
+        self.assertEqual(digest(configs['r1']), Renderer(self.TEMPLATE, directory=self.directory).last_committed('r1'))
+        renderer.forget('r1')
+        self.assertIsNone(Renderer(self.TEMPLATE, directory=self.directory).last_committed('r1'))
+        self.assertEqual(['r0', 'r1', 'r2'], sorted(renderer.changed(configs)))
+
+    def test_push(self):
+        '''
+        Test pyiosxr class Renderer push
+        Should load and commit the config, and skip it once committed
+        '''
+        renderer = Renderer(self.TEMPLATE)
+        device = mock.Mock()
+        device.hostname = 'r1'
+        variables = {'hostname': 'r1', 'loopback': '10.0.0.1'}
+        self.assertTrue(renderer.push(device, variables, label='loopback'))
+        device.load_candidate_config.assert_called_with(config=renderer.render(variables))
+        device.commit_config.assert_called_with('loopback', None, None)
+        device.reset_mock()
+        self.assertFalse(renderer.push(device, variables))
+        self.assertFalse(device.load_candidate_config.called)
+
+        device.commit_replace_config.side_effect = InvalidInputError()
+        self.assertRaises(InvalidInputError, renderer.push, device, dict(variables, loopback='10.0.0.9'),
+                          replace=True)
+        device.discard_config.assert_called_with()
+
+    def test_rollout(self):
+        '''
+        Test pyiosxr class Renderer rollout
+        Should roll out the configs not committed yet, and report the others unchanged
+        '''
+        renderer = Renderer(self.TEMPLATE)
+        variables = self.variables(3)
+        renderer.mark_committed('r1', renderer.render(variables['r1']))
+        opened = []
+
+        def iosxr(**params):
+            device = mock.Mock()
+            device.hostname = params['hostname']
+            device.compare_config.return_value = '+ change'
+            opened.append(device)
+            return device
+        with mock.patch('pyIOSXR.rollout.IOSXR', side_effect=iosxr):
+            fleet = Fleet(['r0', 'r1', 'r2', 'r3'], username='ejasinska', password='passwd')
+            results = renderer.rollout(fleet, variables, confirmed=None)
+        self.assertEqual(['r0', 'r1', 'r2'], list(results))
+        self.assertEqual([COMMITTED, UNCHANGED, COMMITTED], [result.result.state for result in results.values()])
+        self.assertEqual(['r0', 'r2'], sorted(device.hostname for device in opened))
+        self.assertEqual([], list(renderer.changed(renderer.render_all(variables))))
+
+
+# test class Recording and Replay
+
+class TestRecording(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.agent = subprocess.Popen([sys.executable, 'test/fake_agent.py', '0.1', '0', '0'], stdout=subprocess.PIPE)
+        cls.port = int(cls.agent.stdout.readline())
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.agent.kill()
+        cls.agent.wait()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'r1.rec')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def session(self, device):
+        device.open()
+        results = [device.make_rpc_call('<Get><Operational><LLDP/></Operational></Get>'), device.show_version(),
+                   list(device.stream_show('show version'))]
+        device.close()
+        return results
+
+    def test_record(self):
+        '''
+        Test pyiosxr class IOSXR with record
+        Should record every request with its response and timestamps
+        '''
+        device = IOSXR(hostname='127.0.0.1', username='ejasinska', password='passwd', port=self.port, timeout=5,
+                       transport='tcp', record=self.filename)
+        self.session(device)
+        recording = Recording(self.filename)
+        self.assertEqual('127.0.0.1', recording.hostname)
+        exchanges = list(recording)
+        self.assertEqual(5, len(exchanges))
+        self.assertIn('<Lock/>', exchanges[0].request)
+        self.assertIn('<Get><Operational><LLDP/></Operational></Get>', exchanges[1].request)
+        self.assertTrue(exchanges[1].response.endswith('</Response>'))
+        self.assertIn('<Unlock/>', exchanges[4].request)
+        self.assertTrue(all(exchange.elapsed >= 0.1 for exchange in exchanges))
+        self.assertTrue(all(first.sent < second.sent for first, second in zip(exchanges, exchanges[1:])))
+        recording.close()
+
+    def test_replay(self):
+        '''
+        Test pyiosxr class IOSXR with replay
+        Should return the recorded responses, at the recorded speed or faster
+        '''
+        device = IOSXR(hostname='127.0.0.1', username='ejasinska', password='passwd', port=self.port, timeout=5,
+                       transport='tcp', record=self.filename)
+        recorded = self.session(device)
+
+        start = time.time()
+        replayed = self.session(IOSXR(hostname='r1', username='ejasinska', password='passwd', timeout=5,
+                                      replay=Replay(self.filename)))
+        self.assertEqual(recorded, replayed)
+        self.assertGreaterEqual(time.time() - start, 0.5)
+
+        start = time.time()
+        replayed = self.session(IOSXR(hostname='r1', username='ejasinska', password='passwd', timeout=5,
+                                      replay=Replay(self.filename, speed=None)))
+        self.assertEqual(recorded, replayed)
+        self.assertLess(time.time() - start, 0.4)
+
+    def test_replay_unknown(self):
+        '''
+        Test pyiosxr class IOSXR with replay of requests in another order and a request not recorded
+        Should answer requests by their content and raise ReplayError for the unknown one
+        '''
+        writer = RecordingWriter(self.filename, 'r1')
+        writer.add('<Lock/>', '<Response><Lock/></Response>', 1.0, 0.01)
+        writer.add('<CLI><Exec>show version</Exec></CLI>', '<Response>version</Response>', 2.0, 0.01)
+        writer.add('<Get/>', '<Response><Get/></Response>', 3.0, 0.01)
+        writer.close()
+
+        transport = ReplayTransport(Recording(self.filename), speed=None)
+        transport.sendline('<Get/>')
+        self.assertEqual(0, transport.expect_exact(['</Response>']))
+        self.assertEqual('<Response><Get/>', transport.before)
+        transport.sendline('<Lock/>')
+        transport.expect_exact(['</Response>'])
+        self.assertEqual('<Response><Lock/>', transport.before)
+        self.assertRaises(ReplayError, transport.sendline, '<Get/>')
+        self.assertRaises(ReplayError, transport.sendline, '<Unlock/>')
+        transport.close()
+
+    def test_not_closed(self):
+        '''
+        Test pyiosxr class Recording of a recording without index, as of a killed process
+        Should read the exchanges written completely
+        '''
+        writer = RecordingWriter(self.filename, 'r1')
+        writer.add('<Lock/>', '<Response><Lock/></Response>', 1.0, 0.01)
+        writer.add('<Get/>', '<Response><Get/></Response>', 2.0, 0.01)
+        writer.file.flush()
+        with open(self.filename, 'rb') as recorded, open(self.filename + '.cut', 'wb') as cut:
+            data = recorded.read()
+            cut.write(data[:-5])
+        self.assertEqual(['<Lock/>', '<Get/>'], [exchange.request for exchange in Recording(self.filename)])
+        self.assertEqual(['<Lock/>'], [exchange.request for exchange in Recording(self.filename + '.cut')])
+        writer.close()
+        self.assertEqual(2, len(Recording(self.filename)))
+
+
 if __name__ == '__main__':
     unittest.main()